@@ -55,13 +55,20 @@ def node_sac_file(quake, channel, datadir):
     return stream
 
 class NodeSacZips(SeismogramIterator):
+    """
+    Seismograms for nodes from the day long sac files in zip files named
+    by day in datadir.
+
+    check_availability -- skip nodes with no sac file in the zip files
+    for the day of the quake, from a listing of each day's zip files
+    """
     def __init__(self,
                  quake_itr,
                  station_itr,
                  datadir,
                  start_phases="origin", start_offset = 0,
                  end_phases="origin", end_offset=300,
-                 debug=False):
+                 debug=False, check_availability=False):
         self.__empty__ = None, None, None, []
         self.debug = debug
         self.query_params = {}
@@ -74,34 +81,91 @@ class NodeSacZips(SeismogramIterator):
         self.end_phases = end_phases
         self.end_offset = end_offset
         self.taup_model = TauPyModel(model="ak135")
+        self.check_availability = check_availability
+        self.__day_files__ = {}
     def next(self):
-        if self.curr_quake is None:
+        net, sta, quake = self.next_position()
+        if sta is None or quake is None:
+            return self.__empty__
+        return self.__load_seismograms__(net, sta, quake, self.query_params)
+    def prev(self):
+        net, sta, quake = self.prev_position()
+        if sta is None or quake is None:
             return self.__empty__
+        return self.__load_seismograms__(net, sta, quake, self.query_params)
+    def next_position(self):
+        net, sta, quake = self.__step_next__()
+        while sta is not None and not self.is_available(net, sta, quake):
+            net, sta, quake = self.__step_next__()
+        return net, sta, quake
+    def prev_position(self):
+        net, sta, quake = self.__step_prev__()
+        while sta is not None and not self.is_available(net, sta, quake):
+            net, sta, quake = self.__step_prev__()
+        return net, sta, quake
+    def __step_next__(self):
+        if self.curr_quake is None:
+            return None, None, None
         net, sta = self.station_itr.next()
         if sta is None:
             quake = self.quake_itr.next()
             if quake is None:
-                return self.__empty__
+                return None, None, None
             self.curr_quake = quake
             self.station_itr.beginning()
             net, sta = self.station_itr.next()
         if sta is None or self.curr_quake is None:
-            return self.__empty__
-        return self.__load_seismograms__(net, sta, self.curr_quake, self.query_params)
-    def prev(self):
+            return None, None, None
+        return net, sta, self.curr_quake
+    def __step_prev__(self):
         if self.curr_quake is None:
-            return self.__empty__
+            return None, None, None
         net, sta = self.station_itr.prev()
         if sta is None:
             self.curr_quake = self.quake_itr.prev()
             self.station_itr.ending()
             net, sta = self.station_itr.prev()
             if self.curr_quake is None:
-                return self.__empty__
+                return None, None, None
 
         if sta is None or self.curr_quake is None:
-            return self.__empty__
-        return self.__load_seismograms__(net, sta, self.curr_quake, self.query_params)
+            return None, None, None
+        return net, sta, self.curr_quake
+    def load_seismograms(self, net, sta, quake):
+        return self.__load_seismograms__(net, sta, quake, self.query_params)
+    def is_available(self, net, sta, quake):
+        if not self.check_availability:
+            return True
+        if quake.preferred_origin() is None:
+            return True
+        filenames = self.__files_for_day__(quake)
+        for c in sta.channels:
+            if c.sensor is None or c.sensor.serial_number is None:
+                # can't tell without a serial number, let the load decide
+                return True
+            suffix = f".{c.code[2]}.sac"
+            for filename in filenames:
+                if c.sensor.serial_number in filename and filename.endswith(suffix):
+                    return True
+        return False
+    def quake_iterator(self):
+        return self.quake_itr
+    def station_iterator(self):
+        return self.station_itr
+    def __files_for_day__(self, quake):
+        """
+        Names of the files in the zip files for the day of the quake,
+        listed once per day.
+        """
+        ymd = quake.preferred_origin().time.strftime("%Y%m%d")
+        filenames = self.__day_files__.get(ymd)
+        if filenames is None:
+            filenames = []
+            for zf in self.datadir.glob(f"{ymd}_M*.zip"):
+                with ZipFile(zf) as zip:
+                    filenames.extend(info.filename for info in zip.infolist())
+            self.__day_files__[ymd] = filenames
+        return filenames
     def __load_seismograms__(self, net, sta, quake, query_params={}):
         if len(sta.channels) == 0:
             return []
@@ -111,7 +175,7 @@ class NodeSacZips(SeismogramIterator):
         dist_deg = locations2degrees(sta.latitude, sta.longitude, origin.latitude, origin.longitude)
         s_time = origin.time + self.start_offset
         if self.start_phases != "origin":
-            arrivals = model.get_travel_times(source_depth_in_km=origin.depth/1000,
+            arrivals = self.taup_model.get_travel_times(source_depth_in_km=origin.depth/1000,
                                       distance_in_degree=dist_deg,
                                       phase_list=self.start_phases.split(","))
             if len(arrivals) == 0:
@@ -119,7 +183,7 @@ class NodeSacZips(SeismogramIterator):
             s_time = s_time + arrivals[0].time
         e_time = origin.time + self.end_offset
         if self.end_phases != "origin":
-            arrivals = model.get_travel_times(source_depth_in_km=origin.depth/1000,
+            arrivals = self.taup_model.get_travel_times(source_depth_in_km=origin.depth/1000,
                                       distance_in_degree=dist_deg,
                                       phase_list=self.end_phases.split(","))
             if len(arrivals) == 0:
@@ -130,6 +194,8 @@ class NodeSacZips(SeismogramIterator):
         waveforms = Stream()
         for c in sta.channels:
             waveforms += node_sac_file(quake, c, self.datadir)
+        # sac files are whole day, only keep the window around the quake
+        waveforms.trim(starttime=s_time, endtime=e_time)
         for tr in waveforms:
             if len(tr.stats.station) > 5:
                 # assume still serial
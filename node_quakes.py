@@ -72,7 +72,8 @@ seis_params = {
     "start_offset": -30,
     "end_offset": 120,
 }
-seis_itr = NodeSacZips(quake_itr, station_itr, "data")
+# skip nodes without a sac file for the day of the quake
+seis_itr = NodeSacZips(quake_itr, station_itr, "data", check_availability=True)
 pickax_config.finishFn=create_dosaveFn(quake_query_params=quake_itr,
                                        station_query_params=station_itr,
                                        seis_params=seis_itr,
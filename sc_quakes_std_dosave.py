@@ -9,18 +9,18 @@ from pickax import (
     StationXMLIterator,
     ThreeAtATime,
     CacheSeismogramIterator,
-    merge_picks_to_catalog,
+    PrefetchSeismogramIterator,
     merge_picks_to_quake,
-    extractEventId,
     QuakeMLFileIterator,
     QuakeIterator,
     CachedPicksQuakeItr,
-    SeismogramIterator
+    SeismogramIterator,
+    IndexedCatalog
     )
 from obspy import Catalog, read_events, Inventory
 
 
-def create_dosaveFn(quake_query_params, station_query_params, seis_params, config=None, picks_file="picks_sc_quakes.qml"):
+def create_dosaveFn(quake_query_params, station_query_params, seis_params, config=None, picks_file="picks_sc_quakes.qml", prefetch=0):
     if config is None:
         config = PickAxConfig()
     # Load stations, events and seismograms
@@ -58,6 +58,9 @@ def create_dosaveFn(quake_query_params, station_query_params, seis_params, confi
             print(f"Set sta_itr from seis_itr: {sta_itr}")
     else:
         seis_itr = FDSNSeismogramIterator(quake_itr, sta_itr, debug=config.debug, **seis_params)
+        if prefetch > 0:
+            # load the next few stations in the background while picking
+            seis_itr = PrefetchSeismogramIterator(seis_itr, lookahead=prefetch)
     # use ThreeAtATime to separate by band/inst code, ie seismometer then strong motion
     # at each station that has both
     seis_itr = ThreeAtATime(seis_itr)
@@ -72,8 +75,14 @@ def create_dosaveFn(quake_query_params, station_query_params, seis_params, confi
     except AttributeError:
         print("catch AttributeError")
         print(f"Networks: -, Stations: -")
-    print(f"Load earthquakes...")
-    print(f"Number of quakes: {len(quake_itr.quakes)}")
+    if isinstance(quake_itr, FDSNQuakeIterator):
+        # quakes are requested as picking reaches them, counting them up
+        # front would be one more request before the first seismogram
+        print(f"Earthquakes requested in {len(quake_itr.windows)} time windows as needed")
+    elif quake_itr is not None:
+        print(f"Load earthquakes...")
+        all_quakes = quake_itr.all()
+        print(f"Number of quakes: {len(all_quakes) if all_quakes is not None else '-'}")
 
     # helper function, perhaps to preprocess the stream before picking
     def preprocess(stream, inv):
@@ -93,11 +102,22 @@ def create_dosaveFn(quake_query_params, station_query_params, seis_params, confi
                     tr.stats[PREPROC_KEY] = True
                     break
 
+    # saved picks, read from picks_file once and kept up to date as quakes are
+    # saved, so each save does not parse the file again
+    session_catalog = None
+    def load_saved_catalog():
+        nonlocal session_catalog
+        if session_catalog is None:
+            catalog = Catalog()
+            if os.path.exists(f'{picks_file}'):
+                catalog = read_events(picks_file)
+            session_catalog = IndexedCatalog(catalog)
+        return session_catalog
+
     # function called on quit, next or prev, allows saving of picks however you wish
     # here we save the quake as QuakeML, which will include the picks, and then
     # load the next seismogram if possible
     def dosave(qmlevent, stream, command, pickax):
-        saved_catalog = None
         # set overall inventory if not already set
         if pickax.inventory is None:
             try:
@@ -108,20 +128,11 @@ def create_dosaveFn(quake_query_params, station_query_params, seis_params, confi
         # first time through qmlevent will be None and stream will be empty
         if qmlevent is not None and len(stream) != 0:
             # save new picks to picks_file
-            saved_catalog = Catalog()
-            if os.path.exists(f'{picks_file}'):
-                saved_catalog = read_events(picks_file)
-            same_quake = None
-            id = extractEventId(qmlevent)
-            for q in saved_catalog:
-                if extractEventId(q) == id:
-                    same_quake = q
-                    break
-            if same_quake is not None:
-                # quake is also in saved file, replace with current version of event
-                saved_catalog.events.remove(same_quake)
-            merge_picks_to_catalog(qmlevent, saved_catalog)
-            saved_catalog.write(picks_file, format='QUAKEML')
+            saved_catalog = load_saved_catalog()
+            # if quake is also in saved file, replace with current version of event
+            saved_catalog.remove(saved_catalog.event_id(qmlevent))
+            saved_catalog.merge(qmlevent)
+            saved_catalog.catalog.write(picks_file, format='QUAKEML')
             #saved_catalog.write("hypodd.pha", format='HYPODDPHA')
 
         seis = [] # force while to run
@@ -161,14 +172,9 @@ def create_dosaveFn(quake_query_params, station_query_params, seis_params, confi
 
             # check to see if any old saved quakes from same event
 
-            if saved_catalog is None:
-                saved_catalog = Catalog()
-                if os.path.exists(f'{picks_file}'):
-                    saved_catalog = read_events(picks_file)
-            id = extractEventId(quake)
-            for oldquake in saved_catalog:
-                if extractEventId(oldquake) == id:
-                    merge_picks_to_quake(oldquake, quake)
+            saved_catalog = load_saved_catalog()
+            for oldquake in saved_catalog.find_all(saved_catalog.event_id(quake)):
+                merge_picks_to_quake(oldquake, quake)
 
             all_chan = ",".join(list(map(lambda tr: tr.stats.channel, seis)))
             print(f"{len(seis)} {net.code}_{sta.code} {all_chan} {quake.preferred_origin().time}")
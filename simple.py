@@ -1,7 +1,7 @@
 import os
 import sys
 from obspy import Catalog
-from pickax import PickAxConfig, merge_picks_to_catalog
+from pickax import PickAxConfig, merge_picks_to_catalog, IndexedCatalog
 import requests
 from pathlib import Path
 
@@ -124,8 +124,9 @@ def pick_station(station_code, qmlevent_file):
         print(f'file {saved_pick_file} does not seem to exist, skipping load picks.')
     else:
         saved_catalog = obspy.read_events(saved_pick_file)
+        indexed_catalog = IndexedCatalog(catalog)
         for oldquake in saved_catalog:
-            merge_picks_to_catalog(oldquake, catalog, author=creation_info.author)
+            merge_picks_to_catalog(oldquake, indexed_catalog, author=creation_info.author)
 
     pickax = PickAx(qmlevent=qmlevent,
                     config=pickax_config ,
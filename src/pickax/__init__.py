@@ -5,7 +5,25 @@ from .pick_util import (
     extractEventId,
     merge_picks_to_catalog,
     merge_picks_to_quake,
+    MergeResult,
+    IndexedCatalog,
     inventory_for_catalog_picks,
+    EventIndex,
+    event_index,
+    )
+from .client_pool import (
+    get_client,
+    http_session,
+    configure_pool,
+    client_stats,
+    reset_client_stats,
+    configure_http_cache,
+    )
+from .http_cache import HttpResponseCache
+from .snapshot import (
+    configure_snapshots,
+    read_events_snapshot,
+    read_inventory_snapshot,
     )
 from .pickax import PickAx
 from .pickax_config import (
@@ -22,20 +40,27 @@ from .quake_iterator import (
     QuakeMLFileIterator,
     CachedPicksQuakeItr
     )
+from .quake_summary import QuakeSummary
 from .station_iterator import (
     StationIterator,
     StationXMLIterator,
     FDSNStationIterator,
     StationXMLFileIterator,
-    StationXMLDirectoryIterator
+    StationXMLDirectoryIterator,
+    DistanceStationIterator
     )
+from .station_table import StationTable, StationSpatialIndex
 from .seismogram_iterator import (
     SeismogramIterator,
     FDSNSeismogramIterator,
     ThreeAtATime,
     CacheSeismogramIterator,
+    PrefetchSeismogramIterator,
+    DiskCacheSeismogramIterator,
+    AsyncSeismogramIterator,
     MDLSeismogramIterator
     )
+from .waveform_cache import WaveformDiskCache
 from .hypoinverse import format_hypoinverse
 from .eqtransform import read_eqt_csv
 from .traveltime import TravelTimeCalc
@@ -54,19 +79,41 @@ __all__ = [
     "reloadQuakeMLWithPicks",
     "merge_picks_to_catalog",
     "merge_picks_to_quake",
+    "MergeResult",
+    "IndexedCatalog",
     "extractEventId",
     "inventory_for_catalog_picks",
+    "EventIndex",
+    "event_index",
+    "get_client",
+    "http_session",
+    "configure_pool",
+    "client_stats",
+    "reset_client_stats",
+    "configure_http_cache",
+    "HttpResponseCache",
+    "configure_snapshots",
+    "read_events_snapshot",
+    "read_inventory_snapshot",
     "QuakeIterator",
     "QuakeMLFileIterator",
     "CachedPicksQuakeItr",
     "FDSNQuakeIterator",
+    "QuakeSummary",
     "StationIterator",
     "FDSNStationIterator",
+    "StationTable",
+    "StationSpatialIndex",
+    "DistanceStationIterator",
     "format_hypoinverse",
     "SeismogramIterator",
     "FDSNSeismogramIterator",
     "ThreeAtATime",
     "CacheSeismogramIterator",
+    "PrefetchSeismogramIterator",
+    "DiskCacheSeismogramIterator",
+    "AsyncSeismogramIterator",
+    "WaveformDiskCache",
     "TravelTimeCalc",
     "read_eqt_csv",
     "version",
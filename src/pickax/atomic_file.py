@@ -0,0 +1,35 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def atomic_write(path, write, binary=False):
+    """
+    Writes the file by calling write with an open temporary file next to
+    it, then moving that into place, so readers, including other
+    processes, never see a partly written file. On an error the temporary
+    file is removed and the error raised.
+
+    path -- file to write
+    write -- function of the open temporary file that writes the contents
+    binary -- open the temporary file in binary mode
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb" if binary else "w") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+def write_json(path, obj):
+    """
+    Saves obj as json in the file, atomically.
+    """
+    atomic_write(path, lambda f: json.dump(obj, f))
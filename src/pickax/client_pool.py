@@ -0,0 +1,180 @@
+import io
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
+from obspy.clients.fdsn import Client
+from obspy.clients.fdsn.client import raise_on_error
+
+from .http_cache import HttpResponseCache, DEFAULT_TTL
+from .http_cache import DEFAULT_MAX_BYTES as DEFAULT_CACHE_BYTES
+
+DEFAULT_MAX_CONNECTIONS = 10
+
+_lock = threading.Lock()
+_session = None
+_max_connections = DEFAULT_MAX_CONNECTIONS
+_clients = {}
+_stats = {}
+_http_cache = None
+
+
+class PooledClient(Client):
+    """
+    FDSN web service client that sends all requests through the shared,
+    keep-alive http session instead of opening a new connection each time.
+    Create with get_client() rather than directly so clients are reused.
+    """
+    def _set_opener(self, user, password):
+        super()._set_opener(user, password)
+        self._auth = None
+        if user is not None and password is not None:
+            self._auth = HTTPDigestAuth(user, password)
+
+    def _download(self, url, return_string=False, data=None, use_gzip=None,
+                  content_type=None):
+        if use_gzip is None:
+            use_gzip = self.use_gzip
+        headers = self.request_headers.copy()
+        if content_type:
+            headers['Content-Type'] = content_type
+        if not use_gzip:
+            headers['Accept-Encoding'] = 'identity'
+        if self.debug:
+            print(f"Downloading {url}")
+        try:
+            if data is None and self._auth is None and _http_cache is not None \
+                    and "/fdsnws/event/" in url:
+                # event queries are cached, revalidated when older than the
+                # ttl, cached_get counts the requests that reach the network
+                resp = cached_get(url, headers=headers, timeout=self.timeout)
+            else:
+                if data is None:
+                    resp = http_session().get(url, headers=headers,
+                                              timeout=self.timeout, auth=self._auth)
+                else:
+                    resp = http_session().post(url, headers=headers, data=data,
+                                               timeout=self.timeout, auth=self._auth)
+                record_request(url, len(resp.content))
+            code = resp.status_code
+            body = resp.content
+        except requests.exceptions.RequestException as e:
+            if self.debug:
+                print(f"Error while downloading: {url}")
+            code = None
+            body = e
+        else:
+            if self.debug:
+                print(f"Downloaded {url} with HTTP code: {code}")
+        raise_on_error(code, io.BytesIO(body) if code is not None else body)
+        if return_string:
+            return body
+        return io.BytesIO(body)
+
+
+def http_session():
+    """
+    Process-wide requests session, with a connection pool per host so
+    connections, and their TLS setup, are reused between requests.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=_max_connections,
+                                  pool_maxsize=_max_connections)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def configure_pool(max_connections=DEFAULT_MAX_CONNECTIONS):
+    """
+    Sets the max number of keep-alive connections kept open to each host.
+    The existing session is closed, later requests use the new pool.
+    """
+    global _session, _max_connections
+    with _lock:
+        _max_connections = max_connections
+        old_session = _session
+        _session = None
+    if old_session is not None:
+        old_session.close()
+
+def get_client(dc_name="IRIS", debug=False, timeout=120):
+    """
+    Shared FDSN client for the data center, created on first use. All
+    clients send their requests through the same pooled http session.
+    """
+    key = (dc_name, debug, timeout)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = PooledClient(dc_name, _discover_services=False,
+                                  debug=debug, timeout=timeout)
+            _clients[key] = client
+        return client
+
+def record_request(url, num_bytes):
+    """
+    Counts a request and the bytes received for the host in the url.
+    """
+    host = urlparse(url).netloc
+    with _lock:
+        if host not in _stats:
+            _stats[host] = {"requests": 0, "bytes": 0}
+        _stats[host]["requests"] += 1
+        _stats[host]["bytes"] += num_bytes
+
+def client_stats():
+    """
+    Request and byte counts per host since start or the last reset,
+    plus a "total" entry.
+    """
+    with _lock:
+        stats = {host: dict(counts) for host, counts in _stats.items()}
+    stats["total"] = {
+        "requests": sum(c["requests"] for c in stats.values()),
+        "bytes": sum(c["bytes"] for c in stats.values()),
+    }
+    return stats
+
+def reset_client_stats():
+    with _lock:
+        _stats.clear()
+
+def configure_http_cache(cache_dir=None, max_bytes=DEFAULT_CACHE_BYTES, ttl=DEFAULT_TTL, offline=False):
+    """
+    Keeps event web service and Comcat responses in cache_dir, so repeat
+    runs over a catalog reuse them. With offline, requests are answered
+    only from the cache. A cache_dir of None turns the cache off.
+    """
+    global _http_cache
+    cache = None
+    if cache_dir is not None:
+        cache = HttpResponseCache(cache_dir, max_bytes=max_bytes, ttl=ttl, offline=offline)
+    with _lock:
+        _http_cache = cache
+    return cache
+
+def http_cache():
+    """
+    The response cache set by configure_http_cache(), or None.
+    """
+    return _http_cache
+
+def cached_get(url, params=None, headers=None, ttl=None, timeout=120):
+    """
+    GET through the response cache if one is configured, otherwise
+    directly with the pooled session.
+    """
+    cache = _http_cache
+    if cache is None:
+        resp = http_session().get(url, params=params, headers=headers, timeout=timeout)
+        record_request(url, len(resp.content))
+        return resp
+    resp = cache.get(http_session(), url, params=params, headers=headers, ttl=ttl, timeout=timeout)
+    if not resp.from_cache:
+        record_request(url, len(resp.content))
+    return resp
@@ -0,0 +1,168 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks on windows, processes sharing a cache
+    # directory may then lose some of each other's index updates
+    fcntl = None
+
+from .atomic_file import write_json
+
+INDEX_FILENAME = "index.json"
+INDEX_LOCK_FILENAME = "index.lock"
+INDEX_VERSION = 2
+
+
+@contextmanager
+def _locked(lock_path):
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class LRUDiskCache:
+    """
+    Directory of cached files with a json index of their sizes and last
+    use times. Once the total size goes over max_bytes, the least recently
+    used entries are deleted. Several processes can share the directory,
+    each save merges with the index on disk under a file lock, so entries
+    added or used by the others are not lost. Subclasses store and read
+    the files, and give the paths of an entry with files_for(key).
+
+    cache_dir -- directory to hold the files and index
+    max_bytes -- size budget for all cached files
+    """
+    cache_name = "cache"
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index_file = self.cache_dir / INDEX_FILENAME
+        self.lock_file = self.cache_dir / INDEX_LOCK_FILENAME
+        self.__lock__ = threading.Lock()
+        self.__entries__ = OrderedDict()
+        self.__used__ = {}
+        self.__removed__ = set()
+        self.total_bytes = 0
+        self.__load_index__()
+    def files_for(self, key):
+        """
+        Paths of the files holding the entry for the key.
+        """
+        return []
+    def flush(self):
+        """
+        Writes the index, saving the least recently used order.
+        """
+        with self.__lock__:
+            self.__save_index__()
+    def clear(self):
+        with self.__lock__:
+            with _locked(self.lock_file):
+                self.__merge_index__()
+                for key in list(self.__entries__.keys()):
+                    self.__remove_entry__(key)
+                self.__write_index__()
+    def __len__(self):
+        return len(self.__entries__)
+    def __add_entry__(self, key, size, used=None):
+        self.__entries__[key] = size
+        self.__used__[key] = used if used is not None else time.time()
+        self.total_bytes += size
+    def __touch__(self, key):
+        self.__entries__.move_to_end(key)
+        self.__used__[key] = time.time()
+    def __remove_entry__(self, key, delete=True):
+        self.total_bytes -= self.__entries__.pop(key, 0)
+        self.__used__.pop(key, None)
+        if delete:
+            self.__removed__.add(key)
+            for path in self.files_for(key):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+    def __replace_entry__(self, key, size):
+        """
+        Records a newly saved entry, evicting least recently used entries
+        if over the size budget, and saves the index.
+        """
+        if key in self.__entries__:
+            self.__remove_entry__(key, delete=False)
+        self.__add_entry__(key, size)
+        self.__removed__.discard(key)
+        self.__save_index__()
+    def __evict__(self):
+        while self.total_bytes > self.max_bytes and len(self.__entries__) > 1:
+            key = next(iter(self.__entries__))
+            self.__remove_entry__(key)
+    def __read_index__(self):
+        """
+        Entries in the index file as (key, size, last used), oldest use
+        first, empty if missing or unreadable.
+        """
+        if not self.index_file.exists():
+            return []
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARN: unable to read {self.cache_name} index, starting empty: {e}")
+            return []
+        if index.get("version") != INDEX_VERSION:
+            return []
+        return index["entries"]
+    def __merge_index__(self):
+        """
+        Combines the entries in the index file, as saved by every process
+        sharing the directory, with the ones used or removed here. Called
+        with the index file locked.
+        """
+        merged = {}
+        for key, size, used in self.__read_index__():
+            if key not in self.__removed__:
+                merged[key] = (size, used)
+        for key, size in self.__entries__.items():
+            used = self.__used__.get(key, 0)
+            if key in merged:
+                used = max(used, merged[key][1])
+            elif not all(path.exists() for path in self.files_for(key)):
+                # evicted by another process
+                continue
+            merged[key] = (size, used)
+        self.__entries__ = OrderedDict()
+        self.__used__ = {}
+        self.__removed__ = set()
+        self.total_bytes = 0
+        for key, (size, used) in sorted(merged.items(), key=lambda item: item[1][1]):
+            self.__add_entry__(key, size, used)
+    def __load_index__(self):
+        with _locked(self.lock_file):
+            self.__merge_index__()
+            if self.total_bytes > self.max_bytes:
+                self.__evict__()
+                self.__write_index__()
+    def __save_index__(self):
+        with _locked(self.lock_file):
+            self.__merge_index__()
+            self.__evict__()
+            self.__write_index__()
+    def __write_index__(self):
+        write_json(self.index_file, {
+            "version": INDEX_VERSION,
+            "updated": time.time(),
+            "entries": [(key, size, self.__used__[key]) for key, size in self.__entries__.items()],
+        })
+        self.__removed__ = set()
@@ -2,6 +2,8 @@ import sys
 import getopt
 import math
 
+import numpy as np
+
 class DistAz:
     """c
     c Subroutine to calculate the Great Circle Arc distance
@@ -160,6 +162,70 @@ class DistAz:
     def kilometersToDegrees(kilometers):
         return kilometers / 111.19
 
+def distaz_arrays(lat1, lon1, lat2, lon2):
+    """
+    Same as DistAz, but for numpy arrays of points, for example all the
+    stations in an inventory against one quake. Arguments broadcast, so
+    lat2 and lon2 may be single values. Returns arrays of delta in degrees,
+    az and baz.
+    """
+    lat1 = np.asarray(lat1, dtype=float)
+    lon1 = np.asarray(lon1, dtype=float)
+    lat2 = np.asarray(lat2, dtype=float)
+    lon2 = np.asarray(lon2, dtype=float)
+    rad = 2.*math.pi/360.0
+    sph = 1.0/298.257
+    scolat = math.pi/2.0 - np.arctan((1.-sph)*(1.-sph)*np.tan(lat1*rad))
+    ecolat = math.pi/2.0 - np.arctan((1.-sph)*(1.-sph)*np.tan(lat2*rad))
+    slon = lon1*rad
+    elon = lon2*rad
+    a = np.sin(scolat)*np.cos(slon)
+    b = np.sin(scolat)*np.sin(slon)
+    c = np.cos(scolat)
+    d = np.sin(slon)
+    e = -np.cos(slon)
+    g = -c*e
+    h = c*d
+    k = -np.sin(scolat)
+    aa = np.sin(ecolat)*np.cos(elon)
+    bb = np.sin(ecolat)*np.sin(elon)
+    cc = np.cos(ecolat)
+    dd = np.sin(elon)
+    ee = -np.cos(elon)
+    gg = -cc*ee
+    hh = cc*dd
+    kk = -np.sin(ecolat)
+    delta = np.arccos(np.clip(a*aa + b*bb + c*cc, -1.0, 1.0))/rad
+    rhs1 = (aa-d)*(aa-d)+(bb-e)*(bb-e)+cc*cc - 2.
+    rhs2 = (aa-g)*(aa-g)+(bb-h)*(bb-h)+(cc-k)*(cc-k) - 2.
+    baz = np.mod(np.arctan2(rhs1, rhs2), 2*math.pi)/rad
+    rhs1 = (a-dd)*(a-dd)+(b-ee)*(b-ee)+c*c - 2.
+    rhs2 = (a-gg)*(a-gg)+(b-hh)*(b-hh)+(c-kk)*(c-kk) - 2.
+    az = np.mod(np.arctan2(rhs1, rhs2), 2*math.pi)/rad
+    baz = np.where(np.abs(baz-360.) < .00001, 0.0, baz)
+    az = np.where(np.abs(az-360.) < .00001, 0.0, az)
+    same = (lat1 == lat2) & (lon1 == lon2)
+    delta = np.where(same, 0.0, delta)
+    az = np.where(same, 0.0, az)
+    baz = np.where(same, 0.0, baz)
+    return delta, az, baz
+
+def unit_vectors(lat, lon):
+    """
+    Unit vectors, shape (n, 3), for points on the earth using the same
+    geocentric colatitude as DistAz, so the angle between two vectors is
+    the DistAz delta.
+    """
+    rad = 2.*math.pi/360.0
+    sph = 1.0/298.257
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    colat = math.pi/2.0 - np.arctan((1.-sph)*(1.-sph)*np.tan(lat*rad))
+    lon = lon*rad
+    return np.column_stack((np.sin(colat)*np.cos(lon),
+                            np.sin(colat)*np.sin(lon),
+                            np.cos(colat)))
+
 #distaz = DistAz(0, 0, 1,1)
 #print "%f  %f  %f" % (distaz.getDelta(), distaz.getAz(), distaz.getBaz())
 
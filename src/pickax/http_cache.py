@@ -0,0 +1,167 @@
+import hashlib
+import json
+import time
+from email.utils import formatdate
+from urllib.parse import urlencode
+
+import requests
+
+from .atomic_file import atomic_write, write_json
+from .disk_cache import LRUDiskCache
+
+DEFAULT_MAX_BYTES = 512*1024*1024
+DEFAULT_TTL = 3600
+# ttl for responses that never change, like versioned Comcat product files
+IMMUTABLE_TTL = -1
+
+
+class OfflineCacheMiss(requests.exceptions.ConnectionError):
+    """
+    Raised in offline mode for a request that is not in the cache.
+    """
+    pass
+
+
+class CachedResponse:
+    """
+    Response body and headers, either from the network or from the cache,
+    with the parts of a requests Response that callers here use.
+    """
+    def __init__(self, url, status_code, content, headers, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+    def json(self):
+        return json.loads(self.content)
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} for url: {self.url}", response=self)
+
+
+def response_cache_key(url, params=None):
+    """
+    Cache key for a GET request, from the url and query parameters.
+    """
+    if params:
+        sep = "&" if "?" in url else "?"
+        url = f"{url}{sep}{urlencode(sorted(params.items()))}"
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+class HttpResponseCache(LRUDiskCache):
+    """
+    Directory of http GET response bodies, keyed by url and query
+    parameters, with a json index of sizes in least recently used order.
+    A cached response younger than its ttl is used as is, an older one is
+    revalidated with If-None-Match or If-Modified-Since so an unchanged
+    document costs only a 304. In offline mode only the cache is used.
+    Once the total size goes over max_bytes, the least recently used
+    responses are deleted.
+
+    cache_dir -- directory to hold the responses and index
+    max_bytes -- size budget for all cached responses
+    ttl -- seconds a response is used without revalidation, IMMUTABLE_TTL for never
+    offline -- never use the network, fail on anything not cached
+    """
+    cache_name = "http cache"
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, offline=False):
+        self.ttl = ttl
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        super().__init__(cache_dir, max_bytes)
+    def body_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.body"
+    def meta_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+    def files_for(self, key):
+        return [self.body_path(key), self.meta_path(key)]
+    def get(self, session, url, params=None, headers=None, ttl=None, timeout=120):
+        """
+        GET the url with the session, unless a fresh copy is cached.
+        """
+        key = response_cache_key(url, params)
+        if ttl is None:
+            ttl = self.ttl
+        meta, content = self.__read__(key)
+        if content is not None:
+            age = time.time() - meta["fetched"]
+            if self.offline or ttl == IMMUTABLE_TTL or age < ttl:
+                self.hits += 1
+                return CachedResponse(meta["url"], 200, content, meta["headers"], from_cache=True)
+        if self.offline:
+            raise OfflineCacheMiss(f"not in cache and offline: {url}")
+        req_headers = dict(headers) if headers is not None else {}
+        if content is not None:
+            if meta.get("etag") is not None:
+                req_headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified") is not None:
+                req_headers["If-Modified-Since"] = meta["last_modified"]
+            else:
+                req_headers["If-Modified-Since"] = formatdate(meta["fetched"], usegmt=True)
+        resp = session.get(url, params=params, headers=req_headers, timeout=timeout)
+        if resp.status_code == 304 and content is not None:
+            self.revalidated += 1
+            meta["fetched"] = time.time()
+            self.__write_meta__(key, meta)
+            return CachedResponse(meta["url"], 200, content, meta["headers"], from_cache=True)
+        self.misses += 1
+        if resp.status_code == 200:
+            self.put(key, resp)
+        return CachedResponse(resp.url, resp.status_code, resp.content, dict(resp.headers))
+    def put(self, key, resp):
+        """
+        Saves the body and validators of the response, evicting least
+        recently used responses if over the size budget.
+        """
+        meta = {
+            "url": resp.url,
+            "fetched": time.time(),
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "headers": {k: v for k, v in resp.headers.items()
+                        if k.lower() in ("content-type", "etag", "last-modified")},
+        }
+        with self.__lock__:
+            body_path = self.body_path(key)
+            body_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                atomic_write(body_path, lambda f: f.write(resp.content), binary=True)
+                self.__write_meta__(key, meta)
+            except OSError as e:
+                print(f"WARN: unable to cache response: {e}")
+                return
+            self.__replace_entry__(key, len(resp.content))
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "entries": len(self.__entries__),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+    def __read__(self, key):
+        with self.__lock__:
+            try:
+                with open(self.meta_path(key)) as f:
+                    meta = json.load(f)
+                with open(self.body_path(key), "rb") as f:
+                    content = f.read()
+            except (OSError, ValueError):
+                if key in self.__entries__:
+                    self.__remove_entry__(key)
+                return None, None
+            if key not in self.__entries__:
+                # written by another process
+                self.__add_entry__(key, len(content))
+            self.__touch__(key)
+            return meta, content
+    def __write_meta__(self, key, meta):
+        write_json(self.meta_path(key), meta)
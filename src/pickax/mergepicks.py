@@ -1,4 +1,4 @@
-from .pick_util import merge_picks_to_catalog
+from .pick_util import IndexedCatalog, MergeResult
 import argparse
 from obspy import Catalog, read_events
 import os
@@ -43,10 +43,14 @@ def main():
             print(f"File {args.to} does not seem to exist, create empty...")
             catalog = Catalog()
 
+        indexed = IndexedCatalog(catalog)
         for idx, qmlfile in enumerate(args.fromfiles):
             in_catalog = read_events(Path(qmlfile))
+            result = MergeResult()
             for in_quake in in_catalog:
-                merge_picks_to_catalog(in_quake, catalog, author=args.author)
+                result += indexed.merge(in_quake, author=args.author)
+            if args.verbose:
+                print(f"{qmlfile}: {result}")
         if catalog_file.exists():
             saved_file = catalog_file.parent / (args.to+".save")
             os.rename(catalog_file, saved_file)
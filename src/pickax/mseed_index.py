@@ -0,0 +1,291 @@
+import calendar
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from obspy import Stream
+from obspy.core.stream import read as obspyread
+
+from .atomic_file import write_json
+
+MDL_INDEX_VERSION = 1
+RECORD_INDEX_CACHE_SIZE = 256
+MSEED2_HEADER_SIZE = 48
+
+# NET.STA.LOC.CHAN__20230101T000000Z__20230101T001000Z.mseed as saved by
+# the obspy mass downloader
+mdl_filename_pat = re.compile(r'^([^.]*)\.([^.]*)\.([^.]*)\.([^.]*)__(\d{8}T\d{6}Z)__(\d{8}T\d{6}Z)\.mseed$')
+
+def parse_mdl_filename(filename):
+    """
+    Parses a mass downloader file name into net, sta, loc, chan, start and
+    end, with times as timestamps, or None if the name does not match.
+    """
+    m = mdl_filename_pat.match(filename)
+    if m is None:
+        return None
+    start = datetime.strptime(m.group(5), "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).timestamp()
+    end = datetime.strptime(m.group(6), "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).timestamp()
+    return m.group(1), m.group(2), m.group(3), m.group(4), start, end
+
+
+class MSeedDirectoryIndex:
+    """
+    Index of a mass downloader waveform directory, from net and station
+    code to file names and time ranges, built with a single scan of the
+    directory. When the directory modification time changes, it is
+    rescanned and only new or removed files update the index. If
+    index_file is given, the index is saved there so later sessions
+    skip the scan when the directory is unchanged.
+
+    mseed_dir -- directory of miniseed files
+    index_file -- optional json file to save the index in
+    """
+    def __init__(self, mseed_dir, index_file=None):
+        self.mseed_dir = Path(mseed_dir)
+        self.index_file = Path(index_file) if index_file is not None else None
+        self.__by_station__ = {}
+        self.__by_name__ = {}
+        self.__mtime__ = None
+        if self.index_file is not None:
+            self.__load__()
+        self.refresh()
+    def refresh(self):
+        """
+        Rescans the directory if it has changed since the last scan.
+        Returns True if it was rescanned.
+        """
+        mtime = os.stat(self.mseed_dir).st_mtime_ns
+        if mtime == self.__mtime__:
+            return False
+        found = set()
+        with os.scandir(self.mseed_dir) as dir_itr:
+            for entry in dir_itr:
+                found.add(entry.name)
+                if entry.name not in self.__by_name__:
+                    parsed = parse_mdl_filename(entry.name)
+                    if parsed is not None:
+                        self.__add_file__(entry.name, parsed)
+        for name in set(self.__by_name__.keys()) - found:
+            self.__remove_file__(name)
+        self.__mtime__ = mtime
+        if self.index_file is not None:
+            self.__save__()
+        return True
+    def files_for(self, net_code, sta_code, start=None, end=None):
+        """
+        Files for the station, optionally only those overlapping the start
+        and end times.
+        """
+        self.refresh()
+        files = []
+        for name in self.__by_station__.get((net_code, sta_code), []):
+            f_start, f_end = self.__by_name__[name][4:6]
+            if start is not None and f_end < start.timestamp:
+                continue
+            if end is not None and f_start > end.timestamp:
+                continue
+            files.append(self.mseed_dir / name)
+        return files
+    def stations(self):
+        """
+        Set of (net, sta) codes with at least one file.
+        """
+        self.refresh()
+        return set(self.__by_station__.keys())
+    def __len__(self):
+        return len(self.__by_name__)
+    def __add_file__(self, name, parsed):
+        self.__by_name__[name] = parsed
+        key = (parsed[0], parsed[1])
+        if key not in self.__by_station__:
+            self.__by_station__[key] = []
+        self.__by_station__[key].append(name)
+    def __remove_file__(self, name):
+        parsed = self.__by_name__.pop(name)
+        key = (parsed[0], parsed[1])
+        self.__by_station__[key].remove(name)
+        if len(self.__by_station__[key]) == 0:
+            del self.__by_station__[key]
+    def __load__(self):
+        if not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARN: unable to read index {self.index_file}, rescanning: {e}")
+            return
+        if index.get("version") != MDL_INDEX_VERSION \
+                or index.get("dir") != str(self.mseed_dir.resolve()):
+            return
+        for name, parsed in index["files"].items():
+            self.__add_file__(name, tuple(parsed))
+        self.__mtime__ = index["mtime"]
+    def __save__(self):
+        index = {
+            "version": MDL_INDEX_VERSION,
+            "dir": str(self.mseed_dir.resolve()),
+            "mtime": self.__mtime__,
+            "files": self.__by_name__,
+        }
+        write_json(self.index_file, index)
+
+
+def unpack_record_times(buf, offset):
+    """
+    Start and end time, as timestamps, and the record length of the
+    miniseed2 record at offset, read from the fixed header and
+    blockette 1000.
+    """
+    year_bytes = buf[offset+20:offset+22]
+    endian = ">"
+    if not 1900 <= struct.unpack(">H", year_bytes)[0] <= 2100:
+        endian = "<"
+        if not 1900 <= struct.unpack("<H", year_bytes)[0] <= 2100:
+            raise ValueError(f"not a miniseed2 record at offset {offset}")
+    (year, yday, hour, minute, sec, fract, num_samples, rate_factor, rate_mult,
+     act_flags, num_blockettes, time_corr, blockette_offset) = \
+        struct.unpack_from(endian+"HHBBBxHHhhBxxBixxH", buf, offset+20)
+    start = calendar.timegm((year, 1, 1, hour, minute, sec)) + (yday-1)*86400 + fract/10000
+    if time_corr != 0 and not act_flags & 0x02:
+        start += time_corr/10000
+    sample_rate = 0
+    if rate_factor > 0 and rate_mult > 0:
+        sample_rate = rate_factor*rate_mult
+    elif rate_factor > 0 and rate_mult < 0:
+        sample_rate = -1*rate_factor/rate_mult
+    elif rate_factor < 0 and rate_mult > 0:
+        sample_rate = -1*rate_mult/rate_factor
+    elif rate_factor < 0 and rate_mult < 0:
+        sample_rate = 1/(rate_factor*rate_mult)
+    end = start
+    if sample_rate > 0 and num_samples > 0:
+        end = start + (num_samples-1)/sample_rate
+    reclen = None
+    b_offset = blockette_offset
+    for i in range(num_blockettes):
+        if b_offset == 0:
+            break
+        b_type, b_next = struct.unpack_from(endian+"HH", buf, offset+b_offset)
+        if b_type == 1000:
+            reclen = 2**buf[offset+b_offset+6]
+            break
+        b_offset = b_next
+    if reclen is None:
+        raise ValueError(f"no blockette 1000 for record length at offset {offset}")
+    return start, end, reclen
+
+
+class MSeedRecordIndex:
+    """
+    Offset, length, start and end time of every record in a miniseed2
+    file, built once from the record headers without decoding any data.
+    Reading a time window then decodes only the records that overlap it,
+    memory mapping the file instead of reading all of it.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        stat = self.path.stat()
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        records = []
+        max_duration = 0
+        if self.size > 0:
+            with open(self.path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    offset = 0
+                    while offset + MSEED2_HEADER_SIZE <= self.size:
+                        start, end, reclen = unpack_record_times(mm, offset)
+                        records.append((start, end, offset, reclen))
+                        max_duration = max(max_duration, end-start)
+                        offset += reclen
+        records.sort()
+        self.records = records
+        self.starts = [r[0] for r in records]
+        self.max_duration = max_duration
+    def is_current(self):
+        """
+        True if the file is unchanged since the index was built.
+        """
+        stat = self.path.stat()
+        return stat.st_mtime_ns == self.mtime and stat.st_size == self.size
+    def byte_ranges(self, start=None, end=None):
+        """
+        Merged (offset, length) ranges of records overlapping the window,
+        in file order.
+        """
+        lo = 0
+        hi = len(self.records)
+        if start is not None:
+            lo = bisect_left(self.starts, start.timestamp - self.max_duration)
+        if end is not None:
+            hi = bisect_right(self.starts, end.timestamp)
+        selected = sorted((r[2], r[3]) for r in self.records[lo:hi]
+                          if start is None or r[1] >= start.timestamp)
+        ranges = []
+        for offset, length in selected:
+            if len(ranges) > 0 and ranges[-1][0] + ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            else:
+                ranges.append((offset, length))
+        return ranges
+    def read(self, start=None, end=None):
+        """
+        Reads the waveforms overlapping the window, trimmed to it.
+        """
+        ranges = self.byte_ranges(start, end)
+        if len(ranges) == 0:
+            return Stream()
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                data = b"".join(mm[offset:offset+length] for offset, length in ranges)
+        waveforms = obspyread(io.BytesIO(data), format="MSEED")
+        if start is not None or end is not None:
+            waveforms.trim(starttime=start, endtime=end)
+        return waveforms
+
+
+_record_index_lock = threading.Lock()
+_record_indexes = OrderedDict()
+
+def record_index_for(path):
+    """
+    Record index for the miniseed file, reused while the file is unchanged.
+    """
+    key = str(path)
+    with _record_index_lock:
+        index = _record_indexes.get(key)
+        if index is not None and index.is_current():
+            _record_indexes.move_to_end(key)
+            return index
+    index = MSeedRecordIndex(path)
+    with _record_index_lock:
+        _record_indexes[key] = index
+        while len(_record_indexes) > RECORD_INDEX_CACHE_SIZE:
+            _record_indexes.popitem(last=False)
+    return index
+
+def read_mseed_window(path, start=None, end=None):
+    """
+    Reads the part of a miniseed file within start and end, decoding only
+    the records that overlap. Falls back to reading the whole file if the
+    record headers cannot be indexed, for example miniseed3.
+    """
+    try:
+        index = record_index_for(path)
+    except (ValueError, struct.error) as e:
+        print(f"WARN: unable to index records in {path}, reading whole file: {e}")
+        waveforms = obspyread(path, format="MSEED")
+        if start is not None or end is not None:
+            waveforms.trim(starttime=start, endtime=end)
+        return waveforms
+    return index.read(start, end)
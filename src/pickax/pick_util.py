@@ -1,11 +1,12 @@
 import io
 import random
 import string
+import threading
+import weakref
+from collections import OrderedDict
 
-import requests
 from obspy.clients.fdsn.header import URL_MAPPINGS
-from obspy.clients.fdsn import Client
-from obspy.core.event.catalog import read_events
+from obspy.core.event.catalog import Catalog, read_events
 from obspy.core.event.origin import Pick
 from obspy.core.event.base import WaveformStreamID, CreationInfo
 from obspy.core.event.resourceid import ResourceIdentifier
@@ -13,8 +14,14 @@ from obspy import UTCDateTime
 from obspy.core.event.magnitude import Amplitude
 import re
 
+from .client_pool import get_client, cached_get
+from .http_cache import IMMUTABLE_TTL
+from .quake_summary import QuakeSummary
+
 zap_space = re.compile(r'\s+')
 
+EVENT_INDEX_CACHE_SIZE = 64
+
 def create_pick_on_stream(stream, time, phase="pick", creation_info=None, resource_prefix="pickax", filter_name=None):
     """
     Creates a pick based on a gui event, like keypress and mouse position.
@@ -107,17 +114,167 @@ def pick_to_string(p, qmlevent=None, start=None):
     sourceId = f"{p.waveform_id.network_code}.{p.waveform_id.station_code}.{p.waveform_id.location_code}.{p.waveform_id.channel_code}"
     return f"{pname} {p.time} {sourceId} {offsetStr} {amp_str} {author}{ver}{isArr}"
 
+def _resource_id_str(rid):
+    return rid.id if rid is not None else None
+
+def nslc_for_pick(pick):
+    """
+    NET.STA.LOC.CHAN code of the pick's waveform id.
+    """
+    wid = pick.waveform_id
+    if wid is None:
+        return None
+    return f"{wid.network_code}.{wid.station_code}.{wid.location_code}.{wid.channel_code}"
+
+
+class EventIndex:
+    """
+    Lookups for one QuakeML event, from pick id to its arrivals and
+    amplitude, and from NSLC code to picks, built with one pass over the
+    event instead of a scan per pick. The index notices when the pick,
+    amplitude, origin or arrival lists are replaced or change length and
+    rebuilds, add_pick and remove_pick keep it current without a rebuild.
+    The check is cheap, but loops over many picks should still get the
+    index once with event_index() and use it directly.
+    """
+    def __init__(self, qmlevent):
+        self.__event_ref__ = weakref.ref(qmlevent)
+        self.rebuild()
+    def event(self):
+        return self.__event_ref__()
+    def rebuild(self):
+        qmlevent = self.event()
+        self.__arrivals__ = {}
+        self.__amplitudes__ = {}
+        self.__by_nslc__ = {}
+        self.__by_station__ = {}
+        for o in qmlevent.origins:
+            for a in o.arrivals:
+                pick_id = _resource_id_str(a.pick_id)
+                if pick_id is not None:
+                    self.__arrivals__.setdefault(pick_id, []).append((o, a))
+        for amp in qmlevent.amplitudes:
+            self.__index_amplitude__(amp)
+        for pick in qmlevent.picks:
+            self.__index_pick__(pick)
+        self.__picks__ = qmlevent.picks
+        self.__pick_count__ = len(qmlevent.picks)
+        self.__amps__ = qmlevent.amplitudes
+        self.__amp_count__ = len(qmlevent.amplitudes)
+        self.__arrival_lists__ = self.__current_arrival_lists__()
+    def is_current(self):
+        """
+        True if the event still exists and its pick, amplitude, origin and
+        arrival lists are the same lists, with the same lengths, as when
+        indexed.
+        """
+        qmlevent = self.event()
+        return qmlevent is not None \
+            and qmlevent.picks is self.__picks__ \
+            and len(qmlevent.picks) == self.__pick_count__ \
+            and qmlevent.amplitudes is self.__amps__ \
+            and len(qmlevent.amplitudes) == self.__amp_count__ \
+            and self.__arrival_lists__ == self.__current_arrival_lists__()
+    def arrival_for_pick(self, pick):
+        arrivals = self.__arrivals__.get(_resource_id_str(pick.resource_id))
+        return arrivals[0][1] if arrivals else None
+    def amplitude_for_pick(self, pick):
+        return self.__amplitudes__.get(_resource_id_str(pick.resource_id))
+    def picks_for_channel(self, nslc):
+        """
+        Picks with the NET.STA.LOC.CHAN code, in event order.
+        """
+        return list(self.__by_nslc__.get(nslc, []))
+    def picks_for_station(self, net_sta):
+        """
+        Picks with the NET.STA code, in event order.
+        """
+        return list(self.__by_station__.get(net_sta, []))
+    def add_pick(self, pick, amp=None):
+        """
+        Appends the pick, and amplitude if given, to the event.
+        """
+        qmlevent = self.event()
+        qmlevent.picks.append(pick)
+        self.__index_pick__(pick)
+        self.__pick_count__ += 1
+        if amp is not None:
+            qmlevent.amplitudes.append(amp)
+            self.__index_amplitude__(amp)
+            self.__amp_count__ += 1
+    def remove_pick(self, pick):
+        """
+        Removes the pick from the event, along with its arrivals and
+        amplitude.
+        """
+        qmlevent = self.event()
+        pick_id = _resource_id_str(pick.resource_id)
+        arrivals = self.__arrivals__.pop(pick_id, [])
+        for o, a in arrivals:
+            o.arrivals.remove(a)
+        if len(arrivals) > 0:
+            self.__arrival_lists__ = self.__current_arrival_lists__()
+        amp = self.__amplitudes__.pop(pick_id, None)
+        if amp is not None:
+            qmlevent.amplitudes.remove(amp)
+            self.__amp_count__ -= 1
+            # a later amplitude for the same pick takes its place
+            for other in qmlevent.amplitudes:
+                if other is not None and _resource_id_str(other.pick_id) == pick_id:
+                    self.__amplitudes__[pick_id] = other
+                    break
+        qmlevent.picks.remove(pick)
+        self.__pick_count__ -= 1
+        nslc = nslc_for_pick(pick)
+        for key, table in [(nslc, self.__by_nslc__), (nslc.rsplit(".", 2)[0] if nslc is not None else None, self.__by_station__)]:
+            picks = table.get(key)
+            if picks is not None:
+                picks[:] = [p for p in picks if p is not pick]
+    def __index_amplitude__(self, amp):
+        if amp is None:
+            return
+        pick_id = _resource_id_str(amp.pick_id)
+        if pick_id is not None and pick_id not in self.__amplitudes__:
+            self.__amplitudes__[pick_id] = amp
+    def __index_pick__(self, pick):
+        nslc = nslc_for_pick(pick)
+        if nslc is None:
+            return
+        self.__by_nslc__.setdefault(nslc, []).append(pick)
+        self.__by_station__.setdefault(nslc.rsplit(".", 2)[0], []).append(pick)
+    def __current_arrival_lists__(self):
+        # one entry per origin, usually only a few, so cheap to compare
+        return [(id(o.arrivals), len(o.arrivals)) for o in self.event().origins]
+
+
+_event_index_lock = threading.Lock()
+_event_indexes = OrderedDict()
+
+def event_index(qmlevent):
+    """
+    Shared EventIndex for the event, rebuilt if the event has changed.
+    """
+    key = id(qmlevent)
+    with _event_index_lock:
+        index = _event_indexes.get(key)
+        if index is not None and index.event() is qmlevent:
+            _event_indexes.move_to_end(key)
+            if not index.is_current():
+                index.rebuild()
+            return index
+        index = EventIndex(qmlevent)
+        _event_indexes[key] = index
+        while len(_event_indexes) > EVENT_INDEX_CACHE_SIZE:
+            _event_indexes.popitem(last=False)
+        return index
+
 def arrival_for_pick(pick, qmlevent):
     """
     Finds a matching arrival for the pick within the origins in the
     earthquake. If more than one match, the first is returned, if none
     then None is returned.
     """
-    for o in qmlevent.origins:
-        for a in o.arrivals:
-            if pick.resource_id.id == a.pick_id.id:
-                return a
-    return None
+    return event_index(qmlevent).arrival_for_pick(pick)
 def amplitude_for_pick( pick, qmlevent):
     """
     Finds a matching amplitude for the pick within the
@@ -126,20 +283,10 @@ def amplitude_for_pick( pick, qmlevent):
     """
     if pick.resource_id is None:
         return None
-    for a in qmlevent.amplitudes:
-        if a is not None and a.pick_id is not None and pick.resource_id.id == a.pick_id.id:
-            return a
-    return None
+    return event_index(qmlevent).amplitude_for_pick(pick)
 
 def remove_pick(pick, qmlevent):
-    for o in qmlevent.origins:
-        for a in o.arrivals:
-            if pick.resource_id.id == a.pick_id.id:
-                o.arrivals.remove(a)
-    amp = amplitude_for_pick(pick, qmlevent)
-    if amp is not None:
-        qmlevent.amplitudes.remove(amp)
-    qmlevent.picks.remove(pick)
+    event_index(qmlevent).remove_pick(pick)
 def pick_from_trace(pick, trace):
     return (pick.waveform_id.network_code == trace.stats.network and
             pick.waveform_id.station_code == trace.stats.station and
@@ -151,51 +298,206 @@ def same_author(creation_info_a, creation_info_b):
         return False
     return creation_info_a.author == creation_info_b.author
 
+class MergeResult:
+    """
+    Counts of picks from merging one quake into another.
+
+    added -- picks copied to the quake
+    skipped -- picks already there, same id or same time, author and channel
+    conflicting -- picks with the id of a different pick already there, not copied
+    """
+    def __init__(self, added=0, skipped=0, conflicting=0):
+        self.added = added
+        self.skipped = skipped
+        self.conflicting = conflicting
+    def __iadd__(self, other):
+        self.added += other.added
+        self.skipped += other.skipped
+        self.conflicting += other.conflicting
+        return self
+    def __repr__(self):
+        return f"added: {self.added}, skipped: {self.skipped}, conflicting: {self.conflicting}"
+
+def is_by_author(pick, author):
+    return pick.creation_info is not None and \
+        (pick.creation_info.agency_id == author or pick.creation_info.author == author)
+
+def _pick_merge_key(pick):
+    # picks with the same time, to the microsecond like UTCDateTime ==,
+    # author and channel are the same pick, but only if the author is known
+    if pick.creation_info is None or pick.time is None:
+        return None
+    return (round(pick.time.ns, -3), pick.creation_info.author, nslc_for_pick(pick))
+
 def merge_picks_to_quake(qmlevent, out_qmlevent, author=None):
     """
-    Merges picks from one quake to the other.
+    Merges picks from one quake to the other, along with their arrivals,
+    added to the preferred origin, and amplitudes. Picks already in the
+    other quake are found with hashed keys instead of comparing every pair.
+    Returns a MergeResult with the counts.
     """
+    result = MergeResult()
     pick_list = qmlevent.picks
     if author is not None:
-        pick_list = filter(lambda p: p.creation_info.agency_id == author or p.creation_info.author == author, pick_list)
-    to_add = []
+        pick_list = [p for p in pick_list if is_by_author(p, author)]
+    existing_ids = {}
+    existing_keys = set()
+    for catp in out_qmlevent.picks:
+        existing_ids[_resource_id_str(catp.resource_id)] = catp
+        key = _pick_merge_key(catp)
+        if key is not None:
+            existing_keys.add(key)
+    existing_amps = {_resource_id_str(a.resource_id) for a in out_qmlevent.amplitudes if a is not None}
+    out_origin = out_qmlevent.preferred_origin()
+    if out_origin is None and len(out_qmlevent.origins) > 0:
+        out_origin = out_qmlevent.origins[0]
+    existing_arrs = set()
+    if out_origin is not None:
+        existing_arrs = {_resource_id_str(a.resource_id) for a in out_origin.arrivals}
+    in_index = event_index(qmlevent)
     for p in pick_list:
-        found = False
-        for catp in out_qmlevent.picks:
-            if p.time == catp.time and \
-                p.creation_info is not None and \
-                catp.creation_info is not None and \
-                p.creation_info.author == catp.creation_info.author:
-                found = True
-                break
-        if not found:
-            out_qmlevent.picks.append(p)
-    for p in to_add:
-        arr = arrival_for_pick(p, qmlevent)
-        if arr is not None:
-            # ?? what origin to add too
-            out_qmlevent.preferred_origin().arrivals.append(arr)
-        amp = amplitude_for_pick(p, qmlevent)
-        if amp is not None:
+        pick_id = _resource_id_str(p.resource_id)
+        same_id = existing_ids.get(pick_id)
+        if same_id is not None:
+            if same_id.time == p.time and nslc_for_pick(same_id) == nslc_for_pick(p):
+                result.skipped += 1
+            else:
+                result.conflicting += 1
+            continue
+        key = _pick_merge_key(p)
+        if key is not None and key in existing_keys:
+            result.skipped += 1
+            continue
+        out_qmlevent.picks.append(p)
+        existing_ids[pick_id] = p
+        if key is not None:
+            existing_keys.add(key)
+        result.added += 1
+        arr = in_index.arrival_for_pick(p)
+        if arr is not None and out_origin is not None \
+                and _resource_id_str(arr.resource_id) not in existing_arrs:
+            out_origin.arrivals.append(arr)
+            existing_arrs.add(_resource_id_str(arr.resource_id))
+        amp = in_index.amplitude_for_pick(p)
+        if amp is not None and _resource_id_str(amp.resource_id) not in existing_amps:
             out_qmlevent.amplitudes.append(amp)
+            existing_amps.add(_resource_id_str(amp.resource_id))
+    return result
 
 def merge_picks_to_catalog(qmlevent, catalog, author=None):
+    """
+    Merges picks from the quake into the event with the same id in the
+    catalog, or appends a copy if there is none. A plain catalog is
+    scanned until the event is found, to merge many quakes into one
+    catalog wrap it once in an IndexedCatalog, which avoids the scan.
+    """
+    if isinstance(catalog, IndexedCatalog):
+        catalog.merge(qmlevent, author=author)
+        return catalog
     id = extractEventId(qmlevent)
-    pick_list = qmlevent.picks
-    if author is not None:
-        pick_list = filter(lambda p: p.creation_info.agency_id == author or p.creation_info.author == author, pick_list)
-    found_quake = False
     for q in catalog:
         if extractEventId(q) == id:
-            found_quake = True
             merge_picks_to_quake(qmlevent, q, author=author)
-            break
-    if not found_quake:
+            return catalog
+    clean_quake = qmlevent.copy()
+    if author is not None:
+        clean_quake.picks = [p for p in clean_quake.picks if is_by_author(p, author)]
+    catalog.append(clean_quake)
+    return catalog
+
+
+class IndexedCatalog:
+    """
+    Wraps a Catalog with a dict from event id to events, so finding the
+    event for an id does not call extractEventId on every event in the
+    catalog. Each event's id is extracted once and remembered. If the
+    number of events changes because events were added to or removed from
+    the catalog directly, instead of through the wrapper, the index is
+    rebuilt on next use, reusing the remembered ids.
+
+    catalog -- Catalog to wrap, a new empty one if None
+    host -- optional source of the events, passed to extractEventId
+    """
+    def __init__(self, catalog=None, host=""):
+        self.catalog = catalog if catalog is not None else Catalog()
+        self.host = host
+        self.__event_ids__ = {}
+        self.__by_id__ = {}
+        self.__count__ = None
+        self.reindex()
+    def reindex(self):
+        event_ids = {}
+        by_id = {}
+        for quake in self.catalog:
+            eid = self.event_id(quake)
+            event_ids[id(quake)] = (quake, eid)
+            by_id.setdefault(eid, []).append(quake)
+        self.__event_ids__ = event_ids
+        self.__by_id__ = by_id
+        self.__count__ = len(self.catalog)
+    def event_id(self, quake):
+        """
+        extractEventId for the quake, remembered for quakes in the catalog.
+        """
+        memo = self.__event_ids__.get(id(quake))
+        if memo is not None and memo[0] is quake:
+            return memo[1]
+        return extractEventId(quake, host=self.host)
+    def find(self, event_id):
+        """
+        First event in the catalog with the id, or None.
+        """
+        quakes = self.find_all(event_id)
+        return quakes[0] if len(quakes) > 0 else None
+    def find_all(self, event_id):
+        """
+        All events in the catalog with the id, in catalog order.
+        """
+        self.__check__()
+        return list(self.__by_id__.get(event_id, []))
+    def append(self, quake):
+        self.__check__()
+        self.catalog.append(quake)
+        eid = self.event_id(quake)
+        self.__event_ids__[id(quake)] = (quake, eid)
+        self.__by_id__.setdefault(eid, []).append(quake)
+        self.__count__ = len(self.catalog)
+    def remove(self, event_id):
+        """
+        Removes all events with the id from the catalog, returning them.
+        """
+        self.__check__()
+        quakes = self.__by_id__.pop(event_id, [])
+        removed = {id(quake) for quake in quakes}
+        # by identity, list.remove would compare whole events
+        self.catalog.events[:] = [q for q in self.catalog.events if id(q) not in removed]
+        for quake in quakes:
+            del self.__event_ids__[id(quake)]
+        self.__count__ = len(self.catalog)
+        return quakes
+    def merge(self, qmlevent, author=None):
+        """
+        Merges picks from the quake into the event with the same id, or
+        appends a copy if there is none. Returns a MergeResult.
+        """
+        same_quake = self.find(self.event_id(qmlevent))
+        if same_quake is not None:
+            return merge_picks_to_quake(qmlevent, same_quake, author=author)
         clean_quake = qmlevent.copy()
         if author is not None:
-            clean_quake.picks = list(filter(lambda p: p.creation_info.agency_id == author or p.creation_info.author == author, clean_quake.picks))
-        catalog.append(clean_quake)
-    return catalog
+            clean_quake.picks = [p for p in clean_quake.picks if is_by_author(p, author)]
+        self.append(clean_quake)
+        return MergeResult(added=len(clean_quake.picks))
+    def __contains__(self, event_id):
+        self.__check__()
+        return event_id in self.__by_id__
+    def __len__(self):
+        return len(self.catalog)
+    def __iter__(self):
+        return iter(self.catalog)
+    def __check__(self):
+        if len(self.catalog) != self.__count__:
+            self.reindex()
 
 
 def UNKNOWN_PUBLIC_ID():
@@ -212,6 +514,8 @@ def extractEventId(qmlEvent, host=""):
     @param   host optional source of the xml to help determine the event id style
     @returns     Extracted Id, or resource_id.id if we can't figure it out
     """
+    if isinstance(qmlEvent, QuakeSummary):
+        return qmlEvent.event_id
     eventId = ""
     catalogEventSource = None
     if 'extra' in qmlEvent:
@@ -219,16 +523,20 @@ def extractEventId(qmlEvent, host=""):
             eventId = qmlEvent.extra.eventid.value
         if qmlEvent.extra.eventsource is not None:
             catalogEventSource = qmlEvent.extra.eventsource.value
+    return event_id_from_parts(qmlEvent.resource_id.id, eventId, catalogEventSource, host=host)
 
-    if eventId != "":
+def event_id_from_parts(publicid, eventId="", catalogEventSource=None, host=""):
+    """
+    Event id from the publicID and the optional catalog eventid and
+    eventsource attributes of a QuakeML event, as in extractEventId().
+    """
+    if eventId is not None and eventId != "":
         if host == "USGS" or catalogEventSource is not None:
             #USGS, NCEDC and SCEDC use concat of eventsource and eventId as eventit, sigh...
             return f"{catalogEventSource}{eventId}"
         else:
             return eventId
 
-    publicid = qmlEvent.resource_id.id
-
     if publicid is not None:
       parsed = re.match(r'eventid=([\w\d]+)', publicid)
       if parsed:
@@ -244,7 +552,7 @@ def reloadQuakeMLWithPicks(qmlevent, client=None, host="USGS", debug=False):
     if host == "USGS":
         return reloadQuakeMLWithPicksComcat(qmlevent)
     if client is None:
-        client = Client(host, _discover_services=False, debug=debug)
+        client = get_client(host, debug=debug)
     eventid = extractEventId(qmlevent)
     if eventid is not None:
         cat = client.get_events(eventid=eventid, includearrivals=True)
@@ -259,9 +567,14 @@ def reloadQuakeMLWithPicksComcat(qmlevent):
     eventid = extractEventId(qmlevent)
     if eventid is not None:
         eventUrl = f"https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail/{eventid}.geojson"
-        geojson = requests.get(eventUrl).json()
+        resp = cached_get(eventUrl)
+        resp.raise_for_status()
+        geojson = resp.json()
         phaseDataUrl = geojson["properties"]["products"]["phase-data"][0]["contents"]["quakeml.xml"]["url"]
-        catalog = read_events(phaseDataUrl, format="QUAKEML")
+        # product urls include the update time, so the content never changes
+        resp = cached_get(phaseDataUrl, ttl=IMMUTABLE_TTL)
+        resp.raise_for_status()
+        catalog = read_events(io.BytesIO(resp.content), format="QUAKEML")
         if len(catalog) == 1:
             return catalog[0]
         else:
@@ -283,7 +596,7 @@ def inventory_for_catalog_picks(catalog, window=600, client=None, host="IRIS", d
             else:
                 wid_list.append((wid.network_code, wid.station_code, wid.location_code, wid.channel_code, otime, (otime+600)))
     if client is None:
-        client = Client(host, _discover_services=False, debug=debug)
+        client = get_client(host, debug=debug)
     return client.get_stations_bulk(wid_list, level="channel", )
 
 def station_for_pick(pick, inventory):
@@ -300,22 +613,21 @@ def station_for_pick(pick, inventory):
 DEF_INST_LIST = ["H", "N"]
 
 def picks_by_author(pick_list, author):
-    return [pick for pick in pick_list if \
-                pick.creation_info.author == author \
-                or pick.creation_info.agency_id == author]
+    return [pick for pick in pick_list if is_by_author(pick, author)]
 
 def best_pick_at_station(pick_list, p_s, station_id, quake,
                          author_list=[],
                          inst_list=DEF_INST_LIST,
                          check_unique=False):
     all_picks = []
+    index = event_index(quake)
     for pick in pick_list:
-        a = arrival_for_pick(pick, quake)
+        if station_id != f"{pick.waveform_id.network_code}.{pick.waveform_id.station_code}":
+            continue
+        a = index.arrival_for_pick(pick)
         pname = a.phase if a is not None and a.phase is not None else pick.phase_hint
         if pname == p_s:
             all_picks.append(pick)
-    all_picks = [p for p in all_picks if \
-                 station_id == f"{p.waveform_id.network_code}.{p.waveform_id.station_code}"]
     if len(author_list) != 0:
         for au in author_list:
             au_picks = picks_by_author(all_picks, au)
@@ -16,7 +16,7 @@ from .traveltime import TravelTimeCalc
 from .pick_util import (
     pick_to_string,
     pick_from_trace,
-    arrival_for_pick,
+    event_index,
     amplitude_for_pick,
     pick_to_multiline,
     remove_pick,
@@ -129,9 +129,10 @@ class PickAx:
                             )
             if self.config.amplitude_mode == TRACE_AMP:
                 sg.unset_ylim()
+            index = event_index(self.qmlevent)
             for pick in sg.channel_picks():
                 is_mod = same_author(pick.creation_info, self.config.creation_info)
-                arrival = arrival_for_pick(pick, self.qmlevent)
+                arrival = index.arrival_for_pick(pick)
                 pickFlag = self.create_pick_flag(pick, sg, is_modifiable=is_mod, arrival=arrival)
             self.seismographList.append(sg)
         if self.config.amplitude_mode == GLOBAL_AMP:
@@ -262,13 +263,13 @@ class PickAx:
                 if quake_itr is not None:
                     all = quake_itr.all()
             if all is not None:
-                for q in all:
+                for idx, q in enumerate(all):
                     o = q.preferred_origin()
                     m = q.preferred_magnitude()
                     mstr = "    "
                     if m is not None:
                         mstr = f"{m.mag}{m.magnitude_type}"
-                    print(f"{o.time} {mstr} ({o.latitude}/{o.longitude})".strip())
+                    print(f"{idx:4d} {o.time} {mstr} ({o.latitude}/{o.longitude})".strip())
             else:
                 print("Iterator does not allow access to all quakes")
 
@@ -279,8 +280,8 @@ class PickAx:
                 if sta_itr is not None:
                     all = sta_itr.all_stations()
             if all is not None:
-                for s in all:
-                    print(f"{s.code} ({s.latitude}/{s.longitude})")
+                for idx, s in enumerate(all):
+                    print(f"{idx:4d} {s.code} ({s.latitude}/{s.longitude})")
             else:
                 print("Iterator does not allow access to all stations")
 
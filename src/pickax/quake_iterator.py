@@ -1,17 +1,26 @@
 from abc import ABC, abstractmethod
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from obspy import UTCDateTime, Catalog, read_events
 from obspy.clients.fdsn.header import FDSNException
 from obspy.clients.fdsn.header import FDSNNoDataException
-from obspy.clients.fdsn import Client
+from .client_pool import get_client
+from .quake_summary import QuakeSummary, fetch_quake_summaries
+from .snapshot import read_events_snapshot
+from .quakeml_index import QuakeMLFileIndex, QuakeMLDirectoryIndex, DEFAULT_EVENT_CACHE_SIZE
 from .pick_util import (
     reloadQuakeMLWithPicks,
     extractEventId,
-    merge_picks_to_quake
+    merge_picks_to_quake,
+    IndexedCatalog
     )
 
 from pathlib import Path
 import re
 import os
+import weakref
 
 class QuakeIterator(ABC):
     def __init__(self):
@@ -27,10 +36,47 @@ class QuakeIterator(ABC):
         pass
     def all(self):
         return None
+    def seek(self, index):
+        """
+        Moves so the next call to next() returns the quake at index,
+        without loading anything.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support seek")
+    def seek_to(self, event_id):
+        """
+        Moves so the next call to next() returns the quake with the event
+        id. Raises ValueError if not found.
+        """
+        idx = self.index_of(event_id)
+        if idx is None:
+            raise ValueError(f"event {event_id} not found")
+        self.seek(idx)
+    def index_of(self, event_id):
+        """
+        Index of the quake with the event id, or None if not found.
+        """
+        all_quakes = self.all()
+        if all_quakes is None:
+            return None
+        for idx, q in enumerate(all_quakes):
+            if extractEventId(q) == event_id:
+                return idx
+        return None
 
 class QuakeMLFileIterator(QuakeIterator):
-    def __init__(self, file):
-        self.quakes = read_events(file)
+    """
+    Iterates the quakes in a QuakeML file.
+
+    lazy -- scan the file for event offsets instead of reading it all, and
+    parse each quake only when reached, for very large files
+    cache_size -- in lazy mode, number of parsed quakes to keep
+    """
+    def __init__(self, file, lazy=False, cache_size=DEFAULT_EVENT_CACHE_SIZE):
+        self.lazy = lazy
+        if lazy:
+            self.quakes = QuakeMLFileIndex(file, cache_size=cache_size)
+        else:
+            self.quakes = read_events_snapshot(file)
         self.batch_idx = -1
     def next(self):
         self.batch_idx += 1
@@ -47,28 +93,56 @@ class QuakeMLFileIterator(QuakeIterator):
         return self.quakes[self.batch_idx]
     def beginning(self):
         self.batch_idx = -1
+    def seek(self, index):
+        if index < 0 or index >= len(self.quakes):
+            raise IndexError(f"quake index {index} out of range, {len(self.quakes)} quakes")
+        self.batch_idx = index - 1
     def all(self):
+        if self.lazy:
+            return self.quakes.summaries()
         return self.quakes
 
 
 class QuakeMLDirectoryIterator(QuakeIterator):
     """
     Looks for QuakeML files like *.qml and iterates the quakes in
-    each file.
+    each file. Files are scanned for their events once and the results
+    saved in an index file, so reopening a large directory only scans
+    new or changed files, and quakes are parsed only when reached.
+
+    index_file -- json index, defaults to a file in dir, False for none
+    sort_by_time -- order quakes by origin time across all files
+    cache_size -- number of parsed quakes to keep
+    lazy -- False to read every file up front, as a single catalog
     """
-    def __init__(self, dir, pattern="**/*.qml"):
+    def __init__(self, dir, pattern="**/*.qml", index_file=None, sort_by_time=False,
+                 cache_size=DEFAULT_EVENT_CACHE_SIZE, lazy=True):
         self.root_dir = Path(dir)
         self.pattern = pattern
-        self.qmlfiles = list(root_dir.glob(pattern))
-
+        self.lazy = lazy
+        if lazy:
+            self.quakes = QuakeMLDirectoryIndex(self.root_dir, pattern, index_file=index_file,
+                                                sort_by_time=sort_by_time, cache_size=cache_size)
+        else:
+            self.sort_by_time = sort_by_time
+            self.__read_all__()
+        self.batch_idx = -1
+    def __read_all__(self):
+        self.__qmlfiles__ = sorted(self.root_dir.glob(self.pattern))
         self.quakes = Catalog()
         self.q_to_dir = dict()
-        for file in self.qmlfiles:
+        for file in self.__qmlfiles__:
             dir_quakes = read_events(file)
             self.quakes.extend(dir_quakes)
             for q in dir_quakes:
-                self.q_to_dir[q.resource_id] = file
-        self.batch_idx = -1
+                self.q_to_dir[q.resource_id.id] = file
+        if self.sort_by_time:
+            self.quakes.events.sort(key=_quake_sort_key)
+    @property
+    def qmlfiles(self):
+        if not self.lazy:
+            return self.__qmlfiles__
+        return self.quakes.files()
     def next(self):
         self.batch_idx += 1
         if self.batch_idx >= len(self.quakes):
@@ -84,78 +158,381 @@ class QuakeMLDirectoryIterator(QuakeIterator):
         return self.quakes[self.batch_idx]
     def beginning(self):
         self.batch_idx = -1
+    def seek(self, index):
+        if index < 0 or index >= len(self.quakes):
+            raise IndexError(f"quake index {index} out of range, {len(self.quakes)} quakes")
+        self.batch_idx = index - 1
+    def refresh(self):
+        """
+        Picks up new, changed or removed files, back at the beginning if
+        anything changed.
+        """
+        if not self.lazy:
+            self.__read_all__()
+            self.beginning()
+        elif self.quakes.refresh():
+            self.beginning()
     def all(self):
-        return self.quakes
+        if not self.lazy:
+            return self.quakes
+        return self.quakes.summaries()
     def quakedir(self, quake):
-        return self.q_to_dir[quake.resource_id]
+        if not self.lazy:
+            return self.q_to_dir.get(quake.resource_id.id)
+        return self.quakes.file_for_quake(quake)
+
+def _quake_sort_key(quake):
+    origin = quake.preferred_origin()
+    if origin is None or origin.time is None:
+        return (1, 0)
+    return (0, origin.time.timestamp)
 
 class FDSNQuakeIterator(QuakeIterator):
-    def __init__(self, query_params, days_step=30, dc_name="USGS", debug=False):
+    """
+    Quakes from a FDSN event web service, requested in windows of days_step
+    days as next() and prev() reach them, so a long time range does not
+    block startup. Loaded windows are kept for moving back and forth, and
+    the following window is requested in the background. all(), seek()
+    and index_of() use light weight summaries from a single text format
+    request for the whole time range.
+
+    days_step -- length in days of each request, 0 for a single request
+    window_cache -- optional number of windows to keep in memory, None for
+    all of them. An evicted window is requested again if reached, so picks
+    added to its quakes are lost, only use with picks saved elsewhere
+    prefetch -- request the following window in the background
+    text_list -- list quakes with the much smaller text format, and only
+    request the full QuakeML with picks when a quake becomes current
+    pick_lookahead -- number of upcoming quakes to request the full QuakeML
+    with picks for in the background, while the current one is picked
+    """
+    def __init__(self, query_params, days_step=30, dc_name="USGS", debug=False,
+                 window_cache=None, prefetch=True, text_list=False, pick_lookahead=0):
         self.debug = debug
+        self.text_list = text_list
+        self.pick_lookahead = pick_lookahead
         self.dc_name = dc_name
         self._client = None
         self.query_params = dict(query_params)
         if 'orderby' not in self.query_params:
             self.query_params['orderby'] = 'time-asc'
         self.days_step = days_step
-        self.__curr_end = UTCDateTime(query_params["start"]) if query_params["start"] else UTCDateTime()
-        self.quakes = self.next_batch()
+        self.window_cache = max(1, window_cache) if window_cache is not None else None
+        self.windows = self.__time_windows__()
+        self.__lock__ = threading.Lock()
+        self.__loaded__ = OrderedDict()
+        self.__futures__ = {}
+        self.__summaries__ = None
+        self.executor = None
+        if prefetch and len(self.windows) > 1:
+            self.executor = ThreadPoolExecutor(max_workers=1,
+                                               thread_name_prefix="pickax-quakes")
+        self.pick_executor = None
+        if pick_lookahead > 0:
+            self.pick_executor = ThreadPoolExecutor(max_workers=2,
+                                                    thread_name_prefix="pickax-picks")
+        self.__pick_futures__ = {}
+        self.__reloaded__ = set()
+        self.__failed__ = set()
+        self.quakes = Catalog([])
+        self.win_idx = -1
         self.batch_idx = -1
     @property
     def client(self):
         if self._client is None:
-            self._client = Client(self.dc_name, _discover_services=False, debug=self.debug)
+            self._client = get_client(self.dc_name, debug=self.debug)
         return self._client
     def next_batch(self):
-        # careful if implement batching, as all() will be wrong in that case?
+        """
+        Requests all quakes for the query at once.
+        """
         try:
             return self.client.get_events(**self.query_params)
         except FDSNNoDataException:
             # return empty catalog instaed of exception
             return Catalog([])
-    def next_batch_step(self):
-        t1 = self.__curr_end
-        t2 = t1 + self.days_step*86400
-        step_query_params = dict(self.query_params)
-        step_query_params['start'] = t1
-        step_query_params['end'] = t2
-        try:
-            self.quakes = self.client.get_events(**step_query_params)
-        except FDSNNoDataException:
-            # return empty catalog instaed of exception
-            self.quakes =  Catalog([])
-        end = UTCDateTime(query_params["end"])
-        if len(self.quakes) == 0 and step_query_params['end'] < end:
-            return self.next_batch_step()
-        return self.quakes
     def next(self):
         self.batch_idx += 1
-        if self.batch_idx >= len(self.quakes):
-            #self.next_batch()
-            return None
+        while self.batch_idx >= len(self.quakes):
+            if self.win_idx + 1 >= len(self.windows):
+                self.batch_idx = len(self.quakes)
+                return None
+            self.__move_to_window__(self.win_idx + 1)
+            self.batch_idx = 0
         quake = self.quakes[self.batch_idx]
 
-        if self.dc_name == "USGS":
-            quake = reloadQuakeMLWithPicks(quake, client=self.client, debug=self.debug)
-            self.quakes[self.batch_idx] = quake
+        if self.__needs_reload__(quake, (self.win_idx, self.batch_idx)):
+            quake = self.__full_quake__(self.batch_idx)
+        self.prefetch_picks()
         return quake
     def prev(self):
         self.batch_idx -= 1
-        if self.batch_idx < 0:
-            self.batch_idx = -1
-            return None
-        return self.quakes[self.batch_idx]
+        while self.batch_idx < 0:
+            if self.win_idx <= 0:
+                self.batch_idx = -1
+                return None
+            self.__move_to_window__(self.win_idx - 1)
+            self.batch_idx = len(self.quakes) - 1
+        quake = self.quakes[self.batch_idx]
+        if self.__needs_reload__(quake, (self.win_idx, self.batch_idx)):
+            quake = self.__full_quake__(self.batch_idx)
+        return quake
     def beginning(self):
+        self.quakes = Catalog([])
+        self.win_idx = -1
         self.batch_idx = -1
+    def seek(self, index):
+        counts = self.window_counts()
+        if index < 0 or index >= sum(counts):
+            raise IndexError(f"quake index {index} out of range, {sum(counts)} quakes")
+        win_idx = 0
+        while index >= counts[win_idx]:
+            index -= counts[win_idx]
+            win_idx += 1
+        self.__move_to_window__(win_idx)
+        self.batch_idx = min(index, len(self.quakes)) - 1
     def all(self):
-        return self.quakes
+        """
+        Summaries of all quakes for the query, from one text format request
+        for the whole time range, so listing, counting and seeking do not
+        load each window. Only if the data center does not support text
+        format are the windows all requested.
+        """
+        if self.__summaries__ is None:
+            summaries = fetch_quake_summaries(self.client, self.query_params)
+            if summaries is None:
+                print(f"WARN: text format not available, requesting all {len(self.windows)} windows")
+                summaries = Catalog([])
+                for win_idx in range(len(self.windows)):
+                    summaries.extend(self.__window__(win_idx).events)
+            self.__summaries__ = summaries
+        return self.__summaries__
+    def window_counts(self):
+        """
+        Number of quakes in each time window, from the summaries of all(),
+        without requesting the windows themselves.
+        """
+        counts = [0]*len(self.windows)
+        # quakes on a boundary belong to the later window, as in __load_window__
+        ends = [t2 for t1, t2 in self.windows[:-1]]
+        for q in self.all():
+            qtime = _quake_time(q)
+            win_idx = bisect_right(ends, qtime) if qtime is not None else 0
+            counts[win_idx] += 1
+        return counts
+    def prefetch_picks(self):
+        """
+        Starts requesting the full QuakeML for the next pick_lookahead quakes
+        after the current one, in this window and the following one if it
+        has already arrived. Each is stored back into its window when done.
+        """
+        if self.pick_executor is None:
+            return
+        upcoming = []
+        quakes = self.quakes
+        idx = self.batch_idx
+        win_idx = self.win_idx
+        while len(upcoming) < self.pick_lookahead:
+            idx += 1
+            if idx >= len(quakes):
+                with self.__lock__:
+                    quakes = self.__loaded__.get(win_idx + 1)
+                    window_future = self.__futures__.get(win_idx + 1)
+                if quakes is None and window_future is not None \
+                        and window_future.done() \
+                        and (self.window_cache is None or self.window_cache > 1):
+                    quakes = self.__window__(win_idx + 1)
+                if quakes is None:
+                    break
+                win_idx += 1
+                idx = 0
+                if len(quakes) == 0:
+                    continue
+            # failed ones may hold picks, only retried when visited
+            key = (win_idx, idx)
+            if key not in self.__reloaded__ and key not in self.__failed__ \
+                    and self.__needs_reload__(quakes[idx], key):
+                upcoming.append((quakes, win_idx, idx))
+        keep = {}
+        for quakes, win_idx, idx in upcoming:
+            key = (win_idx, idx)
+            future = self.__pick_futures__.pop(key, None)
+            if future is None:
+                future = self.pick_executor.submit(self.__load_full_quake__, quakes, idx)
+            keep[key] = future
+        for future in self.__pick_futures__.values():
+            future.cancel()
+        self.__pick_futures__ = keep
+    def close(self):
+        """
+        Stops any background window or pick request.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.pick_executor is not None:
+            self.pick_executor.shutdown(wait=False, cancel_futures=True)
+            self.pick_executor = None
+    def __needs_reload__(self, quake, key):
+        return self.dc_name == "USGS" or isinstance(quake, QuakeSummary) \
+            or key in self.__failed__
+    def __full_quake__(self, idx):
+        """
+        Replaces the quake at idx in the current window with the full
+        QuakeML, including picks, from the data center, unless already
+        done, using the background request if there is one.
+        """
+        quake = self.quakes[idx]
+        key = (self.win_idx, idx)
+        if key in self.__reloaded__:
+            return quake
+        full_quake = None
+        future = self.__pick_futures__.pop(key, None)
+        if future is not None and not future.cancelled():
+            try:
+                full_quake = future.result()
+            except Exception as e:
+                print(f"WARN: background pick request failed, retrying: {e}")
+        if full_quake is None:
+            try:
+                full_quake = reloadQuakeMLWithPicks(quake, client=self.client, host=self.dc_name, debug=self.debug)
+            except Exception as e:
+                print(f"WARN: pick request failed: {e}")
+        if full_quake is None:
+            # keep one Event in the window so picks made on it stay, and
+            # try the request again on the next visit
+            print(f"WARN: unable to load QuakeML for {extractEventId(quake)}")
+            if isinstance(quake, QuakeSummary):
+                quake = quake.to_event()
+                self.quakes[idx] = quake
+            self.__failed__.add(key)
+            return quake
+        if key in self.__failed__:
+            # picks made while the full QuakeML was missing
+            merge_picks_to_quake(quake, full_quake)
+            self.__failed__.discard(key)
+        self.quakes[idx] = full_quake
+        self.__reloaded__.add(key)
+        return full_quake
+    def __load_full_quake__(self, quakes, idx):
+        full_quake = reloadQuakeMLWithPicks(quakes[idx], client=self.client, host=self.dc_name, debug=self.debug)
+        if full_quake is not None:
+            quakes[idx] = full_quake
+        return full_quake
+    def __time_windows__(self):
+        start = _time_param(self.query_params, "start", "starttime")
+        end = _time_param(self.query_params, "end", "endtime")
+        if start is None or self.days_step is None or self.days_step <= 0:
+            return [(start, end)]
+        if end is None:
+            end = UTCDateTime()
+        windows = []
+        t1 = start
+        while t1 < end:
+            t2 = min(t1 + self.days_step*86400, end)
+            windows.append((t1, t2))
+            t1 = t2
+        if len(windows) == 0:
+            windows.append((start, end))
+        return windows
+    def __move_to_window__(self, win_idx):
+        self.quakes = self.__window__(win_idx)
+        self.win_idx = win_idx
+        if self.executor is not None and win_idx + 1 < len(self.windows):
+            with self.__lock__:
+                if win_idx + 1 not in self.__loaded__ and win_idx + 1 not in self.__futures__:
+                    self.__futures__[win_idx + 1] = self.executor.submit(self.__load_window__, win_idx + 1)
+    def __window__(self, win_idx):
+        with self.__lock__:
+            if win_idx in self.__loaded__:
+                self.__loaded__.move_to_end(win_idx)
+                return self.__loaded__[win_idx]
+            future = self.__futures__.pop(win_idx, None)
+        quakes = None
+        if future is not None and not future.cancelled():
+            try:
+                quakes = future.result()
+            except Exception as e:
+                print(f"WARN: background quake request failed, retrying: {e}")
+        if quakes is None:
+            quakes = self.__load_window__(win_idx)
+        with self.__lock__:
+            self.__loaded__[win_idx] = quakes
+            evicted = set()
+            while self.window_cache is not None and len(self.__loaded__) > self.window_cache:
+                evicted.add(self.__loaded__.popitem(last=False)[0])
+        if len(evicted) > 0:
+            # full quakes are gone with the window, reload if it comes back
+            self.__reloaded__ = {key for key in self.__reloaded__ if key[0] not in evicted}
+            self.__failed__ = {key for key in self.__failed__ if key[0] not in evicted}
+        return quakes
+    def __load_window__(self, win_idx):
+        t1, t2 = self.windows[win_idx]
+        step_query_params = dict(self.query_params)
+        for key in ["start", "starttime", "end", "endtime"]:
+            step_query_params.pop(key, None)
+        if t1 is not None:
+            step_query_params['starttime'] = t1
+        if t2 is not None:
+            step_query_params['endtime'] = t2
+        quakes = None
+        if self.text_list:
+            quakes = fetch_quake_summaries(self.client, step_query_params)
+            if quakes is None:
+                print(f"WARN: text format not available, requesting QuakeML")
+        if quakes is None:
+            try:
+                quakes = self.client.get_events(**step_query_params)
+            except FDSNNoDataException:
+                # return empty catalog instaed of exception
+                quakes = Catalog([])
+        if win_idx < len(self.windows) - 1:
+            # end time is inclusive, leave quakes on the boundary to the next window
+            in_window = [q for q in quakes if _quake_time(q) is None or _quake_time(q) < t2]
+            if isinstance(quakes, Catalog):
+                quakes.events = in_window
+            else:
+                quakes = in_window
+        if self.debug:
+            print(f"Loaded {len(quakes)} quakes for {t1} to {t2}")
+        return quakes
+
+
+def _time_param(query_params, short_key, long_key):
+    value = query_params.get(long_key, query_params.get(short_key))
+    if value is None:
+        return None
+    return UTCDateTime(value)
+
+def _quake_time(quake):
+    origin = quake.preferred_origin()
+    if origin is None and len(getattr(quake, "origins", [])) > 0:
+        origin = quake.origins[0]
+    if origin is None:
+        return None
+    return origin.time
 
 class CachedPicksQuakeItr(QuakeIterator):
-    def __init__(self, quake_itr, cachedir='by_eventid'):
+    """
+    Adds picks saved in per event QuakeML files in cachedir to the quakes
+    of the sub iterator. The directory listing is kept until the directory
+    changes, and each file is parsed and merged again only when it has
+    been modified.
+
+    cache_size -- number of parsed pick files to keep
+    """
+    def __init__(self, quake_itr, cachedir='by_eventid', cache_size=64):
         self.quake_itr = quake_itr
-        self.quakes = self.quake_itr.quakes
         self.cachedir = Path(cachedir)
         self.bad_file_chars_pat = re.compile(r'[\s:\(\)/]+')
+        self.cache_size = cache_size
+        self.__listing__ = set()
+        self.__dir_mtime__ = None
+        self.__parsed__ = OrderedDict()
+        self.__merged__ = {}
+    @property
+    def quakes(self):
+        return self.quake_itr.quakes
     def next(self):
         q = self.quake_itr.next()
         return self.reload_picks(q)
@@ -164,16 +541,59 @@ class CachedPicksQuakeItr(QuakeIterator):
         return self.reload_picks(q)
     def beginning(self):
         return self.quake_itr.beginning()
+    def seek(self, index):
+        return self.quake_itr.seek(index)
+    def seek_to(self, event_id):
+        return self.quake_itr.seek_to(event_id)
+    def index_of(self, event_id):
+        return self.quake_itr.index_of(event_id)
     def reload_picks(self, quake):
         # look for picks in cache dir
         if quake is None:
             return quake
         eid = extractEventId(quake)
         qfile = f"eventid_{re.sub(self.bad_file_chars_pat, '_', eid)}.qml"
+        if qfile not in self.cached_files():
+            return quake
         qpath=  Path(self.cachedir / qfile)
-        if qpath.exists():
-            pick_quake = read_events(qpath)[0]
-            merge_picks_to_quake(pick_quake, quake)
+        try:
+            mtime = qpath.stat().st_mtime_ns
+        except FileNotFoundError:
+            return quake
+        merged = self.__merged__.get(eid)
+        if merged is not None and merged[0] == mtime and merged[1]() is quake:
+            # already has the picks from this version of the file
+            return quake
+        parsed = self.__parsed__.get(qfile)
+        if parsed is None or parsed[0] != mtime:
+            parsed = (mtime, IndexedCatalog(read_events(qpath)))
+            self.__parsed__[qfile] = parsed
+            while len(self.__parsed__) > self.cache_size:
+                self.__parsed__.popitem(last=False)
+        self.__parsed__.move_to_end(qfile)
+        cached_quake = parsed[1].find(eid)
+        if cached_quake is None:
+            if len(parsed[1]) == 0:
+                return quake
+            # file names are made from the id, so take the only event even
+            # if its id is written in another style
+            cached_quake = parsed[1].catalog[0]
+        merge_picks_to_quake(cached_quake, quake)
+        self.__merged__[eid] = (mtime, weakref.ref(quake))
         return quake
+    def cached_files(self):
+        """
+        Names of the files in cachedir, listed again only when the
+        directory has changed.
+        """
+        try:
+            mtime = os.stat(self.cachedir).st_mtime_ns
+        except FileNotFoundError:
+            return set()
+        if mtime != self.__dir_mtime__:
+            with os.scandir(self.cachedir) as dir_itr:
+                self.__listing__ = {entry.name for entry in dir_itr}
+            self.__dir_mtime__ = mtime
+        return self.__listing__
     def all(self):
         return self.quake_itr.all()
@@ -0,0 +1,117 @@
+from obspy import UTCDateTime
+from obspy.core.event import Event, EventDescription, Magnitude, Origin, ResourceIdentifier
+from obspy.clients.fdsn.header import PARAMETER_ALIASES
+
+from .client_pool import cached_get
+
+
+class QuakeSummary:
+    """
+    One line of a FDSN event text format response, the event id, origin
+    and magnitude without picks, arrivals or resource ids. Works like an
+    obspy Event for preferred_origin() and preferred_magnitude(), both
+    return the summary itself, so listings can use either. Depth is in
+    meters, as in QuakeML.
+    """
+    __slots__ = ("event_id", "time", "latitude", "longitude", "depth",
+                 "mag", "magnitude_type", "description")
+    def __init__(self, event_id, time, latitude, longitude, depth,
+                 mag=None, magnitude_type=None, description=None):
+        self.event_id = event_id
+        self.time = time
+        self.latitude = latitude
+        self.longitude = longitude
+        self.depth = depth
+        self.mag = mag
+        self.magnitude_type = magnitude_type
+        self.description = description
+    def preferred_origin(self):
+        return self
+    def preferred_magnitude(self):
+        if self.mag is None:
+            return None
+        return self
+    def to_event(self):
+        """
+        obspy Event with the origin and magnitude of the summary and the
+        event id as its resource id, but no picks or arrivals.
+        """
+        origin = Origin(time=self.time, latitude=self.latitude,
+                        longitude=self.longitude, depth=self.depth)
+        event = Event(resource_id=ResourceIdentifier(self.event_id), origins=[origin])
+        event.preferred_origin_id = origin.resource_id
+        if self.mag is not None:
+            magnitude = Magnitude(mag=self.mag, magnitude_type=self.magnitude_type,
+                                  origin_id=origin.resource_id)
+            event.magnitudes.append(magnitude)
+            event.preferred_magnitude_id = magnitude.resource_id
+        if self.description:
+            event.event_descriptions.append(EventDescription(text=self.description))
+        event.scope_resource_ids()
+        return event
+    def __repr__(self):
+        return f"QuakeSummary({self.event_id} {self.time} {self.latitude}/{self.longitude} {self.mag}{self.magnitude_type})"
+
+
+def _float_or_none(s):
+    s = s.strip()
+    if len(s) == 0:
+        return None
+    return float(s)
+
+def parse_event_text(text):
+    """
+    Parses FDSN event text format,
+    EventID|Time|Latitude|Longitude|Depth/km|Author|Catalog|Contributor|ContributorID|MagType|Magnitude|MagAuthor|EventLocationName
+    into a list of QuakeSummary.
+    """
+    summaries = []
+    for line in text.splitlines():
+        if line.startswith("#") or len(line.strip()) == 0:
+            continue
+        items = line.split("|")
+        if len(items) < 11:
+            print(f"WARN: skipping event text line, not enough fields: {line}")
+            continue
+        depth = _float_or_none(items[4])
+        summaries.append(QuakeSummary(
+            items[0].strip(),
+            UTCDateTime(items[1].strip()),
+            _float_or_none(items[2]),
+            _float_or_none(items[3]),
+            depth*1000 if depth is not None else None,
+            mag=_float_or_none(items[10]),
+            magnitude_type=items[9].strip(),
+            description=items[12].strip() if len(items) > 12 else None,
+            ))
+    return summaries
+
+def fetch_quake_summaries(client, query_params, timeout=120):
+    """
+    Summaries of the events matching the query, from one text format
+    request to the event service of the client's data center. Returns
+    None if the service does not support text format.
+    """
+    params = {}
+    for key, value in query_params.items():
+        if value is None:
+            continue
+        key = PARAMETER_ALIASES.get(key, key)
+        if isinstance(value, UTCDateTime):
+            value = value.isoformat()
+        elif isinstance(value, bool):
+            value = str(value).lower()
+        params[key] = value
+    params["format"] = "text"
+    url = f"{client.base_url}/fdsnws/event/1/query"
+    try:
+        resp = cached_get(url, params=params, timeout=timeout)
+    except Exception as e:
+        print(f"WARN: event summary query failed: {e}")
+        return None
+    if resp.status_code == 204:
+        return []
+    if resp.status_code != 200:
+        print(f"WARN: event summary query failed: {resp.status_code} {resp.url}")
+        return None
+    return parse_event_text(resp.text)
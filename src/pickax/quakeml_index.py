@@ -0,0 +1,486 @@
+from abc import ABC, abstractmethod
+import io
+import json
+import mmap
+import threading
+import weakref
+import xml.parsers.expat
+from collections import OrderedDict
+from pathlib import Path
+
+from obspy import UTCDateTime, read_events
+
+from .atomic_file import write_json
+from .pick_util import event_id_from_parts
+from .quake_summary import QuakeSummary
+
+DEFAULT_EVENT_CACHE_SIZE = 16
+QUAKEML_DIR_INDEX_FILENAME = ".pickax_quakeml_index.json"
+QUAKEML_DIR_INDEX_VERSION = 1
+
+
+class QuakeMLEventEntry:
+    """
+    Location of one event in a QuakeML file, the byte range of its event
+    element plus the event id and preferred origin and magnitude values
+    found while scanning.
+    """
+    __slots__ = ("public_id", "event_id", "start", "end", "time",
+                 "latitude", "longitude", "depth", "mag", "magnitude_type")
+    def __init__(self, public_id, event_id, start, end, time=None, latitude=None,
+                 longitude=None, depth=None, mag=None, magnitude_type=None):
+        self.public_id = public_id
+        self.event_id = event_id
+        self.start = start
+        self.end = end
+        self.time = time
+        self.latitude = latitude
+        self.longitude = longitude
+        self.depth = depth
+        self.mag = mag
+        self.magnitude_type = magnitude_type
+    def summary(self):
+        return QuakeSummary(self.event_id,
+                            UTCDateTime(self.time) if self.time is not None else None,
+                            self.latitude, self.longitude, self.depth,
+                            mag=self.mag, magnitude_type=self.magnitude_type)
+    def to_list(self):
+        return [getattr(self, k) for k in self.__slots__]
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+
+def _local_name(name):
+    return name.rsplit(":", 1)[-1]
+
+def _float_or_none(s):
+    if s is None:
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+def scan_quakeml(path):
+    """
+    Scans a QuakeML file once with expat, without building any obspy
+    objects, returning a QuakeMLEventEntry for each event element.
+    """
+    entries = []
+    stack = []
+    text = []
+    # per event scan state
+    ev = {}
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+
+    def start(name, attrs):
+        local = _local_name(name)
+        stack.append(local)
+        text.clear()
+        depth = len(stack)
+        if local == "event" and depth >= 2 and stack[-2] == "eventParameters":
+            ev.clear()
+            ev["depth"] = depth
+            ev["public_id"] = attrs.get("publicID")
+            ev["start"] = parser.CurrentByteIndex
+            ev["origins"] = {}
+            ev["magnitudes"] = {}
+            for k, v in attrs.items():
+                if _local_name(k) == "eventid":
+                    ev["eventid"] = v
+                elif _local_name(k) == "eventsource":
+                    ev["eventsource"] = v
+        elif len(ev) > 0 and depth == ev["depth"] + 1:
+            if local == "origin":
+                ev["curr"] = ev["origins"].setdefault(attrs.get("publicID"), {})
+            elif local == "magnitude":
+                ev["curr"] = ev["magnitudes"].setdefault(attrs.get("publicID"), {})
+            else:
+                ev["curr"] = None
+
+    def chars(data):
+        text.append(data)
+
+    def end(name):
+        local = stack.pop()
+        if len(ev) == 0:
+            return
+        depth = len(stack)
+        rel = depth - ev["depth"]
+        if rel == 0 and local in ("preferredOriginID", "preferredMagnitudeID"):
+            ev[local] = "".join(text).strip()
+        elif rel == 2 and local == "value" and ev.get("curr") is not None:
+            # origin/time/value, magnitude/mag/value
+            ev["curr"][stack[-1]] = "".join(text).strip()
+        elif rel == 1 and local == "type" and ev.get("curr") is not None \
+                and stack[-1] == "magnitude":
+            ev["curr"]["type"] = "".join(text).strip()
+        elif rel == -1 and local == "event":
+            entries.append(_entry_from_scan(ev, parser.CurrentByteIndex))
+            ev.clear()
+        text.clear()
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = chars
+    with open(path, "rb") as f:
+        parser.ParseFile(f)
+    if len(entries) > 0:
+        # end tag offset is its start, move to just after the closing >
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for entry in entries:
+                    entry.end = mm.find(b">", entry.end) + 1
+    return entries
+
+def _entry_from_scan(ev, end_tag_start):
+    origin = ev["origins"].get(ev.get("preferredOriginID"))
+    if origin is None and len(ev["origins"]) > 0:
+        origin = next(iter(ev["origins"].values()))
+    if origin is None:
+        origin = {}
+    mag = ev["magnitudes"].get(ev.get("preferredMagnitudeID"))
+    if mag is None and len(ev["magnitudes"]) > 0:
+        mag = next(iter(ev["magnitudes"].values()))
+    if mag is None:
+        mag = {}
+    depth = _float_or_none(origin.get("depth"))
+    return QuakeMLEventEntry(
+        ev["public_id"],
+        event_id_from_parts(ev["public_id"], ev.get("eventid", ""), ev.get("eventsource")),
+        ev["start"],
+        end_tag_start,
+        time=origin.get("time"),
+        latitude=_float_or_none(origin.get("latitude")),
+        longitude=_float_or_none(origin.get("longitude")),
+        depth=depth,
+        mag=_float_or_none(mag.get("mag")),
+        magnitude_type=mag.get("type"),
+        )
+
+
+def _event_signature(quake):
+    """
+    Cheap summary of the parts of an event picking changes, to notice
+    edits to a handed out event without comparing the whole thing.
+    """
+    return (len(quake.picks), len(quake.amplitudes), len(quake.magnitudes),
+            len(quake.station_magnitudes), len(quake.comments),
+            tuple(len(o.arrivals) for o in quake.origins))
+
+class LazyEventList(ABC):
+    """
+    Read only list of events parsed on demand by read_event(idx) in a
+    subclass. Events returned by indexing are tracked only as long as the
+    caller holds them, and kept for the life of the list once set, marked
+    with mark_modified(idx), or found changed, like with added picks, the
+    next time the list is indexed. Events only passed through while
+    iterating are kept in a cache of the most recently used.
+    """
+    def __init__(self, cache_size=DEFAULT_EVENT_CACHE_SIZE):
+        self.cache_size = max(1, cache_size)
+        self.__lock__ = threading.Lock()
+        self.__events__ = OrderedDict()
+        self.__handed_out__ = weakref.WeakValueDictionary()
+        self.__signatures__ = {}
+        self.__dirty__ = {}
+    @abstractmethod
+    def __len__(self):
+        return 0
+    @abstractmethod
+    def read_event(self, idx):
+        return None
+    def __check_index__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(f"event index {idx} out of range, {len(self)} events")
+        return idx
+    def __check_modified__(self):
+        """
+        Keeps handed out events that changed since, and forgets the ones
+        callers no longer hold. Called with the lock held.
+        """
+        for idx, signature in list(self.__signatures__.items()):
+            quake = self.__handed_out__.get(idx)
+            if quake is None:
+                del self.__signatures__[idx]
+            elif _event_signature(quake) != signature:
+                self.__dirty__[idx] = quake
+                del self.__signatures__[idx]
+                self.__handed_out__.pop(idx, None)
+    def __cached_event__(self, idx):
+        with self.__lock__:
+            quake = self.__dirty__.get(idx)
+            if quake is None:
+                quake = self.__handed_out__.get(idx)
+            if quake is not None:
+                return quake
+            quake = self.__events__.get(idx)
+            if quake is not None:
+                self.__events__.move_to_end(idx)
+                return quake
+        quake = self.read_event(idx)
+        with self.__lock__:
+            self.__events__[idx] = quake
+            while len(self.__events__) > self.cache_size:
+                self.__events__.popitem(last=False)
+        return quake
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        idx = self.__check_index__(idx)
+        quake = self.__cached_event__(idx)
+        with self.__lock__:
+            self.__check_modified__()
+            if idx not in self.__dirty__ and idx not in self.__signatures__:
+                self.__handed_out__[idx] = quake
+                self.__signatures__[idx] = _event_signature(quake)
+        return quake
+    def __setitem__(self, idx, quake):
+        idx = self.__check_index__(idx)
+        with self.__lock__:
+            self.__dirty__[idx] = quake
+            self.__signatures__.pop(idx, None)
+            self.__handed_out__.pop(idx, None)
+            self.__events__.pop(idx, None)
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.__cached_event__(idx)
+    def mark_modified(self, idx):
+        """
+        Keeps the event at idx for the life of the list, for changes the
+        check on indexing does not see, like a moved pick time.
+        """
+        self[idx] = self[idx]
+    def kept_events(self):
+        """
+        Events set or modified, plus the ones handed out and still held,
+        by index.
+        """
+        with self.__lock__:
+            self.__check_modified__()
+            kept = dict(self.__handed_out__.items())
+            kept.update(self.__dirty__)
+            return kept
+    def clear_cache(self, keep=None):
+        """
+        Drops all parsed events, then keeps the events in keep, a dict of
+        index to event. Those set or modified before stay kept, the others
+        only while still held.
+        """
+        with self.__lock__:
+            dirty_ids = {id(quake) for quake in self.__dirty__.values()}
+            self.__events__.clear()
+            self.__handed_out__ = weakref.WeakValueDictionary()
+            self.__signatures__ = {}
+            self.__dirty__ = {}
+            for idx, quake in (keep or {}).items():
+                if id(quake) in dirty_ids:
+                    self.__dirty__[idx] = quake
+                else:
+                    self.__handed_out__[idx] = quake
+                    self.__signatures__[idx] = _event_signature(quake)
+
+
+class QuakeMLFileIndex(LazyEventList):
+    """
+    Byte offsets of the events in a QuakeML file, from one scan with an
+    incremental parser, so single events can be parsed by obspy only when
+    needed.
+
+    path -- QuakeML file
+    cache_size -- number of parsed events to keep
+    entries -- optional entries from an earlier scan of the unchanged file
+    """
+    def __init__(self, path, cache_size=DEFAULT_EVENT_CACHE_SIZE, entries=None):
+        super().__init__(cache_size)
+        self.path = Path(path)
+        stat = self.path.stat()
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.entries = entries if entries is not None else scan_quakeml(self.path)
+        self.__header__ = None
+        self.__footer__ = None
+        self.__summaries__ = None
+    def is_current(self):
+        """
+        True if the file is unchanged since it was scanned.
+        """
+        stat = self.path.stat()
+        return stat.st_mtime_ns == self.mtime and stat.st_size == self.size
+    def __len__(self):
+        return len(self.entries)
+    def read_event(self, idx):
+        """
+        Parses the event at idx from the file, wrapped in the file's own
+        QuakeML header and footer so namespaces resolve.
+        """
+        entry = self.entries[idx]
+        with open(self.path, "rb") as f:
+            if self.__header__ is None:
+                self.__header__ = f.read(self.entries[0].start)
+                f.seek(self.entries[-1].end)
+                self.__footer__ = f.read()
+            f.seek(entry.start)
+            event_bytes = f.read(entry.end - entry.start)
+        catalog = read_events(io.BytesIO(self.__header__ + event_bytes + self.__footer__),
+                              format="QUAKEML")
+        return catalog[0]
+    def summaries(self):
+        """
+        QuakeSummary for each event, from the scan, without parsing any.
+        """
+        if self.__summaries__ is None:
+            self.__summaries__ = [entry.summary() for entry in self.entries]
+        return self.__summaries__
+
+
+class QuakeMLDirectoryIndex(LazyEventList):
+    """
+    Events in all QuakeML files under a directory, from a scan of each
+    file, with quakes parsed only when needed. The scan results are saved
+    in a json index file next to the data, and on later opens only new or
+    changed files are scanned again.
+
+    root_dir -- directory to search
+    pattern -- glob pattern for QuakeML files
+    index_file -- json index, defaults to .pickax_quakeml_index.json in root_dir, False for none
+    sort_by_time -- order events by origin time across all files, instead of by file
+    cache_size -- number of parsed events to keep
+    """
+    def __init__(self, root_dir, pattern="**/*.qml", index_file=None, sort_by_time=False,
+                 cache_size=DEFAULT_EVENT_CACHE_SIZE):
+        super().__init__(cache_size)
+        self.root_dir = Path(root_dir)
+        self.pattern = pattern
+        if index_file is None:
+            index_file = self.root_dir / QUAKEML_DIR_INDEX_FILENAME
+        self.index_file = Path(index_file) if index_file is not False else None
+        self.sort_by_time = sort_by_time
+        self.__files__ = {}
+        self.events = []
+        self.__summaries__ = None
+        self.__by_public_id__ = None
+        self.refresh()
+    def refresh(self):
+        """
+        Finds new, changed and removed files, scanning only new and changed
+        ones. Returns True if anything changed.
+        """
+        old_files = self.__files__
+        if len(old_files) == 0 and self.index_file is not None:
+            old_files = self.__load__()
+        files = {}
+        changed = False
+        for path in self.root_dir.glob(self.pattern):
+            if path == self.index_file:
+                continue
+            relpath = str(path.relative_to(self.root_dir))
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            old = old_files.get(relpath)
+            if old is not None and old[0] == stat.st_mtime_ns and old[1] == stat.st_size:
+                files[relpath] = old
+                continue
+            try:
+                entries = scan_quakeml(path)
+            except xml.parsers.expat.ExpatError as e:
+                print(f"WARN: unable to scan {path}, skipping: {e}")
+                entries = []
+            files[relpath] = (stat.st_mtime_ns, stat.st_size, entries)
+            changed = True
+        if len(files) != len(old_files):
+            changed = True
+        if not changed and len(self.events) > 0:
+            return False
+        self.__files__ = files
+        events = []
+        for relpath, (mtime, size, entries) in files.items():
+            for entry_idx, entry in enumerate(entries):
+                events.append((relpath, entry_idx, entry))
+        if self.sort_by_time:
+            events.sort(key=_event_sort_key)
+        # events handed out may hold edits, keep them where still in a file
+        kept_by_id = {self.events[idx][2].public_id: quake
+                      for idx, quake in self.kept_events().items()}
+        self.events = events
+        self.__summaries__ = None
+        self.__by_public_id__ = None
+        self.clear_cache({idx: kept_by_id[entry.public_id]
+                          for idx, (relpath, entry_idx, entry) in enumerate(events)
+                          if entry.public_id in kept_by_id})
+        if changed and self.index_file is not None:
+            self.__save__()
+        return changed
+    def __len__(self):
+        return len(self.events)
+    def read_event(self, idx):
+        relpath, entry_idx, entry = self.events[idx]
+        path = self.root_dir / relpath
+        entries = self.__files__[relpath][2]
+        if len(entries) == 1:
+            return read_events(path, format="QUAKEML")[0]
+        return QuakeMLFileIndex(path, cache_size=1, entries=entries).read_event(entry_idx)
+    def file_for(self, idx):
+        """
+        Path of the file holding the event at idx.
+        """
+        return self.root_dir / self.events[idx][0]
+    def file_for_quake(self, quake):
+        """
+        Path of the file holding the quake, found by its publicID.
+        """
+        if self.__by_public_id__ is None:
+            self.__by_public_id__ = {entry.public_id: relpath for relpath, entry_idx, entry in self.events}
+        relpath = self.__by_public_id__.get(quake.resource_id.id)
+        if relpath is None:
+            return None
+        return self.root_dir / relpath
+    def files(self):
+        return [self.root_dir / relpath for relpath in self.__files__.keys()]
+    def summaries(self):
+        """
+        QuakeSummary for each event, from the scan, without parsing any.
+        """
+        if self.__summaries__ is None:
+            self.__summaries__ = [entry.summary() for relpath, entry_idx, entry in self.events]
+        return self.__summaries__
+    def __load__(self):
+        if not self.index_file.exists():
+            return {}
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARN: unable to read index {self.index_file}, rescanning: {e}")
+            return {}
+        if index.get("version") != QUAKEML_DIR_INDEX_VERSION \
+                or index.get("dir") != str(self.root_dir.resolve()):
+            return {}
+        files = {}
+        for relpath, (mtime, size, entries) in index["files"].items():
+            files[relpath] = (mtime, size, [QuakeMLEventEntry.from_list(e) for e in entries])
+        return files
+    def __save__(self):
+        index = {
+            "version": QUAKEML_DIR_INDEX_VERSION,
+            "dir": str(self.root_dir.resolve()),
+            "files": {relpath: [mtime, size, [e.to_list() for e in entries]]
+                      for relpath, (mtime, size, entries) in self.__files__.items()},
+        }
+        try:
+            write_json(self.index_file, index)
+        except OSError as e:
+            print(f"WARN: unable to save index {self.index_file}: {e}")
+
+
+def _event_sort_key(event):
+    entry = event[2]
+    if entry.time is None:
+        return (1, 0, event[0], event[1])
+    return (0, UTCDateTime(entry.time).timestamp, event[0], event[1])
@@ -1,14 +1,22 @@
 from abc import ABC, abstractmethod
-from collections import deque
+import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from obspy.core.stream import read as obspyread
-from obspy.clients.fdsn import Client
 from obspy.taup import TauPyModel
 from obspy.geodetics import locations2degrees
-from obspy.clients.fdsn.header import FDSNNoDataException, FDSNBadRequestException
+from obspy.clients.fdsn.header import FDSNException, FDSNNoDataException
 from obspy import Stream
 from pathlib import Path
 from .station_iterator import channel_from_sac, StationXMLDirectoryIterator
 from .quake_iterator import QuakeMLFileIterator
+from .client_pool import get_client, http_session, record_request
+from .mseed_index import MSeedDirectoryIndex, read_mseed_window
+from .waveform_cache import WaveformDiskCache, waveform_cache_key, DEFAULT_MAX_BYTES
+
+# quakes whose station lists FDSNSeismogramIterator keeps for background loads
+QUAKE_STATIONS_KEPT = 4
 
 
 class SeismogramIterator(ABC):
@@ -29,15 +37,71 @@ class SeismogramIterator(ABC):
         return None
     def station_iterator(self):
         return None
+    def next_position(self):
+        """
+        Moves to the next station, and quake if needed, without loading any
+        waveforms, returning net, sta, quake. Only iterators that load
+        data one station at a time can do this.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} cannot move without loading data")
+    def prev_position(self):
+        """
+        Moves to the previous station, and quake if needed, without loading
+        any waveforms, returning net, sta, quake.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} cannot move without loading data")
+    def load_seismograms(self, net, sta, quake):
+        """
+        Loads waveforms for a position returned by next_position() or
+        prev_position(), returning net, sta, quake, waveforms.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} cannot load data for a position")
+    def time_window(self, net, sta, quake):
+        """
+        Start and end time of the waveforms loaded for the station and
+        quake, or None if not known before loading.
+        """
+        return None
+    def is_available(self, net, sta, quake):
+        """
+        False if the station is known to have no data for the quake, so it
+        can be skipped without trying to load it.
+        """
+        return True
+    def seek(self, quake_index, station_index=0):
+        """
+        Moves so the next call to next() returns the station at
+        station_index for the quake at quake_index, without loading any
+        waveforms.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support seek")
+    def seek_to(self, event_id, net_sta=None):
+        """
+        Moves so the next call to next() returns the station with the
+        NET.STA code, or the first station if None, for the quake with the
+        event id, without loading any waveforms.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support seek")
 
 class MDLSeismogramIterator(SeismogramIterator):
     """
     Seismogram iterator over a obspy mass downloader directory.
+
+    index_file -- optional file to save the waveform file name index in, so
+    later sessions do not need to scan the directory
+    start_offset, end_offset -- optional window in seconds relative to the
+    origin, only the miniseed records within it are read
+    check_availability -- skip stations with no miniseed files in the window
     """
-    def __init__(self, mdl_dir, mseed_storage = "waveforms", stationxml_storage = "stations", quakeml="*.qml"):
+    def __init__(self, mdl_dir, mseed_storage = "waveforms", stationxml_storage = "stations", quakeml="*.qml", index_file=None,
+                 start_offset=None, end_offset=None, check_availability=False):
         self.__empty__ = None, None, None, []
+        self.check_availability = check_availability
+        self.start_offset = start_offset
+        self.end_offset = end_offset
         self.mdl_dir = Path(mdl_dir)
         self.mseed_dir = Path(self.mdl_dir, mseed_storage)
+        self.file_index = MSeedDirectoryIndex(self.mseed_dir, index_file=index_file)
         quakeml_list = list(self.mdl_dir.glob(quakeml))
         if len(quakeml_list) != 1:
             print(f"expected one quakeml file but found {len(quakeml_list)} in {mdl_dir} for {quakeml}")
@@ -45,82 +109,490 @@ class MDLSeismogramIterator(SeismogramIterator):
         self.quake_itr = QuakeMLFileIterator(self.quakeml)
         self.curr_quake = self.quake_itr.next()
         self.station_itr = StationXMLDirectoryIterator(self.mdl_dir, f"{stationxml_storage}/*.xml")
+        self.station_itr.set_quake(self.curr_quake)
         self.idx = -1
 
     def next(self):
-        if self.curr_quake is None:
+        net, sta, quake = self.next_position()
+        if sta is None or quake is None:
+            return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def prev(self):
+        net, sta, quake = self.prev_position()
+        if sta is None or quake is None:
             return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def next_position(self):
+        net, sta, quake = self.__step_next__()
+        while sta is not None and not self.is_available(net, sta, quake):
+            net, sta, quake = self.__step_next__()
+        return net, sta, quake
+    def prev_position(self):
+        net, sta, quake = self.__step_prev__()
+        while sta is not None and not self.is_available(net, sta, quake):
+            net, sta, quake = self.__step_prev__()
+        return net, sta, quake
+    def __step_next__(self):
+        if self.curr_quake is None:
+            return None, None, None
         net, sta = self.station_itr.next()
         if sta is None:
             quake = self.quake_itr.next()
             if quake is None:
-                return self.__empty__
+                return None, None, None
             self.curr_quake = quake
+            self.station_itr.set_quake(quake)
             self.station_itr.beginning()
             net, sta = self.station_itr.next()
         if sta is None or self.curr_quake is None:
-            return self.__empty__
-        return self.__load_seismograms__(net, sta, self.curr_quake)
-    def prev(self):
+            return None, None, None
+        return net, sta, self.curr_quake
+    def __step_prev__(self):
         if self.curr_quake is None:
-            return self.__empty__
+            return None, None, None
         net, sta = self.station_itr.prev()
         if sta is None:
             self.curr_quake = self.quake_itr.prev()
+            self.station_itr.set_quake(self.curr_quake)
             self.station_itr.ending()
             net, sta = self.station_itr.prev()
             if self.curr_quake is None:
-                return self.__empty__
+                return None, None, None
 
         if sta is None or self.curr_quake is None:
-            return self.__empty__
-        return self.__load_seismograms__(net, sta, self.curr_quake)
+            return None, None, None
+        return net, sta, self.curr_quake
+    def load_seismograms(self, net, sta, quake):
+        return self.__load_seismograms__(net, sta, quake)
+    def seek(self, quake_index, station_index=0):
+        self.quake_itr.seek(quake_index)
+        self.curr_quake = self.quake_itr.next()
+        self.station_itr.set_quake(self.curr_quake)
+        self.station_itr.seek(station_index)
+    def seek_to(self, event_id, net_sta=None):
+        self.quake_itr.seek_to(event_id)
+        self.curr_quake = self.quake_itr.next()
+        self.station_itr.set_quake(self.curr_quake)
+        if net_sta is None:
+            self.station_itr.beginning()
+        else:
+            self.station_itr.seek_to(net_sta)
     def quake_iterator(self):
         return self.quake_itr
     def station_iterator(self):
         return self.station_itr
     def __load_seismograms__(self, net, sta, quake, query_params={}):
-        print(f"search in {self.mseed_dir} for {net.code}.{sta.code}.*__*__*.mseed")
-        mseed_list = list(self.mseed_dir.glob(f"{net.code}.{sta.code}.*__*__*.mseed"))
+        window = self.time_window(net, sta, quake)
+        if window is None:
+            mseed_list = self.file_index.files_for(net.code, sta.code)
+        else:
+            mseed_list = self.file_index.files_for(net.code, sta.code, *window)
         waveforms = Stream()
         for mseedfile in mseed_list:
-            st = obspyread(mseedfile, format="MSEED")
+            if window is None:
+                st = obspyread(mseedfile, format="MSEED")
+            else:
+                st = read_mseed_window(mseedfile, *window)
             if st is not None:
                 waveforms += st
         return net, sta, quake, waveforms
-    def quake_iterator(self):
-        return self.quake_itr
-    def station_iterator(self):
-        return self.station_itr
+    def time_window(self, net, sta, quake):
+        if self.start_offset is None and self.end_offset is None:
+            return None
+        origin = quake.preferred_origin()
+        if origin is None:
+            return None
+        s_time = origin.time + self.start_offset if self.start_offset is not None else None
+        e_time = origin.time + self.end_offset if self.end_offset is not None else None
+        return s_time, e_time
+    def is_available(self, net, sta, quake):
+        if not self.check_availability:
+            return True
+        window = self.time_window(net, sta, quake)
+        if window is None:
+            return (net.code, sta.code) in self.file_index.stations()
+        return len(self.file_index.files_for(net.code, sta.code, *window)) > 0
 
 
 class CacheSeismogramIterator(SeismogramIterator):
     """
     Very simple cache, remembers prev, curr and next data
-    for up to size items
+    for up to size items each way. If max_bytes is given, items farthest
+    from the current one are also dropped, from either direction, to keep
+    the trace data in memory under that many bytes.
     """
-    def __init__(self, sub_itr, size=10):
+    def __init__(self, sub_itr, size=10, max_bytes=None):
         self.sub_itr = sub_itr
         self.size = size
+        self.max_bytes = max_bytes
         self.__curr_data__ = None
-        self.__prev_cache__ = deque([], size)
-        self.__next_cache__ = deque([], size)
+        # how far the sub iterator is ahead (+) or behind (-) the current item
+        self.__offset__ = 0
+        self.__prev_cache__ = deque([])
+        self.__next_cache__ = deque([])
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resident_bytes = 0
     def next(self):
         if self.__curr_data__ is not None:
-            self.__prev_cache__.append(self.__curr_data__)
+            self.__push__(self.__prev_cache__, self.__curr_data__)
         if len(self.__next_cache__) > 0:
             self.__curr_data__ = self.__next_cache__.pop()
+            self.__offset__ -= 1
+            self.hits += 1
         else:
-            self.__curr_data__ = self.sub_itr.next()
+            self.__curr_data__ = self.__load_relative__(1)
+            self.misses += 1
+            self.resident_bytes += data_bytes(self.__curr_data__)
+        self.__check_budget__()
         return self.__curr_data__
     def prev(self):
         if self.__curr_data__ is not None:
-            self.__next_cache__.append(self.__curr_data__)
+            self.__push__(self.__next_cache__, self.__curr_data__)
         if len(self.__prev_cache__) > 0:
             self.__curr_data__ = self.__prev_cache__.pop()
+            self.__offset__ += 1
+            self.hits += 1
         else:
-            self.__curr_data__ = self.sub_itr.prev()
+            self.__curr_data__ = self.__load_relative__(-1)
+            self.misses += 1
+            self.resident_bytes += data_bytes(self.__curr_data__)
+        self.__check_budget__()
         return self.__curr_data__
+    def seek(self, quake_index, station_index=0):
+        self.sub_itr.seek(quake_index, station_index)
+        self.__clear__()
+    def seek_to(self, event_id, net_sta=None):
+        self.sub_itr.seek_to(event_id, net_sta)
+        self.__clear__()
+    def stats(self):
+        """
+        Hit, miss and eviction counts plus current memory use, to help
+        size the cache.
+        """
+        items = len(self.__prev_cache__) + len(self.__next_cache__)
+        if self.__curr_data__ is not None:
+            items += 1
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "resident_bytes": self.resident_bytes,
+            "items": items,
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+        }
+    def quake_iterator(self):
+        return self.sub_itr.quake_iterator()
+    def station_iterator(self):
+        return self.sub_itr.station_iterator()
+    def __load_relative__(self, target):
+        """
+        Moves the sub iterator to target, relative to the current item, and
+        returns its data. Usually this is a single step, but it takes more
+        if items between the sub iterator and target were evicted.
+        """
+        steps = target - self.__offset__
+        if steps == 0:
+            # sub iterator is on target, but its data was evicted
+            if target > 0:
+                self.sub_itr.prev()
+                steps = 1
+            else:
+                self.sub_itr.next()
+                steps = -1
+        data = None
+        while steps > 0:
+            data = self.sub_itr.next()
+            steps -= 1
+        while steps < 0:
+            data = self.sub_itr.prev()
+            steps += 1
+        self.__offset__ = 0
+        return data
+    def __clear__(self):
+        # cached items are no longer next to the sub iterator position
+        self.__prev_cache__.clear()
+        self.__next_cache__.clear()
+        self.__curr_data__ = None
+        self.__offset__ = 0
+        self.resident_bytes = 0
+    def __push__(self, cache, item):
+        cache.append(item)
+        if len(cache) > self.size:
+            self.__evict__(cache)
+    def __evict__(self, cache):
+        item = cache.popleft()
+        self.resident_bytes -= data_bytes(item)
+        self.evictions += 1
+    def __check_budget__(self):
+        if self.max_bytes is None:
+            return
+        while self.resident_bytes > self.max_bytes \
+                and len(self.__prev_cache__) + len(self.__next_cache__) > 0:
+            # drop the item farthest from current, from the longer side
+            if len(self.__prev_cache__) >= len(self.__next_cache__):
+                self.__evict__(self.__prev_cache__)
+            else:
+                self.__evict__(self.__next_cache__)
+
+
+def data_bytes(item):
+    """
+    Bytes used by the trace data in a net, sta, quake, waveforms item.
+    """
+    if item is None or item[3] is None:
+        return 0
+    return sum(tr.data.nbytes for tr in item[3])
+
+
+class PrefetchSeismogramIterator(SeismogramIterator):
+    """
+    Loads waveforms for the next few stations of the current quake in
+    background threads while the current one is being picked. The sub
+    iterator must be able to move without loading, like
+    FDSNSeismogramIterator or MDLSeismogramIterator.
+    Prefetching never goes past the last station of the current quake, and
+    loads not yet started are cancelled when the quake changes, for example
+    after V or R.
+
+    lookahead -- number of upcoming stations to load in advance
+    workers -- max number of threads loading at the same time
+    """
+    def __init__(self, sub_itr, lookahead=4, workers=2):
+        self.__empty__ = None, None, None, []
+        self.sub_itr = sub_itr
+        self.lookahead = lookahead
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="pickax-prefetch")
+        self.__pending__ = {}
+        self.__pending_quake__ = None
+    def next(self):
+        net, sta, quake = self.next_position()
+        if sta is None or quake is None:
+            return self.__empty__
+        result = self.load_seismograms(net, sta, quake)
+        self.prefetch()
+        return result
+    def prev(self):
+        net, sta, quake = self.prev_position()
+        if sta is None or quake is None:
+            return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def next_position(self):
+        net, sta, quake = self.sub_itr.next_position()
+        self.__check_quake__(quake)
+        return net, sta, quake
+    def prev_position(self):
+        net, sta, quake = self.sub_itr.prev_position()
+        self.__check_quake__(quake)
+        return net, sta, quake
+    def load_seismograms(self, net, sta, quake):
+        future = None
+        if quake is self.__pending_quake__:
+            future = self.__pending__.pop(self.__station_key__(net, sta), None)
+        if future is not None and not future.cancelled():
+            return future.result()
+        return self.sub_itr.load_seismograms(net, sta, quake)
+    def prefetch(self):
+        """
+        Starts loading the stations following the current one, within the
+        current quake, skipping those the sub iterator knows have no data.
+        The station iterator is stepped forward to find them and then back
+        again, so its position is unchanged.
+        """
+        quake = self.__pending_quake__
+        sta_itr = self.sub_itr.station_iterator()
+        if quake is None or sta_itr is None or self.lookahead <= 0:
+            return
+        upcoming = []
+        steps = 0
+        while len(upcoming) < self.lookahead:
+            net, sta = sta_itr.next()
+            steps += 1
+            if sta is None:
+                break
+            if self.sub_itr.is_available(net, sta, quake):
+                upcoming.append((net, sta))
+        for i in range(steps):
+            sta_itr.prev()
+        keep = {}
+        for net, sta in upcoming:
+            key = self.__station_key__(net, sta)
+            future = self.__pending__.pop(key, None)
+            if future is None:
+                future = self.executor.submit(self.sub_itr.load_seismograms, net, sta, quake)
+            keep[key] = future
+        self.cancel()
+        self.__pending__ = keep
+    def seek(self, quake_index, station_index=0):
+        self.cancel()
+        self.sub_itr.seek(quake_index, station_index)
+    def seek_to(self, event_id, net_sta=None):
+        self.cancel()
+        self.sub_itr.seek_to(event_id, net_sta)
+    def cancel(self):
+        """
+        Cancels any prefetch loads that have not yet started.
+        """
+        for future in self.__pending__.values():
+            future.cancel()
+        self.__pending__ = {}
+    def close(self):
+        """
+        Cancels pending loads and stops the worker threads.
+        """
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    def time_window(self, net, sta, quake):
+        return self.sub_itr.time_window(net, sta, quake)
+    def is_available(self, net, sta, quake):
+        return self.sub_itr.is_available(net, sta, quake)
+    def quake_iterator(self):
+        return self.sub_itr.quake_iterator()
+    def station_iterator(self):
+        return self.sub_itr.station_iterator()
+    def __check_quake__(self, quake):
+        if quake is not self.__pending_quake__:
+            self.cancel()
+            self.__pending_quake__ = quake
+    def __station_key__(self, net, sta):
+        return f"{net.code}.{sta.code}.{sta.start_date}"
+
+
+class AsyncSeismogramIterator:
+    """
+    Asyncio version of a seismogram iterator that can move without
+    loading, like FDSNSeismogramIterator. Moving happens in order, but
+    loads run in worker threads with up to workers at a time, so batch
+    scripts can pull a whole catalog limited by network throughput instead
+    of latency. Iterating gives net, sta, quake, waveforms in order:
+
+        async for net, sta, quake, waveforms in AsyncSeismogramIterator(seis_itr):
+            ...
+
+    workers -- max number of loads running at the same time
+    """
+    def __init__(self, sub_itr, workers=4):
+        self.__empty__ = None, None, None, []
+        self.sub_itr = sub_itr
+        self.workers = workers
+        self.__semaphore__ = asyncio.Semaphore(workers)
+    async def anext(self):
+        net, sta, quake = await asyncio.to_thread(self.sub_itr.next_position)
+        if sta is None or quake is None:
+            return self.__empty__
+        return await self.load_seismograms(net, sta, quake)
+    async def aprev(self):
+        net, sta, quake = await asyncio.to_thread(self.sub_itr.prev_position)
+        if sta is None or quake is None:
+            return self.__empty__
+        return await self.load_seismograms(net, sta, quake)
+    async def load_seismograms(self, net, sta, quake):
+        async with self.__semaphore__:
+            return await asyncio.to_thread(self.sub_itr.load_seismograms, net, sta, quake)
+    async def work_units(self):
+        """
+        Generates the remaining net, sta, quake positions, moving the sub
+        iterator forward but without loading.
+        """
+        while True:
+            net, sta, quake = await asyncio.to_thread(self.sub_itr.next_position)
+            if sta is None or quake is None:
+                return
+            yield net, sta, quake
+    async def load_all(self):
+        """
+        Generates net, sta, quake, waveforms for the remaining positions, in
+        order, while loading up to workers positions ahead.
+        """
+        pending = deque()
+        try:
+            async for net, sta, quake in self.work_units():
+                pending.append(asyncio.ensure_future(self.load_seismograms(net, sta, quake)))
+                if len(pending) > self.workers:
+                    yield await pending.popleft()
+            while len(pending) > 0:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+    def __aiter__(self):
+        return self.load_all()
+    def seek(self, quake_index, station_index=0):
+        self.sub_itr.seek(quake_index, station_index)
+    def seek_to(self, event_id, net_sta=None):
+        self.sub_itr.seek_to(event_id, net_sta)
+    def quake_iterator(self):
+        return self.sub_itr.quake_iterator()
+    def station_iterator(self):
+        return self.sub_itr.station_iterator()
+
+
+class DiskCacheSeismogramIterator(SeismogramIterator):
+    """
+    Saves waveforms loaded by the sub iterator as miniseed in a local
+    directory, so later passes over the same quakes and stations, including
+    from other sessions on the same machine, load from disk. Files are keyed
+    by channels, time window and data center, and the least recently used
+    are removed when over max_bytes. The sub iterator must be able to move
+    without loading, like FDSNSeismogramIterator.
+
+    cache_dir -- directory for the cached files
+    max_bytes -- size budget for the directory
+    cache_empty -- also remember requests that returned no data
+    """
+    def __init__(self, sub_itr, cache_dir, max_bytes=DEFAULT_MAX_BYTES, cache_empty=False):
+        self.__empty__ = None, None, None, []
+        self.sub_itr = sub_itr
+        self.cache = WaveformDiskCache(cache_dir, max_bytes=max_bytes)
+        self.cache_empty = cache_empty
+    def next(self):
+        net, sta, quake = self.next_position()
+        if sta is None or quake is None:
+            return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def prev(self):
+        net, sta, quake = self.prev_position()
+        if sta is None or quake is None:
+            return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def next_position(self):
+        return self.sub_itr.next_position()
+    def prev_position(self):
+        return self.sub_itr.prev_position()
+    def load_seismograms(self, net, sta, quake):
+        key = self.cache_key(net, sta, quake)
+        if key is not None:
+            waveforms = self.cache.get(key)
+            if waveforms is not None:
+                return net, sta, quake, waveforms
+        result = self.sub_itr.load_seismograms(net, sta, quake)
+        waveforms = result[3]
+        if key is not None and result[1] is not None \
+                and (len(waveforms) > 0 or self.cache_empty):
+            self.cache.put(key, waveforms)
+        return result
+    def seek(self, quake_index, station_index=0):
+        self.sub_itr.seek(quake_index, station_index)
+    def seek_to(self, event_id, net_sta=None):
+        self.sub_itr.seek_to(event_id, net_sta)
+    def cache_key(self, net, sta, quake):
+        """
+        Key for the station and quake, or None if the sub iterator does not
+        know the time window before loading.
+        """
+        window = self.sub_itr.time_window(net, sta, quake)
+        if window is None:
+            return None
+        nslc_list = [(net.code, sta.code, c.location_code, c.code) for c in sta.channels]
+        source = getattr(self.sub_itr, "dc_name", self.sub_itr.__class__.__name__)
+        return waveform_cache_key(nslc_list, window[0], window[1], source)
+    def time_window(self, net, sta, quake):
+        return self.sub_itr.time_window(net, sta, quake)
+    def is_available(self, net, sta, quake):
+        return self.sub_itr.is_available(net, sta, quake)
     def quake_iterator(self):
         return self.sub_itr.quake_iterator()
     def station_iterator(self):
@@ -128,13 +600,23 @@ class CacheSeismogramIterator(SeismogramIterator):
 
 
 class FDSNSeismogramIterator(SeismogramIterator):
+    """
+    Seismogram iterator that loads waveforms from a FDSN dataselect web
+    service for each station of each quake.
+
+    start_phases, start_offset -- start of request, comma separated phases or origin, plus offset in seconds
+    end_phases, end_offset -- end of request, comma separated phases or origin, plus offset in seconds
+    bulk_size -- if more than zero, on entering a new quake load all stations with bulk requests of this many stations each, instead of one request per station
+    check_availability -- on entering a new quake, ask the availability web service which stations have data and skip the rest
+    """
     def __init__(self,
                  quake_itr,
                  station_itr,
                  dc_name="IRIS",
                  start_phases="origin", start_offset = 0,
                  end_phases="origin", end_offset=300,
-                 debug=False, timeout=30):
+                 debug=False, timeout=30,
+                 bulk_size=0, check_availability=False):
         self.__empty__ = None, None, None, []
         self.debug = debug
         self.timeout = timeout
@@ -142,51 +624,123 @@ class FDSNSeismogramIterator(SeismogramIterator):
         self.dc_name = dc_name
         self.quake_itr = quake_itr
         self.station_itr = station_itr
+        self.bulk_size = bulk_size
+        self.check_availability = check_availability
+        self.__bulk_lock__ = threading.Lock()
+        self.__quake_stations__ = OrderedDict()
         self.curr_quake = quake_itr.next()
+        self.__set_quake__(self.curr_quake)
         self.start_phases = start_phases
         self.start_offset = start_offset
         self.end_phases = end_phases
         self.end_offset = end_offset
         self.taup_model = TauPyModel(model="ak135")
+        self.__bulk_quake__ = None
+        self.__bulk_data__ = None
+        self.__avail_quake__ = None
+        self.__avail_data__ = None
     def next(self):
-        if self.curr_quake is None:
+        net, sta, quake = self.next_position()
+        if sta is None or quake is None:
             return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def prev(self):
+        net, sta, quake = self.prev_position()
+        if sta is None or quake is None:
+            return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def next_position(self):
+        net, sta, quake = self.__step_next__()
+        while sta is not None and not self.is_available(net, sta, quake):
+            net, sta, quake = self.__step_next__()
+        return net, sta, quake
+    def prev_position(self):
+        net, sta, quake = self.__step_prev__()
+        while sta is not None and not self.is_available(net, sta, quake):
+            net, sta, quake = self.__step_prev__()
+        return net, sta, quake
+    def __step_next__(self):
+        if self.curr_quake is None:
+            return None, None, None
         net, sta = self.station_itr.next()
         if sta is None:
             quake = self.quake_itr.next()
             if quake is None:
-                return self.__empty__
+                return None, None, None
             self.curr_quake = quake
+            self.__set_quake__(quake)
             self.station_itr.beginning()
             net, sta = self.station_itr.next()
         if sta is None or self.curr_quake is None:
-            return self.__empty__
-        return self.__load_seismograms__(net, sta, self.curr_quake, self.query_params)
-    def prev(self):
+            return None, None, None
+        return net, sta, self.curr_quake
+    def __step_prev__(self):
         if self.curr_quake is None:
-            return self.__empty__
+            return None, None, None
         net, sta = self.station_itr.prev()
         if sta is None:
             self.curr_quake = self.quake_itr.prev()
+            self.__set_quake__(self.curr_quake)
             self.station_itr.ending()
             net, sta = self.station_itr.prev()
             if self.curr_quake is None:
-                return self.__empty__
+                return None, None, None
 
         if sta is None or self.curr_quake is None:
-            return self.__empty__
-        return self.__load_seismograms__(net, sta, self.curr_quake, self.query_params)
+            return None, None, None
+        return net, sta, self.curr_quake
+    def load_seismograms(self, net, sta, quake):
+        return self.__load_seismograms__(net, sta, quake, self.query_params)
+    def seek(self, quake_index, station_index=0):
+        self.quake_itr.seek(quake_index)
+        self.curr_quake = self.quake_itr.next()
+        self.__set_quake__(self.curr_quake)
+        self.station_itr.seek(station_index)
+    def seek_to(self, event_id, net_sta=None):
+        self.quake_itr.seek_to(event_id)
+        self.curr_quake = self.quake_itr.next()
+        self.__set_quake__(self.curr_quake)
+        if net_sta is None:
+            self.station_itr.beginning()
+        else:
+            self.station_itr.seek_to(net_sta)
     def quake_iterator(self):
         return self.quake_itr
     def station_iterator(self):
         return self.station_itr
-    def __load_seismograms__(self, net, sta, quake, query_params={}):
-        if len(sta.channels) == 0:
-            return []
-        client = Client(self.dc_name, _discover_services=False, debug=self.debug, timeout=self.timeout)
+    def __set_quake__(self, quake):
+        """
+        Sets the quake on the station iterator, and for bulk or availability
+        requests keeps the stations it gives for the quake, as loads for the
+        quake may still run in the background after it has moved on.
+        """
+        self.station_itr.set_quake(quake)
+        if quake is None or (self.bulk_size <= 0 and not self.check_availability):
+            return
+        net_sta_list = self.station_itr.all_net_sta()
+        with self.__bulk_lock__:
+            self.__quake_stations__[id(quake)] = (quake, net_sta_list)
+            self.__quake_stations__.move_to_end(id(quake))
+            while len(self.__quake_stations__) > QUAKE_STATIONS_KEPT:
+                self.__quake_stations__.popitem(last=False)
+    def __net_sta_for__(self, quake):
+        """
+        Stations kept for the quake when it was set, or the station
+        iterator's current ones if it never was. Called with the lock held.
+        """
+        kept = self.__quake_stations__.get(id(quake))
+        if kept is not None and kept[0] is quake:
+            return kept[1]
+        return self.station_itr.all_net_sta()
+    def time_window(self, net, sta, quake):
+        """
+        Start and end time of the request for the station and quake, based
+        on the start and end phases and offsets. None if the quake has no
+        origin or a phase does not arrive at the station.
+        """
         origin = quake.preferred_origin()
         if origin is None:
-            return self.__empty__
+            return None
         dist_deg = locations2degrees(sta.latitude, sta.longitude, origin.latitude, origin.longitude)
         s_time = origin.time + self.start_offset
         if self.start_phases != "origin":
@@ -194,7 +748,7 @@ class FDSNSeismogramIterator(SeismogramIterator):
                                       distance_in_degree=dist_deg,
                                       phase_list=self.start_phases.split(","))
             if len(arrivals) == 0:
-                return self.__empty__
+                return None
             s_time = s_time + arrivals[0].time
         e_time = origin.time + self.end_offset
         if self.end_phases != "origin":
@@ -202,8 +756,30 @@ class FDSNSeismogramIterator(SeismogramIterator):
                                       distance_in_degree=dist_deg,
                                       phase_list=self.end_phases.split(","))
             if len(arrivals) == 0:
-                return self.__empty__
+                return None
             e_time = e_time + arrivals[0].time
+        return s_time, e_time
+    def __load_seismograms__(self, net, sta, quake, query_params={}):
+        if len(sta.channels) == 0:
+            return net, sta, quake, Stream()
+        if self.bulk_size > 0:
+            bulk_data = self.__bulk_for_quake__(quake)
+            if bulk_data is not None:
+                return net, sta, quake, bulk_data.get((net.code, sta.code), Stream())
+        client = get_client(self.dc_name, debug=self.debug, timeout=self.timeout)
+        waveforms = self.__station_request__(client, net, sta, quake)
+        if waveforms is None:
+            return self.__empty__
+        return net, sta, quake, waveforms
+    def __station_request__(self, client, net, sta, quake):
+        """
+        Waveforms for the channels of one station, or None if the station
+        has no time window for the quake.
+        """
+        window = self.time_window(net, sta, quake)
+        if window is None:
+            return None
+        s_time, e_time = window
         locs = set()
         chans = set()
         for c in sta.channels:
@@ -221,7 +797,132 @@ class FDSNSeismogramIterator(SeismogramIterator):
                 waveforms = Stream()
         except FDSNNoDataException:
             waveforms = Stream()
-        return net, sta, quake, waveforms
+        return waveforms
+    def __bulk_for_quake__(self, quake):
+        with self.__bulk_lock__:
+            if self.__bulk_quake__ is not quake:
+                self.__bulk_data__ = self.__load_bulk__(quake, self.__net_sta_for__(quake))
+                self.__bulk_quake__ = quake
+            return self.__bulk_data__
+    def __load_bulk__(self, quake, net_sta_list):
+        """
+        Loads waveforms for every station of the quake using bulk dataselect
+        requests of up to bulk_size stations each, split by net and sta code.
+        Returns None if the station iterator cannot list all of its stations.
+
+        net_sta_list -- stations of the quake, as kept when it was set
+        """
+        if net_sta_list is None:
+            return None
+        client = get_client(self.dc_name, debug=self.debug, timeout=self.timeout)
+        bulk_data = {}
+        for chunk_start in range(0, len(net_sta_list), self.bulk_size):
+            chunk = net_sta_list[chunk_start:chunk_start+self.bulk_size]
+            bulk = self.__bulk_request__(quake, chunk)
+            if len(bulk) == 0:
+                continue
+            try:
+                waveforms = client.get_waveforms_bulk(bulk)
+            except FDSNNoDataException:
+                continue
+            except FDSNException as e:
+                print(f"WARN: bulk request failed, loading {len(chunk)} stations one at a time: {e}")
+                waveforms = self.__load_chunk_by_station__(client, quake, chunk)
+            for tr in waveforms:
+                key = (tr.stats.network, tr.stats.station)
+                if key not in bulk_data:
+                    bulk_data[key] = Stream()
+                bulk_data[key].append(tr)
+        return bulk_data
+    def __load_chunk_by_station__(self, client, quake, net_sta_list):
+        """
+        Waveforms for the stations with one request each, for when a bulk
+        request failed, skipping any station whose request fails too.
+        """
+        waveforms = Stream()
+        for net, sta in net_sta_list:
+            if len(sta.channels) == 0:
+                continue
+            try:
+                sta_waveforms = self.__station_request__(client, net, sta, quake)
+            except FDSNException as e:
+                print(f"WARN: request failed, skipping {net.code}.{sta.code}: {e}")
+                continue
+            if sta_waveforms is not None:
+                waveforms += sta_waveforms
+        return waveforms
+    def __bulk_request__(self, quake, net_sta_list):
+        """
+        Bulk request lines, net, sta, loc, chan, start, end, for the
+        channels of the stations, skipping stations without a time window.
+        """
+        bulk = []
+        seen = set()
+        for net, sta in net_sta_list:
+            window = self.time_window(net, sta, quake)
+            if window is None:
+                continue
+            s_time, e_time = window
+            if e_time <= s_time:
+                print(f"WARN: start time for request after end time, skipping: {net.code} {sta.code} {s_time} {e_time}")
+                continue
+            for c in sta.channels:
+                nslc = (net.code, sta.code, c.location_code, c.code)
+                if nslc not in seen:
+                    seen.add(nslc)
+                    bulk.append((*nslc, s_time, e_time))
+        return bulk
+    def is_available(self, net, sta, quake):
+        if not self.check_availability:
+            return True
+        available = self.__availability_for_quake__(quake)
+        return available is None or (net.code, sta.code) in available
+    def __availability_for_quake__(self, quake):
+        with self.__bulk_lock__:
+            if self.__avail_quake__ is not quake:
+                self.__avail_data__ = self.__load_availability__(quake, self.__net_sta_for__(quake))
+                self.__avail_quake__ = quake
+            return self.__avail_data__
+    def __load_availability__(self, quake, net_sta_list):
+        """
+        Set of net and sta codes with data for the quake, from a single
+        availability query covering every station. Returns None, so nothing
+        is skipped, if the stations cannot be listed or the data center
+        does not have an availability service.
+
+        net_sta_list -- stations of the quake, as kept when it was set
+        """
+        if net_sta_list is None:
+            return None
+        bulk = self.__bulk_request__(quake, net_sta_list)
+        available = set()
+        if len(bulk) == 0:
+            return available
+        client = get_client(self.dc_name, debug=self.debug, timeout=self.timeout)
+        url = f"{client.base_url}/fdsnws/availability/1/query"
+        lines = ["format=text", "merge=quality,samplerate"]
+        for n, s, l, c, s_time, e_time in bulk:
+            loc = l if len(l) > 0 else "--"
+            lines.append(f"{n} {s} {loc} {c} {s_time.isoformat()} {e_time.isoformat()}")
+        try:
+            resp = http_session().post(url, data="\n".join(lines), timeout=self.timeout)
+        except Exception as e:
+            print(f"WARN: availability query failed, not skipping stations: {e}")
+            return None
+        record_request(url, len(resp.content))
+        if resp.status_code == 204:
+            return available
+        if resp.status_code != 200:
+            print(f"WARN: availability query failed, not skipping stations: {resp.status_code} {url}")
+            return None
+        for line in resp.text.splitlines():
+            items = line.split()
+            if len(items) < 2 or line.startswith("#"):
+                continue
+            available.add((items[0], items[1]))
+        if self.debug:
+            print(f"Availability: {len(available)} of {len(net_sta_list)} stations have data")
+        return available
 
 class ThreeAtATime(SeismogramIterator):
     """
@@ -277,6 +978,14 @@ class ThreeAtATime(SeismogramIterator):
             return self.cur_net, self.cur_sta, self.cur_quake, self.sub_waveforms[self.sub_idx]
         else:
             return self.cur_net, self.cur_sta, self.cur_quake, []
+    def seek(self, quake_index, station_index=0):
+        self.sub_itr.seek(quake_index, station_index)
+        self.sub_waveforms = []
+        self.sub_idx = -1
+    def seek_to(self, event_id, net_sta=None):
+        self.sub_itr.seek_to(event_id, net_sta)
+        self.sub_waveforms = []
+        self.sub_idx = -1
     def quake_iterator(self):
         return self.sub_itr.quake_iterator()
     def station_iterator(self):
@@ -11,7 +11,8 @@ from .pick_util import (
     pick_to_string,
     pick_from_trace,
     arrival_for_pick,
-    create_pick_on_stream
+    create_pick_on_stream,
+    event_index
     )
 from .pickax_config import TRACE_AMP, GLOBAL_AMP, RELATIVE_TIME, ABSOLUTE_TIME
 
@@ -115,16 +116,14 @@ class Seismograph:
         """
         sta_code = self.stream[0].stats.station
         net_code = self.stream[0].stats.network
-        return filter(lambda p: p.waveform_id.network_code == net_code and p.waveform_id.station_code == sta_code, self.qmlevent.picks)
+        return event_index(self.qmlevent).picks_for_station(f"{net_code}.{sta_code}")
     def channel_picks(self):
         """
         Finds all picks in the earthquake whose waveform_id matches the
         streams network, station, location and channel codes.
         """
-        loc_code = self.stream[0].stats.location
-        chan_code = self.stream[0].stats.channel
-        sta_picks = self.station_picks()
-        return filter(lambda p: p.waveform_id.location_code == loc_code and p.waveform_id.channel_code == chan_code, sta_picks)
+        stats = self.stream[0].stats
+        return event_index(self.qmlevent).picks_for_channel(f"{stats.network}.{stats.station}.{stats.location}.{stats.channel}")
     def draw_origin_flag(self):
         """
         Draws flag for the origin.
@@ -169,8 +168,7 @@ class Seismograph:
                                        creation_info=self.config.creation_info,
                                        filter_name=filter_name)
 
-        self.qmlevent.picks.append(pick)
-        self.qmlevent.amplitudes.append(amp)
+        event_index(self.qmlevent).add_pick(pick, amp)
         return pick
     def draw_flag(self, time, label_str, color="black"):
         if self.config.time_mode == ABSOLUTE_TIME:
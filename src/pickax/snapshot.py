@@ -0,0 +1,172 @@
+import hashlib
+import os
+import pickle
+import threading
+from pathlib import Path
+
+import obspy
+from obspy import read_events, read_inventory
+from obspy.core.event import ResourceIdentifier
+
+from .atomic_file import atomic_write
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_SUFFIX = ".pickax.snap"
+SNAPSHOT_MAGIC = b"PICKAXSNAP"
+
+_lock = threading.Lock()
+_enabled = False
+_snapshot_dir = None
+
+def default_snapshot_dir():
+    """
+    Per user cache directory for snapshots, under XDG_CACHE_HOME or
+    ~/.cache.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = Path.home() / ".cache"
+    return Path(cache_home) / "pickax" / "snapshots"
+
+def configure_snapshots(enabled=True, snapshot_dir=None):
+    """
+    Turns snapshots of parsed StationXML and QuakeML on or off, they are
+    off unless turned on. Snapshots are saved in snapshot_dir, by default
+    a per user cache directory, never next to the data, and are only
+    readable by the user.
+    """
+    global _enabled, _snapshot_dir
+    with _lock:
+        _enabled = enabled
+        _snapshot_dir = Path(snapshot_dir) if snapshot_dir is not None else default_snapshot_dir()
+        if enabled:
+            _snapshot_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+def snapshot_path(path, stat):
+    """
+    File for the snapshot of the source file, keyed by its path,
+    modification time and size.
+    """
+    key = f"{Path(path).resolve()}|{stat.st_mtime_ns}|{stat.st_size}"
+    name = hashlib.sha1(key.encode()).hexdigest()
+    return _snapshot_dir / name[:2] / f"{name}{SNAPSHOT_SUFFIX}"
+
+def load_with_snapshot(path, kind, reader, restore=None):
+    """
+    Object parsed from the file by reader, taken from a snapshot if one
+    was saved for the file at the same path, modification time and size,
+    with the same snapshot version and the same obspy version. Otherwise
+    the file is parsed and, if snapshots are on, the snapshot saved for
+    next time. Snapshots are pickles, so the snapshot directory must only
+    be writable by the user.
+
+    path -- source file
+    kind -- name of what is parsed, a snapshot of another kind is not used
+    reader -- function of the path that parses the file
+    restore -- optional function applied to an object loaded from a snapshot
+    """
+    if not _enabled or not isinstance(path, (str, os.PathLike)):
+        return reader(path)
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return reader(path)
+    snap_path = snapshot_path(path, stat)
+    header = _snapshot_header(kind, path, stat)
+    obj = _read_snapshot(snap_path, header)
+    if obj is not None:
+        if restore is not None:
+            restore(obj)
+        return obj
+    obj = reader(path)
+    _write_snapshot(snap_path, header, obj)
+    return obj
+
+def read_events_snapshot(path, **kwargs):
+    """
+    Like obspy read_events, but using a snapshot of an earlier parse of
+    the same file when there is one.
+    """
+    kind = f"events {sorted(kwargs.items())}"
+    return load_with_snapshot(path, kind, lambda p: read_events(p, **kwargs),
+                              restore=_scope_resource_ids)
+
+def read_inventory_snapshot(path, **kwargs):
+    """
+    Like obspy read_inventory, but using a snapshot of an earlier parse of
+    the same file when there is one.
+    """
+    kind = f"inventory {sorted(kwargs.items())}"
+    return load_with_snapshot(path, kind, lambda p: read_inventory(p, **kwargs))
+
+def _scope_resource_ids(catalog):
+    # resource ids are saved as plain ids, bind them to the objects in
+    # each event so preferred_origin() and the like work
+    for event in catalog:
+        event.scope_resource_ids()
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """
+    Saves obspy resource ids as just the id string, the pickled internal
+    keys of a ResourceIdentifier do not survive into another process.
+    """
+    def persistent_id(self, obj):
+        if isinstance(obj, ResourceIdentifier):
+            return ("rid", obj.id)
+        return None
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        kind, value = pid
+        if kind == "rid":
+            return ResourceIdentifier(value)
+        raise pickle.UnpicklingError(f"unknown persistent id {kind}")
+
+
+def _snapshot_header(kind, path, stat):
+    return {
+        "version": SNAPSHOT_VERSION,
+        "obspy": obspy.__version__,
+        "kind": kind,
+        "source": str(path.resolve()),
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+def _is_private(path):
+    # a snapshot another user could have written is never unpickled
+    if os.name != "posix":
+        return True
+    stat = path.stat()
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+def _read_snapshot(snap_path, header):
+    try:
+        if not _is_private(snap_path):
+            print(f"WARN: ignoring snapshot {snap_path}, not private to this user")
+            return None
+        with open(snap_path, "rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            if pickle.load(f) != header:
+                return None
+            return _SnapshotUnpickler(f).load()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"WARN: unable to read snapshot {snap_path}, parsing source: {e}")
+        return None
+
+def _write_snapshot(snap_path, header, obj):
+    def write(f):
+        f.write(SNAPSHOT_MAGIC)
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        _SnapshotPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    try:
+        snap_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        atomic_write(snap_path, write, binary=True)
+    except Exception as e:
+        print(f"WARN: unable to save snapshot {snap_path}: {e}")
@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
-from obspy.clients.fdsn import Client
-from obspy import Inventory, read_inventory
+import numpy as np
+from obspy import Inventory
 from obspy.clients.fdsn.header import FDSNNoDataException
 from pathlib import Path
+from .client_pool import get_client
+from .snapshot import read_inventory_snapshot
+from .station_table import StationTable
+from .distaz import distaz_arrays
 
 
 class StationIterator(ABC):
@@ -20,6 +24,43 @@ class StationIterator(ABC):
         pass
     def all_stations(self):
         return None
+    def all_net_sta(self):
+        """
+        List of (net, sta) tuples for every station, in iteration order,
+        or None if not known without iterating.
+        """
+        return None
+    def set_quake(self, quake):
+        """
+        Called by the seismogram iterator when it moves to a new quake,
+        before the stations are stepped through for it.
+        """
+        pass
+    def seek(self, index):
+        """
+        Moves so the next call to next() returns the station at index.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support seek")
+    def seek_to(self, net_sta):
+        """
+        Moves so the next call to next() returns the station with the
+        NET.STA code. Raises ValueError if not found.
+        """
+        idx = self.index_of(net_sta)
+        if idx is None:
+            raise ValueError(f"station {net_sta} not found")
+        self.seek(idx)
+    def index_of(self, net_sta):
+        """
+        Index of the station with the NET.STA code, or None if not found.
+        """
+        all_net_sta = self.all_net_sta()
+        if all_net_sta is None:
+            return None
+        for idx, (net, sta) in enumerate(all_net_sta):
+            if f"{net.code}.{sta.code}" == net_sta:
+                return idx
+        return None
 
 class StationXMLIterator(StationIterator):
     def __init__(self, inv, debug=False):
@@ -28,6 +69,8 @@ class StationXMLIterator(StationIterator):
         self.net_idx = 0
         self.sta_idx = -1
         self.inv = inv
+        self.__table__ = None
+        self.__table_inv__ = None
     def current(self):
         return self.inv.networks[self.net_idx], self.inv.networks[self.net_idx].stations[self.sta_idx]
     def next(self):
@@ -51,25 +94,47 @@ class StationXMLIterator(StationIterator):
     def beginning(self):
         self.net_idx = 0
         self.sta_idx = -1
+    def seek(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError(f"station index {index} out of range, {len(self)} stations")
+        self.net_idx, sta_idx = self.__positions__[index]
+        self.sta_idx = sta_idx - 1
     def ending(self):
         self.net_idx = len(self.inv.networks)-1
         self.sta_idx = len(self.inv.networks[self.net_idx].stations)
     def __len__(self):
-        count = 0
-        for n in self.inv.networks:
-            count += len(n.stations)
-        return count
+        return len(self.station_table())
+    def station_table(self):
+        """
+        Coordinates of all the stations as numpy columns, built once per
+        inventory.
+        """
+        if self.__table__ is None or self.__table_inv__ is not self.inv:
+            self.__net_sta__ = [(n, s) for n in self.inv.networks for s in n.stations]
+            self.__positions__ = [(net_idx, sta_idx)
+                                  for net_idx, n in enumerate(self.inv.networks)
+                                  for sta_idx in range(len(n.stations))]
+            self.__table__ = StationTable(self.__net_sta__)
+            self.__table_inv__ = self.inv
+        return self.__table__
+    def distaz_to_quake(self, quake):
+        """
+        Distance, azimuth and back azimuth arrays from every station, in
+        iteration order, to the quake's preferred origin.
+        """
+        return self.station_table().distaz_to_quake(quake)
+    def index_of(self, net_sta):
+        return self.station_table().index_of(net_sta)
     def all_stations(self):
-        all_sta = []
-        for n in self.inv.networks:
-            for s in n.stations:
-                all_sta.append(s)
-        return all_sta
+        return [sta for net, sta in self.all_net_sta()]
+    def all_net_sta(self):
+        self.station_table()
+        return list(self.__net_sta__)
 
 
 class StationXMLFileIterator(StationXMLIterator):
     def __init__(self, filename):
-        super().__init__(read_inventory(filename))
+        super().__init__(read_inventory_snapshot(filename))
 
 class FDSNStationIterator(StationXMLIterator):
     def __init__(self, query_params, dc_name="IRIS", debug=False):
@@ -83,56 +148,169 @@ class FDSNStationIterator(StationXMLIterator):
 
     def __load__(self):
         try:
-            client = Client(self.dc_name, _discover_services=False, debug=self.debug)
+            client = get_client(self.dc_name, debug=self.debug)
             return client.get_stations(**self.query_params)
         except FDSNNoDataException:
             return Inventory()
 
 class StationXMLDirectoryIterator(StationXMLIterator):
+    """
+    Iterates the stations in all StationXML files in a directory. Every
+    file is parsed once, when created, to build a flat list of (file, net,
+    sta) positions and the table of station coordinates, so moving,
+    seeking and len() do not depend on how the stations are split into
+    files. The parsed inventories are kept, so moving never parses a file
+    again.
+    """
     def __init__(self, dir, pattern="**/*.xml"):
+        self.__empty__ = None, None
         self.root_dir = Path(dir)
         self.pattern = pattern
         self.stamlfiles = list(self.root_dir.glob(pattern))
-        self.curr_itr = None
-        self.idx = -1
-        self.net = None
-        self.sta = None
+        self.__inventories__ = []
+        self.positions = []
+        net_sta = []
+        for file_idx, staxmlfile in enumerate(self.stamlfiles):
+            inv = read_inventory_snapshot(staxmlfile)
+            self.__inventories__.append(inv)
+            for net_idx, n in enumerate(inv.networks):
+                for sta_idx, s in enumerate(n.stations):
+                    self.positions.append((file_idx, net_idx, sta_idx))
+                    net_sta.append((n, s))
+        self.__all_net_sta__ = net_sta
+        self.__table__ = StationTable(net_sta)
+        self.pos = -1
+        self.inv = None
+    def inventory(self, file_idx):
+        """
+        Parsed inventory for the file.
+        """
+        return self.__inventories__[file_idx]
+    def current(self):
+        return self.__at__(self.pos)
     def next(self):
-        net = None
-        sta = None
-        while sta is None and self.idx < len(self.stamlfiles):
-            if self.curr_itr is None:
-                self.idx += 1
-                if self.idx < len(self.stamlfiles):
-                    self.curr_itr = StationXMLFileIterator(self.stamlfiles[self.idx])
-                else:
-                    break
-            net, sta = self.curr_itr.next()
-            if sta is None:
-                self.curr_itr = None
-            else:
-                self.inv = self.curr_itr.inv
-        return net, sta
+        self.pos = min(self.pos + 1, len(self.positions))
+        return self.__at__(self.pos)
     def prev(self):
-        net = None
-        sta = None
-        while sta is None and self.idx > 0:
-            if self.curr_itr is None:
-                self.idx -= 1
-                self.curr_itr = StationXMLFileIterator(self.stamlfiles[self.idx])
-            net, sta = self.curr_itr.prev()
-            if sta is None:
-                self.curr_itr = None
-        return net, sta
+        self.pos = max(self.pos - 1, -1)
+        return self.__at__(self.pos)
     def beginning(self):
-        self.idx = -1
-        self.curr_itr = None
+        self.pos = -1
     def ending(self):
-        net = None
-        sta = None
-        self.idx = len(self.stamlfiles)-1
-        self.curr_itr = StationXMLFileIterator(self.stamlfiles[self.idx])
-        self.curr_itr.ending()
+        self.pos = len(self.positions)
+    def seek(self, index):
+        if index < 0 or index >= len(self.positions):
+            raise IndexError(f"station index {index} out of range, {len(self.positions)} stations")
+        self.pos = index - 1
+    def __len__(self):
+        return len(self.positions)
+    def station_table(self):
+        return self.__table__
+    def all_stations(self):
+        return [sta for net, sta in self.all_net_sta()]
+    def all_net_sta(self):
+        return list(self.__all_net_sta__)
+    def __at__(self, pos):
+        if pos < 0 or pos >= len(self.positions):
+            return self.__empty__
+        self.inv = self.inventory(self.positions[pos][0])
+        return self.__all_net_sta__[pos]
+
+class DistanceStationIterator(StationIterator):
+    """
+    Iterates the stations of another station iterator that are within a
+    distance range of the current quake, nearest first or ordered by
+    azimuth from the quake. The order and selection are redone, with
+    vectorized distances over all stations, each time the seismogram
+    iterator moves to a new quake, so stations outside the range are
+    never requested. Before any quake is set, all stations are used in
+    the order of the sub iterator. With a max_dist, candidate stations
+    come from the table's spatial index instead of checking every station.
+
+    sta_itr -- station iterator that can list all of its stations
+    min_dist, max_dist -- optional distance range in degrees
+    order_by -- "distance", "azimuth" or None to keep the sub iterator order
+    """
+    def __init__(self, sta_itr, min_dist=None, max_dist=None, order_by="distance"):
+        if order_by not in ("distance", "azimuth", None):
+            raise ValueError(f"order_by must be distance, azimuth or None: {order_by}")
+        self.__empty__ = None, None
+        self.sta_itr = sta_itr
+        self.min_dist = min_dist
+        self.max_dist = max_dist
+        self.order_by = order_by
+        self.__net_sta__ = sta_itr.all_net_sta()
+        if self.__net_sta__ is None:
+            raise ValueError(f"{sta_itr.__class__.__name__} cannot list its stations")
+        if hasattr(sta_itr, "station_table"):
+            self.table = sta_itr.station_table()
+        else:
+            self.table = StationTable(self.__net_sta__)
+        self.quake = None
+        self.order = np.arange(len(self.table))
+        self.distances = None
+        self.azimuths = None
+        self.pos = -1
+    def set_quake(self, quake):
+        if quake is self.quake:
+            return
+        self.quake = quake
+        self.pos = -1
+        origin = quake.preferred_origin() if quake is not None else None
+        if origin is None:
+            self.order = np.arange(len(self.table))
+            self.distances = None
+            self.azimuths = None
+            return
+        if self.max_dist is not None:
+            # only compute distances for the stations near the quake
+            order = self.table.spatial_index().within(origin.latitude, origin.longitude,
+                                                      self.max_dist, self.min_dist)
+        else:
+            order = np.arange(len(self.table))
+        delta, az, baz = distaz_arrays(self.table.latitude[order], self.table.longitude[order],
+                                       origin.latitude, origin.longitude)
+        if self.max_dist is None and self.min_dist is not None:
+            keep = delta >= self.min_dist
+            order, delta, az = order[keep], delta[keep], az[keep]
+        if self.order_by == "distance":
+            sort_idx = np.argsort(delta, kind="stable")
+        elif self.order_by == "azimuth":
+            sort_idx = np.argsort(az, kind="stable")
+        else:
+            sort_idx = np.arange(len(order))
+        self.order = order[sort_idx]
+        self.distances = delta[sort_idx]
+        self.azimuths = az[sort_idx]
+    def current(self):
+        return self.__at__(self.pos)
+    def next(self):
+        self.pos = min(self.pos + 1, len(self.order))
+        return self.__at__(self.pos)
+    def prev(self):
+        self.pos = max(self.pos - 1, -1)
+        return self.__at__(self.pos)
+    def beginning(self):
+        self.pos = -1
+    def ending(self):
+        self.pos = len(self.order)
+    def seek(self, index):
+        if index < 0 or index >= len(self.order):
+            raise IndexError(f"station index {index} out of range, {len(self.order)} stations")
+        self.pos = index - 1
+    def __len__(self):
+        return len(self.order)
+    @property
+    def inv(self):
+        return self.sta_itr.inv
+    def all_stations(self):
+        return [sta for net, sta in self.all_net_sta()]
+    def all_net_sta(self):
+        return [self.__net_sta__[i] for i in self.order]
+    def __at__(self, pos):
+        if pos < 0 or pos >= len(self.order):
+            return self.__empty__
+        return self.__net_sta__[self.order[pos]]
 
 def channel_from_sac(tr):
     lat = 0
@@ -0,0 +1,130 @@
+import math
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .distaz import distaz_arrays, unit_vectors
+
+# slack on the chord radius so stations right at the max distance are not
+# lost to rounding, the exact distance filter follows
+CHORD_SLACK = 1e-9
+
+
+class StationTable:
+    """
+    Station coordinates as numpy columns, one row per station in iteration
+    order, so length, random access and distances to a quake do not walk
+    the inventory. Rows hold the index of the network code, the station
+    code, latitude, longitude, elevation and number of channels.
+
+    net_sta -- iterable of (net, sta) tuples in iteration order
+    """
+    def __init__(self, net_sta):
+        self.net_codes = []
+        net_code_idx = {}
+        net_index = []
+        sta_codes = []
+        lat = []
+        lon = []
+        elev = []
+        chan_count = []
+        for net, sta in net_sta:
+            if net.code not in net_code_idx:
+                net_code_idx[net.code] = len(self.net_codes)
+                self.net_codes.append(net.code)
+            net_index.append(net_code_idx[net.code])
+            sta_codes.append(sta.code)
+            lat.append(sta.latitude)
+            lon.append(sta.longitude)
+            elev.append(sta.elevation if sta.elevation is not None else np.nan)
+            chan_count.append(len(sta.channels))
+        self.net_index = np.array(net_index, dtype=np.int32)
+        self.sta_code = np.array(sta_codes, dtype=str)
+        self.latitude = np.array(lat, dtype=float)
+        self.longitude = np.array(lon, dtype=float)
+        self.elevation = np.array(elev, dtype=float)
+        self.channel_count = np.array(chan_count, dtype=np.int32)
+        self.__by_code__ = None
+        self.__spatial_index__ = None
+    @classmethod
+    def from_inventory(cls, inv):
+        return cls((n, s) for n in inv.networks for s in n.stations)
+    def __len__(self):
+        return len(self.sta_code)
+    def net_sta_code(self, index):
+        """
+        NET.STA code of the station at index.
+        """
+        return f"{self.net_codes[self.net_index[index]]}.{self.sta_code[index]}"
+    def index_of(self, net_sta):
+        """
+        Index of the first station with the NET.STA code, or None.
+        """
+        if self.__by_code__ is None:
+            self.__by_code__ = {}
+            for idx in range(len(self)):
+                self.__by_code__.setdefault(self.net_sta_code(idx), idx)
+        return self.__by_code__.get(net_sta)
+    def distaz(self, lat, lon):
+        """
+        Arrays of distance in degrees, azimuth from the point to each
+        station and back azimuth, as DistAz with the station first.
+        """
+        return distaz_arrays(self.latitude, self.longitude, lat, lon)
+    def spatial_index(self):
+        """
+        Spatial index over the stations, built on first use.
+        """
+        if self.__spatial_index__ is None:
+            self.__spatial_index__ = StationSpatialIndex(self)
+        return self.__spatial_index__
+    def distaz_to_quake(self, quake):
+        """
+        Distance, azimuth and back azimuth arrays from every station to the
+        preferred origin of the quake, or None if it has no origin.
+        """
+        origin = quake.preferred_origin() if quake is not None else None
+        if origin is None:
+            return None
+        return self.distaz(origin.latitude, origin.longitude)
+
+
+class StationSpatialIndex:
+    """
+    KD-tree over the unit vectors of the stations in a StationTable, for
+    finding the stations within a distance of a point without computing
+    the distance to every station. Distances are DistAz degrees.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.tree = cKDTree(unit_vectors(table.latitude, table.longitude)) if len(table) > 0 else None
+    def within(self, lat, lon, max_dist, min_dist=None):
+        """
+        Sorted row indices of stations with distance to the point at most
+        max_dist, and at least min_dist if given, in degrees.
+        """
+        if self.tree is None:
+            return np.array([], dtype=np.intp)
+        center = unit_vectors([lat], [lon])[0]
+        if max_dist >= 180:
+            candidates = np.arange(len(self.table))
+        else:
+            chord = 2*math.sin(math.radians(max_dist)/2) + CHORD_SLACK
+            candidates = np.array(sorted(self.tree.query_ball_point(center, chord)), dtype=np.intp)
+        if len(candidates) == 0:
+            return candidates
+        delta = distaz_arrays(self.table.latitude[candidates],
+                              self.table.longitude[candidates], lat, lon)[0]
+        keep = delta <= max_dist
+        if min_dist is not None:
+            keep &= delta >= min_dist
+        return candidates[keep]
+    def within_quake(self, quake, max_dist, min_dist=None):
+        """
+        Sorted row indices of stations within the distance range of the
+        preferred origin of the quake, or None if it has no origin.
+        """
+        origin = quake.preferred_origin() if quake is not None else None
+        if origin is None:
+            return None
+        return self.within(origin.latitude, origin.longitude, max_dist, min_dist)
@@ -5,7 +5,8 @@ from pathlib import Path
 import argparse
 from obspy import read_events, Catalog
 
-from .pick_util import reloadQuakeMLWithPicksComcat
+from .pick_util import reloadQuakeMLWithPicks, reloadQuakeMLWithPicksComcat
+from .client_pool import configure_http_cache
 from .pickax_config import origin_mag_to_string
 
 def do_parseargs():
@@ -32,10 +33,25 @@ def do_parseargs():
         required=False,
         help="QuakeML directory, save one file per event",
     )
+    parser.add_argument(
+        "--cache",
+        required=False,
+        help="Directory to cache downloaded event and phase data in, reused by later runs",
+    )
+    parser.add_argument(
+        "--offline",
+        help="only use already cached downloads, requires --cache",
+        action="store_true"
+    )
     return parser.parse_args()
 
 def main():
     args = do_parseargs()
+    if args.offline and args.cache is None:
+        print("--offline requires --cache, cowardly quitting...")
+        return
+    if args.cache is not None:
+        configure_http_cache(args.cache, offline=args.offline)
     bad_file_chars_pat = re.compile(r'[\s:\(\)/]+')
     if args.quakeml:
         if os.path.exists(args.quakeml):
@@ -0,0 +1,80 @@
+import hashlib
+
+from obspy import Stream
+from obspy.core.stream import read as obspyread
+
+from .atomic_file import atomic_write
+from .disk_cache import LRUDiskCache
+DEFAULT_MAX_BYTES = 2*1024*1024*1024
+
+
+def waveform_cache_key(nslc_list, start, end, source):
+    """
+    Cache key for a request, from the channel codes, time window and the
+    data center or other source the waveforms came from.
+    """
+    nslc_str = ",".join(sorted(".".join(nslc) for nslc in nslc_list))
+    return hashlib.sha1(f"{source}|{nslc_str}|{start}|{end}".encode()).hexdigest()
+
+
+class WaveformDiskCache(LRUDiskCache):
+    """
+    Directory of miniseed files, one per request, with a json index of
+    file sizes in least recently used order. Once the total size goes over
+    max_bytes, the least recently used files are deleted.
+    Files written by other processes sharing the directory are picked up
+    on lookup even if not yet in this index.
+
+    cache_dir -- directory to hold the files and index
+    max_bytes -- size budget for all cached files
+    """
+    cache_name = "waveform cache"
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+    def path_for(self, key):
+        return self.cache_dir / key[:2] / f"{key}.mseed"
+    def files_for(self, key):
+        return [self.path_for(key)]
+    def get(self, key):
+        """
+        Cached waveforms for the key, or None if not cached.
+        """
+        with self.__lock__:
+            path = self.path_for(key)
+            if key not in self.__entries__:
+                if not path.exists():
+                    return None
+                # written by another process
+                self.__add_entry__(key, path.stat().st_size)
+            try:
+                if self.__entries__[key] == 0:
+                    waveforms = Stream()
+                else:
+                    waveforms = obspyread(path, format="MSEED")
+            except (FileNotFoundError, OSError):
+                self.__remove_entry__(key)
+                return None
+            self.__touch__(key)
+            return waveforms
+    def put(self, key, waveforms):
+        """
+        Saves the waveforms for the key, evicting least recently used files
+        if over the size budget.
+        """
+        with self.__lock__:
+            path = self.path_for(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                atomic_write(path, lambda f: _write_mseed(waveforms, f), binary=True)
+            except Exception as e:
+                print(f"WARN: unable to cache waveforms: {e}")
+                return
+            self.__replace_entry__(key, path.stat().st_size)
+    def __contains__(self, key):
+        return key in self.__entries__ or self.path_for(key).exists()
+
+
+def _write_mseed(waveforms, f):
+    # an empty file records a request that returned no data
+    if len(waveforms) > 0:
+        waveforms.write(f, format="MSEED")
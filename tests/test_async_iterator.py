@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+from obspy import Stream, Trace
+from obspy.core.inventory import Network, Station
+
+from pickax.seismogram_iterator import AsyncSeismogramIterator, SeismogramIterator
+
+
+class SlowPositionIterator(SeismogramIterator):
+    """
+    Moves through stations without loading, each load sleeping a little
+    and recording how many ran at once.
+    """
+    def __init__(self, num_sta=12, delay=0.05):
+        self.__empty__ = None, None, None, []
+        net = Network("XX")
+        self.positions = [(net, Station(f"S{idx:02d}", 0, 0, 0), "quake") for idx in range(num_sta)]
+        self.idx = -1
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+    def next_position(self):
+        self.idx = min(self.idx + 1, len(self.positions))
+        return self.positions[self.idx] if self.idx < len(self.positions) else (None, None, None)
+    def prev_position(self):
+        self.idx = max(self.idx - 1, -1)
+        return self.positions[self.idx] if self.idx >= 0 else (None, None, None)
+    def next(self):
+        return self.load_seismograms(*self.next_position())
+    def prev(self):
+        return self.load_seismograms(*self.prev_position())
+    def load_seismograms(self, net, sta, quake):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return net, sta, quake, Stream([Trace(header={"station": sta.code})])
+
+async def collect(itr):
+    return [waveforms[0].stats.station async for net, sta, quake, waveforms in itr]
+
+def test_load_all_in_order_with_limited_concurrency():
+    sub_itr = SlowPositionIterator()
+    itr = AsyncSeismogramIterator(sub_itr, workers=3)
+    start = time.perf_counter()
+    codes = asyncio.run(collect(itr))
+    elapsed = time.perf_counter() - start
+    assert codes == [f"S{idx:02d}" for idx in range(12)]
+    assert 1 < sub_itr.max_running <= 3
+    assert elapsed < 12*sub_itr.delay
+
+def test_anext_and_aprev():
+    sub_itr = SlowPositionIterator(num_sta=3, delay=0)
+    itr = AsyncSeismogramIterator(sub_itr)
+    async def steps():
+        first = await itr.anext()
+        second = await itr.anext()
+        back = await itr.aprev()
+        return [first[1].code, second[1].code, back[1].code]
+    assert asyncio.run(steps()) == ["S00", "S01", "S00"]
+
+def test_empty_at_end():
+    sub_itr = SlowPositionIterator(num_sta=0, delay=0)
+    itr = AsyncSeismogramIterator(sub_itr)
+    assert asyncio.run(itr.anext()) == (None, None, None, [])
+    assert asyncio.run(collect(itr)) == []
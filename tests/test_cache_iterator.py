@@ -0,0 +1,93 @@
+import numpy as np
+from obspy import Stream, Trace
+
+from pickax.seismogram_iterator import CacheSeismogramIterator, SeismogramIterator, data_bytes
+
+ITEM_BYTES = 400
+
+
+class ListSeismogramIterator(SeismogramIterator):
+    """
+    Steps through a fixed list of items, counting loads, so the cache can
+    be checked against where the sub iterator really is.
+    """
+    def __init__(self, num_items):
+        self.__empty__ = None, None, None, []
+        self.items = [("XX", f"S{idx:02d}", "quake", Stream([Trace(np.full(ITEM_BYTES//4, idx, dtype=np.int32))]))
+                      for idx in range(num_items)]
+        self.idx = -1
+        self.loads = 0
+    def next(self):
+        self.idx = min(self.idx + 1, len(self.items))
+        return self.__at__()
+    def prev(self):
+        self.idx = max(self.idx - 1, -1)
+        return self.__at__()
+    def __at__(self):
+        if self.idx < 0 or self.idx >= len(self.items):
+            return self.__empty__
+        self.loads += 1
+        return self.items[self.idx]
+    def seek(self, quake_index, station_index=0):
+        self.idx = station_index - 1
+    def seek_to(self, event_id, net_sta=None):
+        pass
+    def quake_iterator(self):
+        return None
+    def station_iterator(self):
+        return None
+
+
+def station(item):
+    return item[1]
+
+def walk(itr, moves):
+    return [station(itr.next() if m == "n" else itr.prev()) for m in moves]
+
+def test_back_and_forth_uses_cache():
+    sub = ListSeismogramIterator(10)
+    itr = CacheSeismogramIterator(sub, size=10)
+    assert walk(itr, "nnnn") == ["S00", "S01", "S02", "S03"]
+    assert walk(itr, "ppp") == ["S02", "S01", "S00"]
+    assert walk(itr, "nnnn") == ["S01", "S02", "S03", "S04"]
+    assert sub.loads == 5
+    assert itr.hits == 6
+    assert itr.misses == 5
+
+def test_evicted_items_reloaded_in_place():
+    sub = ListSeismogramIterator(10)
+    itr = CacheSeismogramIterator(sub, size=2)
+    assert walk(itr, "nnnnnn") == ["S00", "S01", "S02", "S03", "S04", "S05"]
+    # only two previous items are kept, the rest are loaded again
+    assert walk(itr, "ppppp") == ["S04", "S03", "S02", "S01", "S00"]
+    assert itr.evictions > 0
+    assert walk(itr, "nnnnnnn") == ["S01", "S02", "S03", "S04", "S05", "S06", "S07"]
+
+def test_byte_budget():
+    sub = ListSeismogramIterator(20)
+    itr = CacheSeismogramIterator(sub, size=10, max_bytes=3*ITEM_BYTES)
+    expected = [f"S{idx:02d}" for idx in range(12)]
+    assert walk(itr, "n"*12) == expected
+    assert itr.resident_bytes <= 3*ITEM_BYTES
+    assert walk(itr, "p"*11) == expected[:-1][::-1]
+    assert itr.resident_bytes <= 3*ITEM_BYTES
+    assert walk(itr, "n"*11) == expected[1:]
+    assert itr.resident_bytes <= 3*ITEM_BYTES
+    stats = itr.stats()
+    assert stats["items"] <= 3
+    assert stats["resident_bytes"] == itr.resident_bytes
+
+def test_resident_bytes_matches_items():
+    sub = ListSeismogramIterator(8)
+    itr = CacheSeismogramIterator(sub, size=3)
+    walk(itr, "nnnnnnppppnn")
+    cached = list(itr.__prev_cache__) + list(itr.__next_cache__) + [itr.__curr_data__]
+    assert itr.resident_bytes == sum(data_bytes(item) for item in cached)
+
+def test_seek_clears_cache():
+    sub = ListSeismogramIterator(10)
+    itr = CacheSeismogramIterator(sub, size=10)
+    walk(itr, "nnn")
+    itr.seek(0, 5)
+    assert itr.resident_bytes == 0
+    assert walk(itr, "np") == ["S05", "S04"]
@@ -0,0 +1,81 @@
+import os
+import re
+
+from obspy import UTCDateTime
+from obspy.core.event import Catalog, Event, Origin, Pick, ResourceIdentifier, WaveformStreamID
+
+from pickax import quake_iterator
+from pickax.quake_iterator import CachedPicksQuakeItr, QuakeMLFileIterator
+from pickax.pick_util import extractEventId
+
+START = UTCDateTime("2023-01-01")
+BAD_FILE_CHARS = re.compile(r'[\s:\(\)/]+')
+
+
+def make_event(idx, num_picks=0):
+    origin = Origin(time=START + idx*3600, latitude=34, longitude=-80, depth=5000)
+    event = Event(resource_id=ResourceIdentifier(f"ev{idx}"), origins=[origin])
+    event.preferred_origin_id = origin.resource_id
+    for p_idx in range(num_picks):
+        event.picks.append(Pick(resource_id=ResourceIdentifier(f"ev{idx}_pick{p_idx}"),
+                                time=origin.time + 10 + p_idx,
+                                waveform_id=WaveformStreamID("XX", f"S{p_idx:02d}", "00", "HHZ")))
+    return event
+
+def write_pick_file(cachedir, event_id, event):
+    qfile = cachedir / f"eventid_{BAD_FILE_CHARS.sub('_', event_id)}.qml"
+    Catalog([event]).write(str(qfile), format="QUAKEML")
+    return qfile
+
+def count_reads(monkeypatch):
+    reads = []
+    real_read_events = quake_iterator.read_events
+    def counting_read(path, *args, **kwargs):
+        reads.append(path.name)
+        return real_read_events(path, *args, **kwargs)
+    monkeypatch.setattr(quake_iterator, "read_events", counting_read)
+    return reads
+
+def make_iterator(tmp_path):
+    Catalog([make_event(idx) for idx in range(3)]).write(str(tmp_path / "quakes.qml"), format="QUAKEML")
+    cachedir = tmp_path / "by_eventid"
+    cachedir.mkdir()
+    itr = CachedPicksQuakeItr(QuakeMLFileIterator(tmp_path / "quakes.qml"), cachedir=cachedir)
+    return itr, cachedir
+
+def test_picks_merged_from_cache_file(tmp_path, monkeypatch):
+    itr, cachedir = make_iterator(tmp_path)
+    event_ids = [extractEventId(q) for q in itr.all()]
+    write_pick_file(cachedir, event_ids[1], make_event(1, num_picks=2))
+    reads = count_reads(monkeypatch)
+    assert len(itr.next().picks) == 0
+    quake = itr.next()
+    assert len(quake.picks) == 2
+    assert len(reads) == 1
+    # back again, the file is unchanged so not read or merged again
+    itr.prev()
+    assert itr.next() is quake
+    assert len(quake.picks) == 2
+    assert len(reads) == 1
+
+def test_modified_cache_file_merged_again(tmp_path, monkeypatch):
+    itr, cachedir = make_iterator(tmp_path)
+    event_ids = [extractEventId(q) for q in itr.all()]
+    qfile = write_pick_file(cachedir, event_ids[0], make_event(0, num_picks=1))
+    reads = count_reads(monkeypatch)
+    quake = itr.next()
+    assert len(quake.picks) == 1
+    mtime = qfile.stat().st_mtime_ns
+    write_pick_file(cachedir, event_ids[0], make_event(0, num_picks=3))
+    os.utime(qfile, ns=(mtime + 10**9, mtime + 10**9))
+    itr.beginning()
+    assert itr.next() is quake
+    # the pick already merged is not duplicated
+    assert len(quake.picks) == 3
+    assert len(reads) == 2
+
+def test_no_cache_dir(tmp_path):
+    Catalog([make_event(0)]).write(str(tmp_path / "quakes.qml"), format="QUAKEML")
+    itr = CachedPicksQuakeItr(QuakeMLFileIterator(tmp_path / "quakes.qml"), cachedir=tmp_path / "missing")
+    assert len(itr.next().picks) == 0
+    assert itr.next() is None
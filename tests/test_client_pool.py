@@ -0,0 +1,97 @@
+import pytest
+
+from pickax import client_pool
+from pickax.client_pool import (cached_get, client_stats, configure_http_cache, configure_pool,
+                                get_client, http_cache, http_session, reset_client_stats)
+
+STUB_URL = "http://stub.example.com"
+
+
+class StubResponse:
+    def __init__(self, url, content=b"data"):
+        self.url = url
+        self.status_code = 200
+        self.content = content
+        self.headers = {}
+
+class StubSession:
+    def __init__(self):
+        self.requests = []
+        self.closed = False
+    def get(self, url, params=None, headers=None, timeout=None, auth=None):
+        self.requests.append(("GET", url, auth))
+        return StubResponse(url)
+    def post(self, url, headers=None, data=None, timeout=None, auth=None):
+        self.requests.append(("POST", url, auth))
+        return StubResponse(url, b"posted")
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def session(monkeypatch):
+    stub = StubSession()
+    monkeypatch.setattr(client_pool, "_session", stub)
+    monkeypatch.setattr(client_pool, "_clients", {})
+    monkeypatch.setattr(client_pool, "_stats", {})
+    monkeypatch.setattr(client_pool, "_http_cache", None)
+    return stub
+
+def test_clients_are_shared(session):
+    client = get_client(STUB_URL)
+    assert get_client(STUB_URL) is client
+    assert get_client(STUB_URL, timeout=5) is not client
+
+def test_requests_use_shared_session_and_are_counted(session):
+    client = get_client(STUB_URL)
+    assert client._download(f"{STUB_URL}/fdsnws/station/1/query?net=XX").read() == b"data"
+    client._download(f"{STUB_URL}/fdsnws/dataselect/1/query", data=b"XX * * * 2023-01-01 2023-01-02")
+    assert [(method, url.split("/")[4]) for method, url, auth in session.requests] \
+        == [("GET", "station"), ("POST", "dataselect")]
+    stats = client_stats()
+    assert stats["stub.example.com"] == {"requests": 2, "bytes": 10}
+    assert stats["total"]["requests"] == 2
+    reset_client_stats()
+    assert client_stats()["total"]["requests"] == 0
+
+def test_configure_pool_replaces_session(session):
+    configure_pool(max_connections=3)
+    assert session.closed
+    new_session = http_session()
+    assert new_session is not session
+    assert new_session.get_adapter("https://example.com")._pool_connections == 3
+    configure_pool()
+
+def test_event_queries_go_through_cache(session, tmp_path):
+    configure_http_cache(tmp_path / "http")
+    client = get_client(STUB_URL)
+    event_url = f"{STUB_URL}/fdsnws/event/1/query?eventid=ev1"
+    assert client._download(event_url).read() == b"data"
+    assert client._download(event_url).read() == b"data"
+    client._download(f"{STUB_URL}/fdsnws/station/1/query?net=XX")
+    client._download(f"{STUB_URL}/fdsnws/station/1/query?net=XX")
+    assert [url.split("/")[4] for method, url, auth in session.requests] \
+        == ["event", "station", "station"]
+    assert http_cache().stats()["hits"] == 1
+    # only requests that reach the network are counted
+    assert client_stats()["total"]["requests"] == 3
+
+def test_authenticated_requests_skip_cache(session, tmp_path):
+    configure_http_cache(tmp_path / "http")
+    client = get_client(STUB_URL)
+    client._auth = ("user", "password")
+    event_url = f"{STUB_URL}/fdsnws/event/1/query?eventid=ev1"
+    client._download(event_url)
+    client._download(event_url)
+    assert len(session.requests) == 2
+    assert http_cache().stats()["entries"] == 0
+
+def test_cached_get_without_cache(session, tmp_path):
+    cached_get(f"{STUB_URL}/a")
+    cached_get(f"{STUB_URL}/a")
+    assert len(session.requests) == 2
+    configure_http_cache(tmp_path / "http")
+    cached_get(f"{STUB_URL}/a")
+    cached_get(f"{STUB_URL}/a")
+    assert len(session.requests) == 3
+    configure_http_cache(None)
+    assert http_cache() is None
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+from pickax.http_cache import HttpResponseCache, IMMUTABLE_TTL, OfflineCacheMiss
+from pickax.waveform_cache import WaveformDiskCache, waveform_cache_key
+
+
+def make_stream(station="S01", npts=1000):
+    tr = Trace(np.arange(npts, dtype=np.int32),
+               header={"network": "XX", "station": station, "channel": "HHZ",
+                       "starttime": UTCDateTime("2023-01-01"), "sampling_rate": 100})
+    return Stream([tr])
+
+def make_key(station):
+    return waveform_cache_key([("XX", station, "", "HHZ")],
+                              UTCDateTime("2023-01-01"), UTCDateTime("2023-01-01T00:00:10"), "TEST")
+
+def test_waveform_round_trip_and_empty(tmp_path):
+    cache = WaveformDiskCache(tmp_path)
+    cache.put(make_key("S01"), make_stream("S01"))
+    cache.put(make_key("S02"), Stream())
+    assert cache.get(make_key("S01"))[0].stats.station == "S01"
+    assert len(cache.get(make_key("S02"))) == 0
+    assert cache.get(make_key("S03")) is None
+    reopened = WaveformDiskCache(tmp_path)
+    assert len(reopened) == 2
+
+def test_waveform_evicts_least_recently_used(tmp_path):
+    cache = WaveformDiskCache(tmp_path)
+    cache.put(make_key("S01"), make_stream("S01"))
+    size = cache.total_bytes
+    cache.max_bytes = 2*size
+    cache.put(make_key("S02"), make_stream("S02"))
+    cache.get(make_key("S01"))
+    cache.put(make_key("S03"), make_stream("S03"))
+    assert make_key("S01") in cache
+    assert make_key("S02") not in cache
+    assert make_key("S03") in cache
+    assert cache.total_bytes <= cache.max_bytes
+
+def test_shared_directory_keeps_both_indexes(tmp_path):
+    first = WaveformDiskCache(tmp_path)
+    second = WaveformDiskCache(tmp_path)
+    first.put(make_key("S01"), make_stream("S01"))
+    second.put(make_key("S02"), make_stream("S02"))
+    first.put(make_key("S03"), make_stream("S03"))
+    reopened = WaveformDiskCache(tmp_path)
+    assert len(reopened) == 3
+    assert reopened.total_bytes == sum(p.stat().st_size for p in tmp_path.glob("*/*.mseed"))
+
+def test_shared_directory_eviction_drops_other_entries(tmp_path):
+    first = WaveformDiskCache(tmp_path)
+    first.put(make_key("S01"), make_stream("S01"))
+    size = first.total_bytes
+    second = WaveformDiskCache(tmp_path, max_bytes=2*size)
+    second.put(make_key("S02"), make_stream("S02"))
+    second.put(make_key("S03"), make_stream("S03"))
+    assert not first.path_for(make_key("S01")).exists()
+    first.put(make_key("S04"), make_stream("S04"))
+    reopened = WaveformDiskCache(tmp_path)
+    assert make_key("S01") not in reopened.__entries__
+    assert len(reopened) == 3
+
+
+class StubResponse:
+    def __init__(self, url, status_code, content, headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers if headers is not None else {}
+
+class StubSession:
+    def __init__(self):
+        self.requests = []
+        self.status_code = 200
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests.append(headers)
+        if self.status_code == 304:
+            return StubResponse(url, 304, b"")
+        return StubResponse(url, 200, f"body {len(self.requests)}".encode(), {"ETag": "abc"})
+
+def test_http_hit_and_revalidation(tmp_path):
+    session = StubSession()
+    cache = HttpResponseCache(tmp_path, ttl=0)
+    assert cache.get(session, "http://example.com/a").text == "body 1"
+    session.status_code = 304
+    resp = cache.get(session, "http://example.com/a")
+    assert resp.from_cache and resp.text == "body 1"
+    assert session.requests[-1]["If-None-Match"] == "abc"
+    assert cache.get(session, "http://example.com/a", ttl=IMMUTABLE_TTL).text == "body 1"
+    assert len(session.requests) == 2
+    assert cache.stats()["revalidated"] == 1
+
+def test_http_offline_and_shared(tmp_path):
+    session = StubSession()
+    first = HttpResponseCache(tmp_path)
+    second = HttpResponseCache(tmp_path)
+    first.get(session, "http://example.com/a")
+    second.get(session, "http://example.com/b")
+    offline = HttpResponseCache(tmp_path, offline=True)
+    assert len(offline) == 2
+    assert offline.get(session, "http://example.com/b").text == "body 2"
+    with pytest.raises(OfflineCacheMiss):
+        offline.get(session, "http://example.com/c")
@@ -0,0 +1,73 @@
+from obspy import UTCDateTime
+from obspy.core.event import Amplitude, Arrival, Event, Origin, Pick, WaveformStreamID
+
+from pickax.pick_util import EventIndex, event_index, remove_pick
+
+ORIGIN_TIME = UTCDateTime("2023-01-01T00:00:00")
+
+
+def make_pick(sta, offset, channel="HHZ"):
+    return Pick(time=ORIGIN_TIME + offset,
+                waveform_id=WaveformStreamID("XX", sta, "00", channel))
+
+def make_quake(num_picks=5):
+    origin = Origin(time=ORIGIN_TIME, latitude=34, longitude=-80, depth=5000)
+    quake = Event(origins=[origin])
+    quake.preferred_origin_id = origin.resource_id
+    for idx in range(num_picks):
+        pick = make_pick(f"S{idx:02d}", 10 + idx)
+        quake.picks.append(pick)
+        origin.arrivals.append(Arrival(pick_id=pick.resource_id, phase="P"))
+        quake.amplitudes.append(Amplitude(generic_amplitude=idx, pick_id=pick.resource_id))
+    return quake
+
+def test_lookups():
+    quake = make_quake()
+    index = EventIndex(quake)
+    pick = quake.picks[2]
+    assert index.arrival_for_pick(pick) is quake.origins[0].arrivals[2]
+    assert index.amplitude_for_pick(pick) is quake.amplitudes[2]
+    assert index.picks_for_channel("XX.S02.00.HHZ") == [pick]
+    assert index.picks_for_station("XX.S02") == [pick]
+    assert index.picks_for_station("XX.NOPE") == []
+
+def test_shared_index_is_reused():
+    quake = make_quake()
+    index = event_index(quake)
+    assert event_index(quake) is index
+    assert index.is_current()
+
+def test_add_and_remove_keep_index_current():
+    quake = make_quake()
+    index = event_index(quake)
+    pick = make_pick("NEW", 20)
+    amp = Amplitude(generic_amplitude=1.0, pick_id=pick.resource_id)
+    index.add_pick(pick, amp)
+    assert index.is_current()
+    assert index.picks_for_station("XX.NEW") == [pick]
+    assert index.amplitude_for_pick(pick) is amp
+
+    old = quake.picks[0]
+    remove_pick(old, quake)
+    assert event_index(quake) is index
+    assert index.is_current()
+    assert old not in quake.picks
+    assert len(quake.origins[0].arrivals) == 4
+    assert index.arrival_for_pick(old) is None
+    assert index.picks_for_station("XX.S00") == []
+
+def test_direct_changes_rebuild():
+    quake = make_quake()
+    index = event_index(quake)
+    pick = make_pick("NEW", 20)
+    quake.picks.append(pick)
+    assert not index.is_current()
+    assert event_index(quake).picks_for_station("XX.NEW") == [pick]
+
+    quake.picks = [pick]
+    assert not index.is_current()
+    assert event_index(quake).picks_for_station("XX.S01") == []
+
+    arrival = Arrival(pick_id=pick.resource_id, phase="S")
+    quake.origins[0].arrivals.append(arrival)
+    assert event_index(quake).arrival_for_pick(pick) is arrival
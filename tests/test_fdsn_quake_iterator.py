@@ -0,0 +1,107 @@
+import threading
+
+from obspy import UTCDateTime
+from obspy.core.event import Catalog, Event, Origin, Pick, ResourceIdentifier
+
+from pickax import FDSNQuakeIterator, extractEventId
+from pickax import quake_iterator
+from pickax.quake_summary import QuakeSummary
+
+START = UTCDateTime("2022-01-01")
+
+def make_event(idx):
+    origin = Origin(time=START + idx*5*86400, latitude=34, longitude=-80, depth=5000)
+    event = Event(resource_id=ResourceIdentifier(f"ev{idx}"), origins=[origin])
+    event.preferred_origin_id = origin.resource_id
+    return event
+
+class StubClient:
+    def __init__(self, events):
+        self.events = events
+        self.requests = []
+    def get_events(self, starttime=None, endtime=None, **kwargs):
+        self.requests.append((starttime, endtime))
+        return Catalog([e for e in self.events
+                        if starttime <= e.preferred_origin().time <= endtime])
+
+def make_iterator(monkeypatch, num_events=20, text=True, text_list=False, pick_lookahead=0):
+    events = [make_event(idx) for idx in range(num_events)]
+    summary_requests = []
+    def fake_summaries(client, query_params):
+        summary_requests.append(query_params)
+        if not text:
+            return None
+        t1 = query_params.get("starttime", query_params.get("start"))
+        t2 = query_params.get("endtime", query_params.get("end"))
+        return [QuakeSummary(str(e.resource_id), e.preferred_origin().time, 34, -80, 5000)
+                for e in events if t1 <= e.preferred_origin().time <= t2]
+    monkeypatch.setattr(quake_iterator, "fetch_quake_summaries", fake_summaries)
+    itr = FDSNQuakeIterator({"start": START, "end": START + 100*86400},
+                            days_step=20, dc_name="STUB", prefetch=False, text_list=text_list,
+                            pick_lookahead=pick_lookahead)
+    itr._client = StubClient(events)
+    return itr, summary_requests
+
+def test_window_counts_from_one_summary_request(monkeypatch):
+    itr, summary_requests = make_iterator(monkeypatch)
+    # quakes on a window boundary belong to the later window
+    assert itr.window_counts() == [4, 4, 4, 4, 4]
+    assert len(itr.all()) == 20
+    assert len(summary_requests) == 1
+    assert itr._client.requests == []
+
+def test_seek_loads_only_target_window(monkeypatch):
+    itr, summary_requests = make_iterator(monkeypatch)
+    itr.seek(13)
+    assert extractEventId(itr.next()) == "ev13"
+    assert len(itr._client.requests) == 1
+    itr.seek_to("ev7")
+    assert extractEventId(itr.next()) == "ev7"
+    assert len(summary_requests) == 1
+
+def test_all_without_text_format_requests_windows(monkeypatch):
+    itr, summary_requests = make_iterator(monkeypatch, text=False)
+    assert [extractEventId(q) for q in itr.all()] == [f"ev{idx}" for idx in range(20)]
+    assert len(itr._client.requests) == len(itr.windows)
+    assert itr.window_counts() == [4, 4, 4, 4, 4]
+
+def test_failed_reload_keeps_picks_and_retries(monkeypatch):
+    itr, summary_requests = make_iterator(monkeypatch, text_list=True)
+    reloads = []
+    def fake_reload(quake, client=None, host=None, debug=False):
+        reloads.append(extractEventId(quake))
+        if len(reloads) == 1:
+            raise Exception("service down")
+        return make_event(int(extractEventId(quake)[2:]))
+    monkeypatch.setattr(quake_iterator, "reloadQuakeMLWithPicks", fake_reload)
+    quake = itr.next()
+    assert isinstance(quake, Event)
+    quake.picks.append(Pick(time=START + 10))
+    assert itr.next() is not None
+    full_quake = itr.prev()
+    assert full_quake is not quake
+    assert len(full_quake.picks) == 1
+    assert reloads == ["ev0", "ev1", "ev0"]
+    itr.next()
+    assert itr.prev() is full_quake
+    assert len(reloads) == 3
+
+def test_pick_lookahead_reloads_upcoming_quakes(monkeypatch):
+    itr, summary_requests = make_iterator(monkeypatch, text_list=True, pick_lookahead=2)
+    reloads = []
+    def fake_reload(quake, client=None, host=None, debug=False):
+        reloads.append((extractEventId(quake), threading.current_thread().name))
+        return make_event(int(extractEventId(quake)[2:]))
+    monkeypatch.setattr(quake_iterator, "reloadQuakeMLWithPicks", fake_reload)
+    assert extractEventId(itr.next()) == "ev0"
+    for future in list(itr.__pick_futures__.values()):
+        future.result()
+    assert sorted(eid for eid, thread in reloads[1:]) == ["ev1", "ev2"]
+    assert all(thread.startswith("pickax-picks") for eid, thread in reloads[1:])
+    quake = itr.next()
+    assert isinstance(quake, Event) and extractEventId(quake) == "ev1"
+    for future in list(itr.__pick_futures__.values()):
+        future.result()
+    # ev1 came from the background request, not a second one
+    assert sorted(eid for eid, thread in reloads) == ["ev0", "ev1", "ev2", "ev3"]
+    itr.close()
@@ -0,0 +1,109 @@
+from obspy import Stream, Trace, UTCDateTime
+from obspy.core.event import Event, Origin
+from obspy.core.inventory import Channel, Network, Station
+
+from pickax import seismogram_iterator
+from pickax.quake_iterator import QuakeIterator
+from pickax.seismogram_iterator import FDSNSeismogramIterator
+from pickax.station_iterator import StationIterator
+
+
+def make_quake(idx):
+    origin = Origin(time=UTCDateTime("2023-01-01") + idx*86400,
+                    latitude=34, longitude=-80, depth=5000)
+    quake = Event(origins=[origin])
+    quake.preferred_origin_id = origin.resource_id
+    return quake
+
+def make_net_sta(code):
+    channel = Channel("HHZ", "00", 34, -80, 0, 0)
+    return Network("XX"), Station(code, 34.5, -80, 0, channels=[channel])
+
+class ListQuakeIterator(QuakeIterator):
+    def __init__(self, quakes):
+        self.quakes = quakes
+        self.idx = -1
+    def next(self):
+        self.idx = min(self.idx + 1, len(self.quakes))
+        return self.quakes[self.idx] if self.idx < len(self.quakes) else None
+    def prev(self):
+        self.idx = max(self.idx - 1, -1)
+        return self.quakes[self.idx] if self.idx >= 0 else None
+    def beginning(self):
+        self.idx = -1
+
+class PerQuakeStationIterator(StationIterator):
+    """
+    Different stations for each quake, like a distance filtered iterator.
+    """
+    def __init__(self, stations_by_quake):
+        self.__empty__ = None, None
+        self.stations_by_quake = stations_by_quake
+        self.stations = []
+        self.idx = -1
+    def set_quake(self, quake):
+        self.stations = self.stations_by_quake.get(id(quake), [])
+    def next(self):
+        self.idx = min(self.idx + 1, len(self.stations))
+        return self.stations[self.idx] if self.idx < len(self.stations) else self.__empty__
+    def prev(self):
+        self.idx = max(self.idx - 1, -1)
+        return self.stations[self.idx] if self.idx >= 0 else self.__empty__
+    def beginning(self):
+        self.idx = -1
+    def ending(self):
+        self.idx = len(self.stations)
+    def all_net_sta(self):
+        return list(self.stations)
+
+class StubClient:
+    def __init__(self):
+        self.bulk_stations = []
+    def get_waveforms_bulk(self, bulk):
+        self.bulk_stations.append(sorted({line[1] for line in bulk}))
+        return Stream([Trace(header={"network": line[0], "station": line[1],
+                                     "location": line[2], "channel": line[3]})
+                       for line in bulk])
+
+def test_bulk_uses_stations_of_the_loaded_quake(monkeypatch):
+    client = StubClient()
+    monkeypatch.setattr(seismogram_iterator, "get_client", lambda *args, **kwargs: client)
+    quakes = [make_quake(0), make_quake(1)]
+    stations = {id(quakes[0]): [make_net_sta("A1"), make_net_sta("A2")],
+                id(quakes[1]): [make_net_sta("B1")]}
+    seis_itr = FDSNSeismogramIterator(ListQuakeIterator(quakes), PerQuakeStationIterator(stations),
+                                      dc_name="STUB", bulk_size=10)
+    positions = [seis_itr.next_position() for idx in range(3)]
+    assert [sta.code for net, sta, quake in positions] == ["A1", "A2", "B1"]
+    # a background load for the first quake, after the iterator moved on
+    net, sta, quake = positions[1]
+    net, sta, quake, waveforms = seis_itr.load_seismograms(net, sta, quake)
+    assert client.bulk_stations == [["A1", "A2"]]
+    assert waveforms[0].stats.station == "A2"
+
+class StubAvailability:
+    base_url = "http://stub"
+    def __init__(self):
+        self.posts = []
+    def post(self, url, data=None, timeout=None):
+        self.posts.append(sorted({line.split()[1] for line in data.splitlines()[2:]}))
+        class Resp:
+            status_code = 200
+            content = b""
+            text = "#header\nXX A1 00 HHZ\n"
+        return Resp()
+
+def test_availability_uses_stations_of_the_checked_quake(monkeypatch):
+    stub = StubAvailability()
+    monkeypatch.setattr(seismogram_iterator, "get_client", lambda *args, **kwargs: stub)
+    monkeypatch.setattr(seismogram_iterator, "http_session", lambda: stub)
+    quakes = [make_quake(0), make_quake(1)]
+    stations = {id(quakes[0]): [make_net_sta("A1"), make_net_sta("A2")],
+                id(quakes[1]): [make_net_sta("B1")]}
+    seis_itr = FDSNSeismogramIterator(ListQuakeIterator(quakes), PerQuakeStationIterator(stations),
+                                      dc_name="STUB", check_availability=True)
+    net, sta, quake = seis_itr.__step_next__()
+    seis_itr.__step_next__()
+    seis_itr.__step_next__()
+    assert seis_itr.is_available(net, sta, quake)
+    assert stub.posts == [["A1", "A2"]]
@@ -0,0 +1,63 @@
+from obspy import UTCDateTime
+from obspy.core.event import Catalog, CreationInfo, Event, Origin, Pick, ResourceIdentifier, WaveformStreamID
+
+from pickax import pick_util
+from pickax.pick_util import IndexedCatalog, extractEventId, merge_picks_to_catalog
+
+ORIGIN_TIME = UTCDateTime("2023-01-01T00:00:00")
+
+
+def make_quake(idx, num_picks=1, author="A"):
+    origin = Origin(time=ORIGIN_TIME + idx, latitude=34, longitude=-80, depth=5000)
+    quake = Event(resource_id=ResourceIdentifier(f"ev{idx}"), origins=[origin])
+    quake.preferred_origin_id = origin.resource_id
+    for k in range(num_picks):
+        quake.picks.append(Pick(time=origin.time + 10 + k,
+                                waveform_id=WaveformStreamID("XX", f"S{k:02d}", "00", "HHZ"),
+                                creation_info=CreationInfo(author=author)))
+    return quake
+
+def test_find_and_reindex_after_direct_change():
+    catalog = Catalog([make_quake(idx) for idx in range(5)])
+    indexed = IndexedCatalog(catalog)
+    assert indexed.find("ev3") is catalog[3]
+    assert indexed.find("nope") is None
+    catalog.append(make_quake(7))
+    assert indexed.find("ev7") is catalog[5]
+    assert "ev7" in indexed
+
+def test_ids_extracted_once(monkeypatch):
+    indexed = IndexedCatalog(Catalog([make_quake(idx) for idx in range(20)]))
+    calls = []
+    def counting_extract(quake, host=""):
+        calls.append(quake)
+        return extractEventId(quake, host=host)
+    monkeypatch.setattr(pick_util, "extractEventId", counting_extract)
+    for idx in range(20):
+        indexed.merge(make_quake(idx, author="B"))
+    # only the incoming quakes, not the catalog
+    assert len(calls) == 20
+    assert all(len(q.picks) == 2 for q in indexed)
+
+def test_plain_catalog_merge_stops_at_match(monkeypatch):
+    catalog = Catalog([make_quake(idx) for idx in range(20)])
+    calls = []
+    def counting_extract(quake, host=""):
+        calls.append(quake)
+        return extractEventId(quake, host=host)
+    monkeypatch.setattr(pick_util, "extractEventId", counting_extract)
+    merge_picks_to_catalog(make_quake(2, author="B"), catalog)
+    assert len(calls) == 4
+    assert len(catalog[2].picks) == 2
+    merge_picks_to_catalog(make_quake(30, num_picks=2, author="B"), catalog, author="A")
+    assert len(catalog) == 21
+    assert len(catalog[20].picks) == 0
+
+def test_merge_to_indexed_catalog_matches_plain():
+    plain = Catalog([make_quake(idx) for idx in range(5)])
+    indexed = IndexedCatalog(Catalog([make_quake(idx) for idx in range(5)]))
+    for idx in [1, 3, 8]:
+        merge_picks_to_catalog(make_quake(idx, num_picks=2, author="B"), plain)
+        merge_picks_to_catalog(make_quake(idx, num_picks=2, author="B"), indexed)
+    assert [(extractEventId(q), len(q.picks)) for q in plain] \
+        == [(extractEventId(q), len(q.picks)) for q in indexed]
@@ -0,0 +1,48 @@
+import numpy as np
+from obspy import Stream, Trace, UTCDateTime
+from obspy.core.event import Catalog, Event, Origin
+from obspy.core.inventory import Channel, Inventory, Network, Station
+
+from pickax.seismogram_iterator import MDLSeismogramIterator
+
+ORIGIN_TIME = UTCDateTime("2023-01-01T00:00:00")
+
+
+def write_mdl_dir(mdl_dir, station_codes, data_codes):
+    origin = Origin(time=ORIGIN_TIME, latitude=34, longitude=-80, depth=5000)
+    quake = Event(origins=[origin])
+    quake.preferred_origin_id = origin.resource_id
+    Catalog([quake]).write(str(mdl_dir / "quakes.qml"), format="QUAKEML")
+    (mdl_dir / "stations").mkdir()
+    for code in station_codes:
+        station = Station(code, 34, -80, 0, channels=[Channel("HHZ", "00", 34, -80, 0, 0)])
+        Inventory(networks=[Network("XX", stations=[station])]).write(
+            str(mdl_dir / "stations" / f"XX.{code}.xml"), format="STATIONXML")
+    (mdl_dir / "waveforms").mkdir()
+    for code in data_codes:
+        start = ORIGIN_TIME - 60
+        tr = Trace(np.zeros(6000, dtype=np.int32),
+                   header={"network": "XX", "station": code, "location": "00",
+                           "channel": "HHZ", "starttime": start, "sampling_rate": 20})
+        name = f"XX.{code}.00.HHZ__{start.strftime('%Y%m%dT%H%M%SZ')}__{tr.stats.endtime.strftime('%Y%m%dT%H%M%SZ')}.mseed"
+        Stream([tr]).write(str(mdl_dir / "waveforms" / name), format="MSEED")
+
+def station_codes(itr):
+    codes = []
+    while True:
+        net, sta, quake, waveforms = itr.next()
+        if sta is None:
+            return codes
+        codes.append((sta.code, len(waveforms)))
+
+def test_skips_stations_without_files(tmp_path):
+    write_mdl_dir(tmp_path, ["AAA", "BBB", "CCC"], ["AAA", "CCC"])
+    itr = MDLSeismogramIterator(tmp_path, start_offset=0, end_offset=120)
+    assert sorted(station_codes(itr)) == [("AAA", 1), ("BBB", 0), ("CCC", 1)]
+    itr = MDLSeismogramIterator(tmp_path, start_offset=0, end_offset=120, check_availability=True)
+    assert sorted(station_codes(itr)) == [("AAA", 1), ("CCC", 1)]
+
+def test_skips_stations_without_files_in_window(tmp_path):
+    write_mdl_dir(tmp_path, ["AAA", "BBB"], ["AAA", "BBB"])
+    itr = MDLSeismogramIterator(tmp_path, start_offset=3600, end_offset=3900, check_availability=True)
+    assert station_codes(itr) == []
@@ -0,0 +1,99 @@
+from obspy import UTCDateTime
+from obspy.core.event import (
+    Amplitude, Arrival, CreationInfo, Event, Origin, Pick, ResourceIdentifier,
+    WaveformStreamID,
+    )
+
+from pickax.pick_util import IndexedCatalog, MergeResult, merge_picks_to_quake
+
+ORIGIN_TIME = UTCDateTime("2023-01-01T00:00:00")
+
+
+def make_pick(sta, offset, author="me", pick_id=None, channel="HHZ"):
+    pick = Pick(time=ORIGIN_TIME + offset,
+                waveform_id=WaveformStreamID("XX", sta, "00", channel),
+                creation_info=CreationInfo(author=author))
+    if pick_id is not None:
+        pick.resource_id = ResourceIdentifier(pick_id)
+    return pick
+
+def make_quake(picks=None, event_id="ev1"):
+    origin = Origin(time=ORIGIN_TIME, latitude=34, longitude=-80, depth=5000)
+    quake = Event(resource_id=ResourceIdentifier(event_id), origins=[origin])
+    quake.preferred_origin_id = origin.resource_id
+    for pick in picks or []:
+        quake.picks.append(pick)
+    return quake
+
+def test_merge_into_empty_adds_all():
+    src = make_quake([make_pick("AAA", 10), make_pick("BBB", 12)])
+    dest = make_quake()
+    result = merge_picks_to_quake(src, dest)
+    assert (result.added, result.skipped, result.conflicting) == (2, 0, 0)
+    assert len(dest.picks) == 2
+
+def test_merge_twice_skips():
+    src = make_quake([make_pick("AAA", 10), make_pick("BBB", 12)])
+    dest = make_quake()
+    merge_picks_to_quake(src, dest)
+    result = merge_picks_to_quake(src, dest)
+    assert (result.added, result.skipped, result.conflicting) == (0, 2, 0)
+    assert len(dest.picks) == 2
+
+def test_same_time_author_channel_skipped():
+    # different resource ids, but the same pick
+    dest = make_quake([make_pick("AAA", 10, pick_id="smi:local/a")])
+    src = make_quake([make_pick("AAA", 10, pick_id="smi:local/b")])
+    result = merge_picks_to_quake(src, dest)
+    assert (result.added, result.skipped, result.conflicting) == (0, 1, 0)
+
+def test_different_author_or_channel_added():
+    dest = make_quake([make_pick("AAA", 10)])
+    src = make_quake([make_pick("AAA", 10, author="other"),
+                      make_pick("AAA", 10, channel="HHN")])
+    result = merge_picks_to_quake(src, dest)
+    assert (result.added, result.skipped, result.conflicting) == (2, 0, 0)
+
+def test_same_id_different_pick_conflicts():
+    dest = make_quake([make_pick("AAA", 10, pick_id="smi:local/p1")])
+    src = make_quake([make_pick("AAA", 11, pick_id="smi:local/p1")])
+    result = merge_picks_to_quake(src, dest)
+    assert (result.added, result.skipped, result.conflicting) == (0, 0, 1)
+    assert dest.picks[0].time == ORIGIN_TIME + 10
+
+def test_author_filter():
+    src = make_quake([make_pick("AAA", 10), make_pick("BBB", 12, author="other")])
+    dest = make_quake()
+    result = merge_picks_to_quake(src, dest, author="other")
+    assert (result.added, result.skipped, result.conflicting) == (1, 0, 0)
+    assert dest.picks[0].waveform_id.station_code == "BBB"
+
+def test_arrivals_and_amplitudes_copied():
+    pick = make_pick("AAA", 10)
+    src = make_quake([pick])
+    src.origins[0].arrivals.append(Arrival(pick_id=pick.resource_id, phase="P"))
+    src.amplitudes.append(Amplitude(generic_amplitude=1.0, pick_id=pick.resource_id))
+    dest = make_quake()
+    merge_picks_to_quake(src, dest)
+    assert len(dest.origins[0].arrivals) == 1
+    assert len(dest.amplitudes) == 1
+
+def test_result_sum():
+    total = MergeResult()
+    total += MergeResult(added=2, skipped=1)
+    total += MergeResult(skipped=3, conflicting=1)
+    assert (total.added, total.skipped, total.conflicting) == (2, 4, 1)
+
+def test_indexed_catalog_merge_counts():
+    catalog = IndexedCatalog()
+    result = catalog.merge(make_quake([make_pick("AAA", 10)], event_id="ev1"))
+    assert (result.added, result.skipped, result.conflicting) == (1, 0, 0)
+    assert len(catalog) == 1
+    result = catalog.merge(make_quake([make_pick("AAA", 10), make_pick("BBB", 12)], event_id="ev1"))
+    assert (result.added, result.skipped, result.conflicting) == (1, 1, 0)
+    assert len(catalog) == 1
+    assert len(catalog.find("ev1").picks) == 2
+    catalog.merge(make_quake([make_pick("AAA", 10)], event_id="ev2"))
+    assert len(catalog) == 2
+    assert len(catalog.remove("ev1")) == 1
+    assert "ev1" not in catalog
@@ -0,0 +1,120 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime, read
+
+from pickax.mseed_index import MSeedDirectoryIndex, MSeedRecordIndex, unpack_record_times
+
+
+def write_mseed(path, starttime, npts=2000, sampling_rate=20.0, byteorder=">"):
+    tr = Trace(np.arange(npts, dtype=np.int32),
+               header=dict(network="XX", station="ABC", location="00", channel="HHZ",
+                           starttime=starttime, sampling_rate=sampling_rate))
+    Stream([tr]).write(str(path), format="MSEED", reclen=512, byteorder=byteorder)
+    return tr
+
+def record_times_from_obspy(data, reclen=512):
+    """
+    Start and end timestamps of each record, decoded one record at a time.
+    """
+    times = []
+    for offset in range(0, len(data), reclen):
+        rec = read(io.BytesIO(data[offset:offset+reclen]), format="MSEED")[0]
+        times.append((rec.stats.starttime.timestamp, rec.stats.endtime.timestamp))
+    return times
+
+@pytest.mark.parametrize("byteorder", [">", "<"])
+def test_unpack_record_times(tmp_path, byteorder):
+    path = tmp_path / "test.mseed"
+    start = UTCDateTime("2023-02-28T23:59:50.125")
+    write_mseed(path, start, byteorder=byteorder)
+    with open(path, "rb") as f:
+        data = f.read()
+    assert len(data) % 512 == 0
+    expected = record_times_from_obspy(data)
+    for rec_idx, offset in enumerate(range(0, len(data), 512)):
+        rec_start, rec_end, reclen = unpack_record_times(data, offset)
+        assert reclen == 512
+        assert rec_start == pytest.approx(expected[rec_idx][0], abs=1e-4)
+        assert rec_end == pytest.approx(expected[rec_idx][1], abs=1e-4)
+    assert unpack_record_times(data, 0)[0] == pytest.approx(start.timestamp, abs=1e-4)
+
+def test_unpack_record_times_low_sample_rate(tmp_path):
+    # rates under 1 Hz are stored with a negative rate factor
+    path = tmp_path / "lp.mseed"
+    start = UTCDateTime("2023-06-01T00:00:00")
+    tr = write_mseed(path, start, npts=50, sampling_rate=0.1)
+    with open(path, "rb") as f:
+        rec_start, rec_end, reclen = unpack_record_times(f.read(), 0)
+    assert rec_start == pytest.approx(start.timestamp)
+    assert rec_end == pytest.approx(tr.stats.endtime.timestamp)
+
+def test_unpack_record_times_not_mseed():
+    with pytest.raises(ValueError):
+        unpack_record_times(b"\0"*512, 0)
+
+def test_record_index_read_window(tmp_path):
+    path = tmp_path / "test.mseed"
+    start = UTCDateTime("2023-01-01T00:00:00")
+    tr = write_mseed(path, start, npts=20000, sampling_rate=20.0)
+    index = MSeedRecordIndex(path)
+    assert index.is_current()
+    assert index.records[0][0] == pytest.approx(start.timestamp)
+    assert index.records[-1][1] == pytest.approx(tr.stats.endtime.timestamp)
+    assert sum(r[3] for r in index.records) == path.stat().st_size
+
+    t1 = start + 300
+    t2 = start + 420
+    ranges = index.byte_ranges(t1, t2)
+    assert len(ranges) == 1
+    assert ranges[0][1] < path.stat().st_size
+    waveforms = index.read(t1, t2)
+    expected = read(str(path)).trim(starttime=t1, endtime=t2)
+    assert len(waveforms) == 1
+    assert waveforms[0].stats.starttime == expected[0].stats.starttime
+    assert waveforms[0].stats.endtime == expected[0].stats.endtime
+    np.testing.assert_array_equal(waveforms[0].data, expected[0].data)
+
+    assert index.byte_ranges(start - 600, start - 300) == []
+    assert len(index.read(start - 600, start - 300)) == 0
+
+def write_mdl_file(mseed_dir, sta, start, end):
+    name = f"XX.{sta}.00.HHZ__{start.strftime('%Y%m%dT%H%M%SZ')}__{end.strftime('%Y%m%dT%H%M%SZ')}.mseed"
+    write_mseed(mseed_dir / name, start, npts=100)
+    return mseed_dir / name
+
+def touch_dir(path, offset):
+    # directory mtime may not tick between quick changes
+    os.utime(path, ns=(0, (1_700_000_000 + offset)*1_000_000_000))
+
+def test_directory_index_files_for_window(tmp_path):
+    day = UTCDateTime("2023-01-01T00:00:00")
+    a1 = write_mdl_file(tmp_path, "AAA", day, day + 600)
+    a2 = write_mdl_file(tmp_path, "AAA", day + 3600, day + 4200)
+    b1 = write_mdl_file(tmp_path, "BBB", day, day + 600)
+    (tmp_path / "notes.txt").write_text("not miniseed")
+    index = MSeedDirectoryIndex(tmp_path)
+    assert len(index) == 3
+    assert sorted(index.files_for("XX", "AAA")) == [a1, a2]
+    assert index.files_for("XX", "AAA", day + 3000, day + 3700) == [a2]
+    assert index.files_for("XX", "CCC") == []
+    assert index.stations() == {("XX", "AAA"), ("XX", "BBB")}
+
+def test_directory_index_updates_and_saves(tmp_path):
+    mseed_dir = tmp_path / "waveforms"
+    mseed_dir.mkdir()
+    index_file = tmp_path / "index.json"
+    day = UTCDateTime("2023-01-01T00:00:00")
+    a1 = write_mdl_file(mseed_dir, "AAA", day, day + 600)
+    touch_dir(mseed_dir, 1)
+    index = MSeedDirectoryIndex(mseed_dir, index_file=index_file)
+    assert index.files_for("XX", "AAA") == [a1]
+    b1 = write_mdl_file(mseed_dir, "BBB", day, day + 600)
+    a1.unlink()
+    touch_dir(mseed_dir, 2)
+    assert index.files_for("XX", "AAA") == []
+    assert index.files_for("XX", "BBB") == [b1]
+    reopened = MSeedDirectoryIndex(mseed_dir, index_file=index_file)
+    assert reopened.stations() == {("XX", "BBB")}
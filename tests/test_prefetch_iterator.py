@@ -0,0 +1,115 @@
+import threading
+
+from obspy import Stream, Trace, UTCDateTime
+from obspy.core.inventory import Network, Station
+
+from pickax.seismogram_iterator import PrefetchSeismogramIterator, SeismogramIterator
+from pickax.station_iterator import StationIterator
+
+
+class ListStationIterator(StationIterator):
+    def __init__(self, stations):
+        self.__empty__ = None, None
+        self.stations = stations
+        self.idx = -1
+    def next(self):
+        self.idx = min(self.idx + 1, len(self.stations))
+        return self.stations[self.idx] if self.idx < len(self.stations) else self.__empty__
+    def prev(self):
+        self.idx = max(self.idx - 1, -1)
+        return self.stations[self.idx] if self.idx >= 0 else self.__empty__
+    def beginning(self):
+        self.idx = -1
+    def ending(self):
+        self.idx = len(self.stations)
+
+class PositionSeismogramIterator(SeismogramIterator):
+    """
+    Moves through quakes and stations without loading, and records each
+    load with the thread it ran in.
+    """
+    def __init__(self, num_quakes=2, num_sta=3):
+        self.__empty__ = None, None, None, []
+        net = Network("XX")
+        self.sta_itr = ListStationIterator([(net, Station(f"S{idx:02d}", 0, 0, 0, start_date=UTCDateTime("2020-01-01")))
+                                            for idx in range(num_sta)])
+        self.quakes = [f"quake{idx}" for idx in range(num_quakes)]
+        self.quake_idx = 0
+        self.loads = []
+        self.lock = threading.Lock()
+    def next_position(self):
+        net, sta = self.sta_itr.next()
+        if sta is None:
+            if self.quake_idx + 1 >= len(self.quakes):
+                return None, None, None
+            self.quake_idx += 1
+            self.sta_itr.beginning()
+            net, sta = self.sta_itr.next()
+        return net, sta, self.quakes[self.quake_idx]
+    def prev_position(self):
+        net, sta = self.sta_itr.prev()
+        if sta is None:
+            if self.quake_idx <= 0:
+                return None, None, None
+            self.quake_idx -= 1
+            self.sta_itr.ending()
+            net, sta = self.sta_itr.prev()
+        return net, sta, self.quakes[self.quake_idx]
+    def next(self):
+        net, sta, quake = self.next_position()
+        if sta is None:
+            return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def prev(self):
+        net, sta, quake = self.prev_position()
+        if sta is None:
+            return self.__empty__
+        return self.load_seismograms(net, sta, quake)
+    def load_seismograms(self, net, sta, quake):
+        with self.lock:
+            self.loads.append((quake, sta.code, threading.current_thread().name))
+        return net, sta, quake, Stream([Trace(header={"station": sta.code})])
+    def station_iterator(self):
+        return self.sta_itr
+
+def wait_for_pending(itr):
+    for future in list(itr.__pending__.values()):
+        future.result()
+
+def test_prefetch_loads_upcoming_stations_in_background():
+    sub_itr = PositionSeismogramIterator(num_sta=4)
+    itr = PrefetchSeismogramIterator(sub_itr, lookahead=2)
+    net, sta, quake, waveforms = itr.next()
+    assert sta.code == "S00"
+    wait_for_pending(itr)
+    assert sorted(code for q, code, thread in sub_itr.loads[1:]) == ["S01", "S02"]
+    assert all(thread.startswith("pickax-prefetch") for q, code, thread in sub_itr.loads[1:])
+    codes = [sta.code]
+    for idx in range(3):
+        net, sta, quake, waveforms = itr.next()
+        codes.append(waveforms[0].stats.station)
+        wait_for_pending(itr)
+    # each station loaded once, and in order
+    assert codes == ["S00", "S01", "S02", "S03"]
+    assert sorted(code for q, code, thread in sub_itr.loads) == codes
+    itr.close()
+
+def test_prefetch_stays_within_quake():
+    sub_itr = PositionSeismogramIterator(num_quakes=2, num_sta=2)
+    itr = PrefetchSeismogramIterator(sub_itr, lookahead=5)
+    itr.next()
+    wait_for_pending(itr)
+    assert {q for q, code, thread in sub_itr.loads} == {"quake0"}
+    itr.next()
+    net, sta, quake, waveforms = itr.next()
+    assert quake == "quake1" and sta.code == "S00"
+    itr.close()
+
+def test_prefetch_leaves_station_position():
+    sub_itr = PositionSeismogramIterator(num_quakes=1, num_sta=5)
+    itr = PrefetchSeismogramIterator(sub_itr, lookahead=3)
+    itr.next()
+    assert sub_itr.sta_itr.idx == 0
+    net, sta, quake, waveforms = itr.prev()
+    assert sta is None
+    itr.close()
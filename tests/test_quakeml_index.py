@@ -0,0 +1,142 @@
+import gc
+
+from obspy import UTCDateTime, read_events
+from obspy.core.event import Catalog, Event, Magnitude, Origin, Pick
+
+from pickax import quakeml_index
+from pickax.quake_iterator import QuakeMLDirectoryIterator
+from pickax.quakeml_index import LazyEventList, QuakeMLDirectoryIndex, QuakeMLFileIndex, scan_quakeml
+
+
+def make_event(idx):
+    origin = Origin(time=UTCDateTime("2023-01-01") + idx*3600,
+                    latitude=30 + idx, longitude=-80, depth=5000)
+    magnitude = Magnitude(mag=2.0 + idx, magnitude_type="ML")
+    event = Event(origins=[origin], magnitudes=[magnitude])
+    event.preferred_origin_id = origin.resource_id
+    event.preferred_magnitude_id = magnitude.resource_id
+    return event
+
+class CountingEventList(LazyEventList):
+    def __init__(self, num_events, cache_size=1):
+        super().__init__(cache_size)
+        self.num_events = num_events
+        self.reads = 0
+    def __len__(self):
+        return self.num_events
+    def read_event(self, idx):
+        self.reads += 1
+        return make_event(idx)
+
+def test_unmodified_events_are_not_kept():
+    events = CountingEventList(10)
+    for idx in range(10):
+        quake = events[idx]
+    del quake
+    gc.collect()
+    events[0]
+    assert list(events.kept_events().keys()) == [0]
+
+def test_modified_event_is_kept():
+    events = CountingEventList(10)
+    quake = events[2]
+    quake.picks.append(Pick(time=UTCDateTime("2023-01-01")))
+    events[3]
+    del quake
+    gc.collect()
+    for idx in range(10):
+        events[idx]
+    assert len(events[2].picks) == 1
+    assert 2 in events.kept_events()
+
+def test_set_and_mark_modified_events_are_kept():
+    events = CountingEventList(10)
+    events[4] = make_event(40)
+    quake = events[5]
+    quake.origins[0].latitude = 0
+    events.mark_modified(5)
+    del quake
+    gc.collect()
+    for idx in range(10):
+        events[idx]
+    assert events[4].origins[0].latitude == 70
+    assert events[5].origins[0].latitude == 0
+
+def test_held_event_is_not_parsed_again():
+    events = CountingEventList(10)
+    quake = events[1]
+    for idx in range(10):
+        events[idx]
+    reads = events.reads
+    assert events[1] is quake
+    assert events.reads == reads
+
+def test_scan_and_read_single_events(tmp_path):
+    path = tmp_path / "quakes.qml"
+    catalog = Catalog([make_event(idx) for idx in range(5)])
+    catalog.write(str(path), format="QUAKEML")
+    entries = scan_quakeml(path)
+    assert [e.public_id for e in entries] == [str(q.resource_id) for q in catalog]
+    assert [e.mag for e in entries] == [2.0, 3.0, 4.0, 5.0, 6.0]
+    index = QuakeMLFileIndex(path)
+    assert len(index) == 5
+    assert str(index[3].resource_id) == str(catalog[3].resource_id)
+    assert [s.time for s in index.summaries()] == [q.origins[0].time for q in read_events(str(path))]
+    assert index.is_current()
+
+def write_catalog(path, idx_list):
+    catalog = Catalog([make_event(idx) for idx in idx_list])
+    catalog.write(str(path), format="QUAKEML")
+    return catalog
+
+def count_scans(monkeypatch):
+    scanned = []
+    def counting_scan(path):
+        scanned.append(path.name)
+        return scan_quakeml(path)
+    monkeypatch.setattr(quakeml_index, "scan_quakeml", counting_scan)
+    return scanned
+
+def test_directory_sorted_by_time(tmp_path):
+    write_catalog(tmp_path / "a.qml", [2, 3])
+    write_catalog(tmp_path / "b.qml", [0, 1])
+    index = QuakeMLDirectoryIndex(tmp_path, sort_by_time=True)
+    assert [s.latitude for s in index.summaries()] == [30, 31, 32, 33]
+    assert index[2].origins[0].latitude == 32
+    assert index.file_for(0).name == "b.qml"
+    assert index.file_for_quake(index[3]).name == "a.qml"
+
+def test_directory_index_file_reused(tmp_path, monkeypatch):
+    write_catalog(tmp_path / "a.qml", [0, 1])
+    write_catalog(tmp_path / "b.qml", [2])
+    scanned = count_scans(monkeypatch)
+    QuakeMLDirectoryIndex(tmp_path)
+    assert sorted(scanned) == ["a.qml", "b.qml"]
+    assert (tmp_path / quakeml_index.QUAKEML_DIR_INDEX_FILENAME).exists()
+    scanned.clear()
+    index = QuakeMLDirectoryIndex(tmp_path)
+    assert scanned == []
+    assert len(index) == 3
+    scanned.clear()
+    QuakeMLDirectoryIndex(tmp_path, index_file=False)
+    assert sorted(scanned) == ["a.qml", "b.qml"]
+
+def test_directory_refresh(tmp_path, monkeypatch):
+    write_catalog(tmp_path / "a.qml", [0, 1])
+    itr = QuakeMLDirectoryIterator(tmp_path, sort_by_time=True)
+    quake = itr.next()
+    quake.picks.append(Pick(time=UTCDateTime("2023-01-01")))
+    scanned = count_scans(monkeypatch)
+    itr.refresh()
+    assert scanned == []
+    assert itr.prev() is None
+    write_catalog(tmp_path / "b.qml", [2])
+    itr.refresh()
+    assert scanned == ["b.qml"]
+    assert len(itr.all()) == 3
+    # the edited quake is still the one handed out
+    assert itr.next() is quake
+    (tmp_path / "b.qml").unlink()
+    itr.refresh()
+    assert len(itr.all()) == 2
+    assert len(itr.qmlfiles) == 1
@@ -0,0 +1,84 @@
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+from obspy.core.event import Catalog, Event, Origin, ResourceIdentifier
+from obspy.core.inventory import Channel, Inventory, Network, Station
+
+from pickax import seismogram_iterator
+from pickax.quake_iterator import QuakeMLFileIterator
+from pickax.seismogram_iterator import FDSNSeismogramIterator, ThreeAtATime
+from pickax.station_iterator import StationXMLIterator
+from pickax.pick_util import extractEventId
+
+
+def write_quakes(path, num_quakes=4):
+    events = []
+    for idx in range(num_quakes):
+        origin = Origin(time=UTCDateTime("2023-01-01") + idx*86400,
+                        latitude=34, longitude=-80, depth=5000)
+        event = Event(resource_id=ResourceIdentifier(f"ev{idx}"), origins=[origin])
+        event.preferred_origin_id = origin.resource_id
+        events.append(event)
+    Catalog(events).write(str(path), format="QUAKEML")
+    # ids as read back, the writer makes them valid QuakeML ids
+    return [extractEventId(q) for q in QuakeMLFileIterator(path).all()]
+
+def make_inventory(num_sta=5):
+    stations = []
+    for idx in range(num_sta):
+        channels = [Channel(code, "00", 34, -80, 0, 0) for code in ["HHZ", "HNZ"]]
+        stations.append(Station(f"S{idx:02d}", 34, -80, 0, channels=channels))
+    return Inventory(networks=[Network("XX", stations=stations)])
+
+class StubClient:
+    def __init__(self):
+        self.requests = []
+    def get_waveforms(self, net, sta, loc, chan, start, end):
+        self.requests.append(sta)
+        return Stream([Trace(header={"network": net, "station": sta, "location": "00",
+                                     "channel": code, "starttime": start})
+                       for code in sorted(chan.split(","))])
+
+@pytest.fixture
+def seis_itr(tmp_path, monkeypatch):
+    client = StubClient()
+    monkeypatch.setattr(seismogram_iterator, "get_client", lambda *args, **kwargs: client)
+    event_ids = write_quakes(tmp_path / "quakes.qml")
+    itr = FDSNSeismogramIterator(QuakeMLFileIterator(tmp_path / "quakes.qml"),
+                                 StationXMLIterator(make_inventory()), dc_name="STUB")
+    itr.client = client
+    itr.event_ids = event_ids
+    return itr
+
+def test_quake_iterator_seek(tmp_path):
+    event_ids = write_quakes(tmp_path / "quakes.qml")
+    quake_itr = QuakeMLFileIterator(tmp_path / "quakes.qml")
+    quake_itr.seek(2)
+    assert extractEventId(quake_itr.next()) == event_ids[2]
+    assert quake_itr.index_of(event_ids[3]) == 3
+    quake_itr.seek_to(event_ids[1])
+    assert extractEventId(quake_itr.next()) == event_ids[1]
+    with pytest.raises(IndexError):
+        quake_itr.seek(4)
+    with pytest.raises(ValueError):
+        quake_itr.seek_to("nope")
+
+def test_seek_moves_without_loading(seis_itr):
+    seis_itr.seek(2, 3)
+    net, sta, quake = seis_itr.next_position()
+    assert (sta.code, extractEventId(quake)) == ("S03", seis_itr.event_ids[2])
+    assert seis_itr.client.requests == []
+    seis_itr.seek_to(seis_itr.event_ids[3], "XX.S01")
+    net, sta, quake, waveforms = seis_itr.next()
+    assert (sta.code, extractEventId(quake)) == ("S01", seis_itr.event_ids[3])
+    assert seis_itr.client.requests == ["S01"]
+
+def test_three_at_a_time_seek(seis_itr):
+    itr = ThreeAtATime(seis_itr)
+    itr.next()
+    itr.seek(1, 2)
+    net, sta, quake, waveforms = itr.next()
+    assert (sta.code, extractEventId(quake)) == ("S02", seis_itr.event_ids[1])
+    assert [tr.stats.channel for tr in waveforms] == ["HHZ"]
+    net, sta, quake, waveforms = itr.next()
+    assert sta.code == "S02"
+    assert [tr.stats.channel for tr in waveforms] == ["HNZ"]
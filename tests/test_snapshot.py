@@ -0,0 +1,78 @@
+import os
+
+import pytest
+from obspy import UTCDateTime
+from obspy.core.event import Catalog, Event, Magnitude, Origin
+
+from pickax import snapshot
+from pickax.snapshot import configure_snapshots, read_events_snapshot
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    snap_dir = tmp_path / "snapshots"
+    configure_snapshots(True, snap_dir)
+    yield snap_dir
+    configure_snapshots(False)
+
+def write_catalog(path, num_events=3, mag=2.0):
+    events = []
+    for idx in range(num_events):
+        origin = Origin(time=UTCDateTime("2023-01-01") + idx*3600,
+                        latitude=34, longitude=-80, depth=5000)
+        magnitude = Magnitude(mag=mag + idx)
+        event = Event(origins=[origin], magnitudes=[magnitude])
+        event.preferred_origin_id = origin.resource_id
+        event.preferred_magnitude_id = magnitude.resource_id
+        events.append(event)
+    Catalog(events).write(str(path), format="QUAKEML")
+
+def snapshot_files(snap_dir):
+    return sorted(p for p in snap_dir.rglob("*") if p.is_file())
+
+def test_off_by_default(tmp_path):
+    path = tmp_path / "quakes.qml"
+    write_catalog(path)
+    assert len(read_events_snapshot(path)) == 3
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["quakes.qml"]
+
+def test_snapshot_reused(tmp_path, snapshot_dir, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    path = data_dir / "quakes.qml"
+    write_catalog(path)
+    read_events_snapshot(path)
+    assert [p.name for p in data_dir.iterdir()] == ["quakes.qml"]
+    assert len(snapshot_files(snapshot_dir)) == 1
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError("parsed again")
+    monkeypatch.setattr(snapshot, "read_events", no_parse)
+    catalog = read_events_snapshot(path)
+    assert len(catalog) == 3
+    # resource ids are bound again after loading
+    assert catalog[1].preferred_origin().time == UTCDateTime("2023-01-01T01:00:00")
+    assert catalog[1].preferred_magnitude().mag == 3.0
+
+def test_changed_file_parsed_again(tmp_path, snapshot_dir):
+    path = tmp_path / "quakes.qml"
+    write_catalog(path)
+    assert len(read_events_snapshot(path)) == 3
+    write_catalog(path, num_events=5)
+    os.utime(path, ns=(1, 1))
+    assert len(read_events_snapshot(path)) == 5
+    assert len(snapshot_files(snapshot_dir)) == 2
+
+@pytest.mark.skipif(os.name != "posix", reason="file modes")
+def test_shared_snapshot_ignored(tmp_path, snapshot_dir, monkeypatch):
+    path = tmp_path / "quakes.qml"
+    write_catalog(path)
+    read_events_snapshot(path)
+    snapshot_files(snapshot_dir)[0].chmod(0o666)
+    parses = []
+    def counting_read(*args, **kwargs):
+        parses.append(args)
+        return Catalog()
+    monkeypatch.setattr(snapshot, "read_events", counting_read)
+    read_events_snapshot(path)
+    assert len(parses) == 1
@@ -0,0 +1,136 @@
+import pytest
+from obspy import UTCDateTime
+from obspy.core.event import Event, Origin
+from obspy.core.inventory import Channel, Inventory, Network, Station
+
+from pickax.distaz import DistAz
+from pickax.station_iterator import (DistanceStationIterator, StationIterator,
+                                     StationXMLDirectoryIterator, StationXMLIterator)
+
+
+def make_inventory(num_nets=3, num_sta=4):
+    networks = []
+    for n in range(num_nets):
+        stations = []
+        for s in range(num_sta):
+            lat = 30 + n + 0.5*s
+            lon = -80 + s
+            channels = [Channel(code, "00", lat, lon, 0, 0, sample_rate=100,
+                                start_date=UTCDateTime("2020-01-01"))
+                        for code in ("HHZ", "HHN", "HHE")]
+            stations.append(Station(f"S{n}{s}", lat, lon, 0, channels=channels))
+        networks.append(Network(f"N{n}", stations=stations))
+    return Inventory(networks=networks, source="test")
+
+def write_station_dir(tmp_path, inv):
+    # one file per network
+    for net in inv.networks:
+        inv.select(network=net.code).write(str(tmp_path / f"{net.code}.xml"), format="STATIONXML")
+
+def codes(itr, step):
+    out = []
+    while True:
+        net, sta = step()
+        if sta is None:
+            return out
+        out.append(f"{net.code}.{sta.code}")
+
+def test_xml_iterator_seek_and_len():
+    itr = StationXMLIterator(make_inventory())
+    assert len(itr) == 12
+    itr.seek(5)
+    net, sta = itr.next()
+    assert f"{net.code}.{sta.code}" == "N1.S11"
+    assert itr.index_of("N2.S23") == 11
+    assert itr.index_of("XX.NOPE") is None
+
+def test_directory_iterator_walk(tmp_path):
+    write_station_dir(tmp_path, make_inventory())
+    itr = StationXMLDirectoryIterator(tmp_path)
+    assert len(itr) == 12
+    forward = codes(itr, itr.next)
+    assert len(forward) == 12
+    assert codes(itr, itr.prev) == forward[::-1]
+    itr.ending()
+    net, sta = itr.prev()
+    assert f"{net.code}.{sta.code}" == forward[-1]
+    assert itr.inv.networks[0].code == net.code
+
+def test_directory_iterator_seek(tmp_path):
+    write_station_dir(tmp_path, make_inventory())
+    itr = StationXMLDirectoryIterator(tmp_path)
+    forward = codes(itr, itr.next)
+    itr.seek(7)
+    net, sta = itr.next()
+    assert f"{net.code}.{sta.code}" == forward[7]
+    assert itr.index_of(forward[10]) == 10
+    itr.seek_to(forward[3])
+    net, sta = itr.next()
+    assert f"{net.code}.{sta.code}" == forward[3]
+
+def test_directory_iterator_same_objects(tmp_path):
+    write_station_dir(tmp_path, make_inventory())
+    itr = StationXMLDirectoryIterator(tmp_path)
+    all_net_sta = itr.all_net_sta()
+    assert itr.all_net_sta() == all_net_sta
+    for net, sta in all_net_sta:
+        next_net, next_sta = itr.next()
+        assert next_net is net
+        assert next_sta is sta
+
+def test_seek_is_optional_for_subclasses():
+    class NoSeekIterator(StationIterator):
+        def next(self):
+            return None, None
+        def prev(self):
+            return None, None
+    itr = NoSeekIterator()
+    with pytest.raises(NotImplementedError):
+        itr.seek(0)
+
+def make_quake(lat, lon):
+    origin = Origin(time=UTCDateTime("2023-01-01"), latitude=lat, longitude=lon, depth=5000)
+    quake = Event(origins=[origin])
+    quake.preferred_origin_id = origin.resource_id
+    return quake
+
+def expected_by_distance(inv, lat, lon, min_dist=None, max_dist=None):
+    found = []
+    for net in inv.networks:
+        for sta in net.stations:
+            dist = DistAz(sta.latitude, sta.longitude, lat, lon).getDelta()
+            if (min_dist is None or dist >= min_dist) and (max_dist is None or dist <= max_dist):
+                found.append((dist, f"{net.code}.{sta.code}"))
+    return [code for dist, code in sorted(found)]
+
+def test_distance_iterator_nearest_first():
+    inv = make_inventory()
+    itr = DistanceStationIterator(StationXMLIterator(inv))
+    # no quake yet, sub iterator order
+    assert codes(itr, itr.next) == codes(StationXMLIterator(inv), StationXMLIterator(inv).next)
+    itr.set_quake(make_quake(32, -78))
+    assert codes(itr, itr.next) == expected_by_distance(inv, 32, -78)
+    assert list(itr.distances) == sorted(itr.distances)
+
+def test_distance_iterator_range():
+    inv = make_inventory()
+    itr = DistanceStationIterator(StationXMLIterator(inv), min_dist=1, max_dist=3)
+    itr.set_quake(make_quake(31, -79))
+    expected = expected_by_distance(inv, 31, -79, min_dist=1, max_dist=3)
+    assert 0 < len(expected) < 12
+    assert codes(itr, itr.next) == expected
+    assert len(itr) == len(expected)
+    itr.ending()
+    assert codes(itr, itr.prev) == list(reversed(expected))
+    itr = DistanceStationIterator(StationXMLIterator(inv), min_dist=1)
+    itr.set_quake(make_quake(31, -79))
+    assert codes(itr, itr.next) == expected_by_distance(inv, 31, -79, min_dist=1)
+
+def test_distance_iterator_by_azimuth():
+    inv = make_inventory()
+    itr = DistanceStationIterator(StationXMLIterator(inv), order_by="azimuth")
+    itr.set_quake(make_quake(31, -79))
+    assert list(itr.azimuths) == sorted(itr.azimuths)
+    assert len(itr) == 12
+    with pytest.raises(ValueError):
+        DistanceStationIterator(StationXMLIterator(inv), order_by="name")
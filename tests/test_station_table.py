@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from obspy.core.event import Event, Origin
+from obspy.core.inventory import Channel, Network, Station
+
+from pickax.distaz import DistAz
+from pickax.station_table import StationTable
+
+
+def make_net_sta(num_sta=500, seed=42):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(-89, 89, num_sta)
+    lons = rng.uniform(-180, 180, num_sta)
+    net = Network("XX")
+    return [(net, Station(f"S{idx:03d}", lat, lon, 0)) for idx, (lat, lon) in enumerate(zip(lats, lons))]
+
+@pytest.mark.parametrize("lat,lon,max_dist,min_dist", [
+    (34, -80, 30, None),
+    (-60, 170, 45, 10),
+    (89, 0, 5, None),
+    (0, 179.9, 90, 60),
+    (10, 10, 180, None),
+])
+def test_spatial_index_matches_distaz(lat, lon, max_dist, min_dist):
+    net_sta = make_net_sta()
+    table = StationTable(net_sta)
+    found = table.spatial_index().within(lat, lon, max_dist, min_dist)
+    expected = [idx for idx, (net, sta) in enumerate(net_sta)
+                if DistAz(sta.latitude, sta.longitude, lat, lon).getDelta() <= max_dist
+                and (min_dist is None or DistAz(sta.latitude, sta.longitude, lat, lon).getDelta() >= min_dist)]
+    assert list(found) == expected
+
+def test_spatial_index_empty_table():
+    table = StationTable([])
+    assert len(table.spatial_index().within(0, 0, 10)) == 0
+
+def test_table_columns_and_codes():
+    net_sta = make_net_sta(num_sta=3)
+    yy = Network("YY")
+    net_sta.append((yy, Station("S001", 0, 0, 10, channels=[Channel("HHZ", "00", 0, 0, 10, 0)])))
+    table = StationTable(net_sta)
+    assert len(table) == 4
+    assert table.net_codes == ["XX", "YY"]
+    assert table.net_sta_code(3) == "YY.S001"
+    assert table.index_of("XX.S001") == 1
+    assert table.index_of("YY.S001") == 3
+    assert table.index_of("ZZ.S001") is None
+    assert list(table.channel_count) == [0, 0, 0, 1]
+    assert table.latitude[1] == net_sta[1][1].latitude
+
+def test_distaz_matches_distaz():
+    net_sta = make_net_sta(num_sta=50)
+    table = StationTable(net_sta)
+    delta, az, baz = table.distaz(34, -80)
+    for idx, (net, sta) in enumerate(net_sta):
+        da = DistAz(sta.latitude, sta.longitude, 34, -80)
+        assert delta[idx] == pytest.approx(da.getDelta(), abs=1e-6)
+        assert az[idx] == pytest.approx(da.getAz(), abs=1e-6)
+        assert baz[idx] == pytest.approx(da.getBaz(), abs=1e-6)
+
+def test_distaz_to_quake():
+    table = StationTable(make_net_sta(num_sta=5))
+    assert table.distaz_to_quake(Event()) is None
+    origin = Origin(latitude=34, longitude=-80)
+    quake = Event(origins=[origin])
+    quake.preferred_origin_id = origin.resource_id
+    delta, az, baz = table.distaz_to_quake(quake)
+    assert list(delta) == list(table.distaz(34, -80)[0])